@@ -10,8 +10,10 @@ st.set_page_config(page_title="LangChain-Laboratory", page_icon="🔬", layout="
 
 from config import Config
 from data.ai_api import Query
-from data.chroma_db import list_collections
+from data.chroma_db import chroma_collection_names
+from data.numpy_db import numpy_list_collections
 from data.weaviate_db import weaviate_get_classes, weaviate_get_schema
+from session import session_state  # noqa: F401 - kept importable from Home
 
 # Load config settings
 configs = Config()
@@ -19,36 +21,32 @@ configs = Config()
 # Set Logging
 logger = configs.logger
 
-# Instantiate
-query_session = Query()
+# Instantiate. The conversation memory is per session and survives reruns.
+if "conversation_memory" not in st.session_state:
+    st.session_state["conversation_memory"] = Query().new_memory()
+query_session = Query(memory=st.session_state["conversation_memory"])
 
 # Set the directory for custom prompts
 custom_prompt_directory = configs.custom_prompt_directory
 
 
-def session_state(key: any, value: any) -> None:
-    """
-    session_state Create and update the Streamlit Session State
-
-    Args:
-        key (any): Required. Dictionary Key
-        value (any): Required. Dictionary Value
-    """
-    if key not in st.session_state:
-        st.session_state[key] = value
-        logger.debug("Session State: %s added.", key)
-    elif key in st.session_state:
-        st.session_state[key] = value
-        logger.debug("Session State: %s updated", key)
-
-
 def doc_loader_select(vectordb_docload):
     if vectordb_docload == "ChromaDB":
-        collection = [coll.name for coll in list_collections()]
-        return collection
+        return chroma_collection_names()
     elif vectordb_docload == "Weaviate":
         collection = [cn for cn in weaviate_get_classes()]
         return collection
+    elif vectordb_docload == "NumPy":
+        return numpy_list_collections()
+
+
+def fanout_source(source):
+    # "Store/collection" labels to (vectordb_choice, collection_name, text_key). Weaviate uses the first text property of the class.
+    vectordb_choice, collection_name = source.split("/", 1)
+    if vectordb_choice == "Weaviate":
+        properties = weaviate_get_schema(collection_name)["properties"]
+        return vectordb_choice, collection_name, next((prop["name"] for prop in properties if "text" in prop["dataType"]), "text")
+    return vectordb_choice, collection_name, None
 
 
 st.title("LangChain Laboratory 🧪")
@@ -66,8 +64,9 @@ with main_tab:
                                         4096 tokens, but their is more cost associated with them."""), key="selectModel")
         if "vectordb_choice" not in st.session_state:
             st.session_state['vectordb_choice'] = "ChromaDB"
-        radio_default = 1 if st.session_state["vectordb_choice"] == "Weaviate" else 0
-        vectordb_choice = st.radio("Choose the vector store", ("ChromaDB", "Weaviate",), index=radio_default, key="vectordb_choice", horizontal=True)
+        vectordb_options = ("ChromaDB", "Weaviate", "NumPy",)
+        radio_default = vectordb_options.index(st.session_state["vectordb_choice"])
+        vectordb_choice = st.radio("Choose the vector store", vectordb_options, index=radio_default, key="vectordb_choice", horizontal=True)
         collection_name = st.selectbox("Choose a Collection", options=doc_loader_select(st.session_state["vectordb_choice"]),
                                        help=dedent("""\
                                                    Choose the Chroma Vector Store collection that will
@@ -76,10 +75,9 @@ with main_tab:
                                                    This is part of the LangChain Chroma Class. See
                                                    https://python.langchain.com/docs/integrations/vectorstores/chroma
                                                    for more information"""), key="queryVDB")
-        if "Weaviate" in st.session_state["vectordb_choice"]:
-            total_properties = len(weaviate_get_schema(collection_name)["properties"])
+        if "Weaviate" in st.session_state["vectordb_choice"] and collection_name:
             text_key = st.selectbox("Choose Class Property Name",
-                                    options=[weaviate_get_schema(collection_name)["properties"][prop]["name"] for prop in range(total_properties)],
+                                    options=[prop["name"] for prop in weaviate_get_schema(collection_name)["properties"]],
                                     help="Class Property Name, also known as, text_tag",
                                     key="queryWvClProp", disabled="Weaviate" not in st.session_state["vectordb_choice"])
         else:
@@ -90,10 +88,12 @@ with main_tab:
                                                                 options=[doc for doc in os.listdir(custom_prompt_directory.as_posix()) if doc[-5:] == ".yaml"],
                                                                 disabled=st.session_state['homePromptSelectBox'] != "CUSTOM PROMPT",
                                                                 key="homeCustomPromptFilenameSelectBox")
-        search_name = st.radio("Search Type", ("Similarity", "MMR", "Similarity and Display Score", "Similarity with Score Threshold", "Filter"),
+        search_name = st.radio("Search Type", ("Similarity", "MMR", "Similarity and Display Score", "Similarity with Score Threshold", "Hybrid",
+                                               "Filter"),
                                index=0, key="querySearchType", horizontal=True, help=dedent("""\
                                 - Activate an MMR document search. Increases Document Diversity
-                                - Set Relvance Score"""))
+                                - Set Relvance Score
+                                - Hybrid adds keyword (BM25) matches, for exact terms and identifiers"""))
         k_value = st.select_slider("Select K-value for Doc Query", options=[k_val for k_val in range(1, 8)], value=4, format_func=int,
                                    help=dedent("""\
                                                Choose the K Value (1 through 8. Default: 4.)
@@ -109,6 +109,20 @@ with main_tab:
             if "score_threshold" in kwargs.keys():
                 kwargs["score_threshold"] = float(kwargs["score_threshold"])
 
+    with st.expander("Multi-Collection Search"):
+        fanout_sources, fusion = [], "rrf"
+        # Listing every store's collections reaches every server, so it only happens once this is enabled
+        if st.checkbox("Search several collections", key="homeFanoutEnabled"):
+            fanout_sources = st.multiselect("Search these collections together",
+                                            options=[f"{store}/{coll}" for store in vectordb_options for coll in doc_loader_select(store) or []],
+                                            key="homeFanoutSources",
+                                            help=dedent("""\
+                                                        Query several collections, in either vector store, at the same time.
+                                                        Results are merged into a single top-k. Replaces the collection
+                                                        and search type chosen above while any are selected."""))
+            fusion = st.radio("Result Fusion", ("rrf", "score"), index=0, key="homeFanoutFusion", horizontal=True,
+                              format_func=lambda name: {"rrf": "Reciprocal Rank", "score": "Normalized Score"}[name])
+
     # Query Settings
     st.header("Query Document 🙋‍♂️")
     chain_type = st.radio("Choose QA Chain", options=("stuff", "map_reduce", "refine", "map_rerank"), index=0, key="homeChainTypeRadio", horizontal=True,
@@ -127,17 +141,43 @@ with main_tab:
     response_box = st.empty()
     with response_box.container():
         if st.button("Submit"):
+            on_partial = None
+            if chain_type in ("map_reduce", "map_rerank"):
+                # Per-document answers are shown as they arrive, before the final answer is combined
+                partial_box = st.expander("Per-document answers", expanded=True)
+
+                def on_partial(index, partial):
+                    partial_box.markdown(f"**Doc {index + 1}:** {partial}")
+            # Sources are listed once retrieval finishes and the answer is written token by token, instead of waiting for the whole chain
+            sources_box = st.expander("Sources", expanded=False)
+            answer_box = st.empty()
+            tokens = []
+
+            def on_sources(docs_and_scores):
+                for docnum, (doc, score) in enumerate(docs_and_scores):
+                    score_info = "" if score is None else f" | Score: {score:.4f}"
+                    sources_box.write(f"Doc {docnum + 1}: {doc.metadata.get('source', 'Null')} - Page: {doc.metadata.get('page', 'Null')}{score_info}")
+
+            def on_token(token):
+                tokens.append(token)
+                answer_box.markdown("".join(tokens) + "▌")
+
             with st.spinner("Processing..."):
-                output = query_session.get_query(model, query, vectordb_choice, collection_name, text_key, prompt, chain_type, search_name, k_value, **kwargs)
-            if search_name == "Similarity and Display Score":
-                st.markdown(output[0])
+                if fanout_sources:
+                    output = query_session.get_fanout_query(model, query, [fanout_source(source) for source in fanout_sources],
+                                                            prompt, chain_type, k_value, fusion, on_partial, on_token, on_sources)
+                else:
+                    output = query_session.get_query(model, query, vectordb_choice, collection_name, text_key, prompt, chain_type, search_name, k_value,
+                                                     on_partial, on_token, on_sources, **kwargs)
+            if search_name == "Similarity and Display Score" and not fanout_sources:
+                answer_box.markdown(output[0])
             else:
-                st.markdown(output["result"])
+                answer_box.markdown(output["result"])
 
 with docsearch_output:
     st.header("Docs retrieved from the Vector Store Database")
     try:
-        if search_name == "Similarity and Display Score":
+        if search_name == "Similarity and Display Score" and not fanout_sources:
             for docnum, line in enumerate(output[1]):
                 st.write(f"Doc Number: {docnum + 1}")
                 st.code(f"Page Content:\n{line[0].page_content}")
@@ -145,10 +185,7 @@ with docsearch_output:
                 st.code(f"Score: {line[1]}")
         else:
             for docnum, line in enumerate(output["source_documents"]):
-                if line.metadata:
-                    source_info = line.metadata["page"]
-                else:
-                    source_info = "Null"
+                source_info = line.metadata.get("page", "Null")
                 st.write(f"Doc Number: {docnum + 1} - Source Page: {source_info}")
                 st.code(f"Page Content:\n{line.page_content}")
                 st.code(f"Metadata:\n{line.metadata}")
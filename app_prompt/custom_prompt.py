@@ -16,9 +16,8 @@ custom_prompt_directory = configs.custom_prompt_directory
 def load_custom_prompt(file_name):
     try:
         if Path(file_name).suffix == ".yaml":
-            print(custom_prompt_directory.joinpath(file_name).as_posix())
+            logger.debug("Loading custom prompt %s", custom_prompt_directory.joinpath(file_name).as_posix())
             system_prompt = load_prompt(custom_prompt_directory.joinpath(file_name).as_posix())
-            print(system_prompt)
             return system_prompt
         else:
             raise ValueError(f"Expected file with 'yaml' suffix. Got {Path(file_name).suffix}")
@@ -0,0 +1,86 @@
+import threading
+from pathlib import Path
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from app_prompt.custom_prompt import custom_prompt_directory, get_custom_prompt
+from config import Config
+
+configs = Config()
+
+logger = configs.logger
+
+
+class _PromptFileHandler(FileSystemEventHandler):
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def on_any_event(self, event):
+        for path in (getattr(event, "src_path", None), getattr(event, "dest_path", None)):
+            if path and Path(path).suffix == ".yaml":
+                self.registry.invalidate(Path(path).name)
+
+
+class PromptRegistry:
+    """
+     PromptRegistry keeps compiled custom prompt templates keyed by file name and modification time.
+
+     A watchdog observer on the custom prompt directory drops a template as soon as its file
+     changes and notifies subscribers (such as the QA chain cache) so they can drop what they
+     built from it.
+    """
+
+    def __init__(self, directory: Path = custom_prompt_directory):
+        self.directory = Path(directory)
+        self._prompts = {}
+        self._listeners = []
+        self._observer = None
+        self._lock = threading.Lock()
+
+    def mtime(self, file_name: str) -> float:
+        try:
+            return self.directory.joinpath(file_name).stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def get(self, file_name: str):
+        self._watch()
+        mtime = self.mtime(file_name)
+        with self._lock:
+            cached = self._prompts.get(file_name)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        prompt = get_custom_prompt(file_name)
+        with self._lock:
+            self._prompts[file_name] = (mtime, prompt)
+        logger.debug("Compiled custom prompt %s", file_name)
+        return prompt
+
+    def subscribe(self, callback) -> None:
+        self._listeners.append(callback)
+
+    def invalidate(self, file_name: str = None) -> None:
+        with self._lock:
+            if file_name is None:
+                self._prompts.clear()
+            else:
+                self._prompts.pop(file_name, None)
+        logger.debug("Custom prompt %s changed", file_name or "directory")
+        for callback in self._listeners:
+            callback(file_name)
+
+    def _watch(self) -> None:
+        if self._observer is not None or not self.directory.exists():
+            return
+        with self._lock:
+            if self._observer is None:
+                observer = Observer()
+                observer.daemon = True
+                observer.schedule(_PromptFileHandler(self), self.directory.as_posix(), recursive=False)
+                observer.start()
+                self._observer = observer
+
+
+prompt_registry = PromptRegistry()
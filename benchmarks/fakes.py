@@ -0,0 +1,100 @@
+import asyncio
+import hashlib
+import random
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+from langchain.chat_models.base import BaseChatModel
+from langchain.embeddings.base import Embeddings
+from langchain.schema import AIMessage, ChatGeneration, ChatResult
+
+from data.packing import count_tokens
+
+# Vocabulary for the synthetic corpus, with identifiers and Japanese so keyword search has something to find
+WORDS = ("vector store query chunk document retrieval latency index embedding collection answer model prompt token "
+         "cache batch cursor schema class property filter score rank fusion memory chain stream session server client "
+         "config timeout retry commit branch rebase merge grammar particle verb adjective sentence").split()
+IDENTIFIERS = ["ERR_CONN-42", "git.rebase", "HTTP-503", "E_TIMEOUT", "食べている", "行きます"]
+
+
+class HashEmbeddings(Embeddings):
+    """
+     HashEmbeddings turns each word into a fixed random direction and sums them. Deterministic, needs no model
+     and texts that share words are close, which is enough to exercise the stores.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _vector(self, text: str) -> list[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector += np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._vector(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+     FakeChatModel answers with a digest of the prompt after a fixed delay, standing in for a chat model API.
+
+     The answer ends with a "Score:" line so map_rerank chains can parse it.
+    """
+
+    model_name: str = "gpt-3.5-turbo"
+    temperature: float = 0
+    latency: float = 0.2
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _answer(self, messages) -> ChatResult:
+        digest = hashlib.sha256("\n".join(message.content for message in messages).encode("utf-8")).hexdigest()
+        content = f"Benchmark answer {digest[:16]}.\nScore: {int(digest[:8], 16) % 100}"
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _generate(self, messages, stop: Optional[list[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._answer(messages)
+
+    async def _agenerate(self, messages, stop: Optional[list[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._answer(messages)
+
+    def get_num_tokens(self, text: str) -> int:
+        return count_tokens(text)
+
+
+def write_corpus(directory: Path, files: int, paragraphs: int, seed: int = 0) -> list[str]:
+    """
+    write_corpus Write `files` text files of `paragraphs` random paragraphs each and return their names.
+    """
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    names = []
+    for number in range(files):
+        paragraphs_text = []
+        for _ in range(paragraphs):
+            words = rng.choices(WORDS, k=rng.randint(60, 160))
+            words.insert(rng.randrange(len(words)), rng.choice(IDENTIFIERS))
+            paragraphs_text.append(" ".join(words).capitalize() + ".")
+        name = f"synthetic_{number:04d}.txt"
+        directory.joinpath(name).write_text("\n\n".join(paragraphs_text), encoding="utf-8")
+        names.append(name)
+    return names
+
+
+def make_queries(count: int, seed: int = 1) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(3, 8)) + ([rng.choice(IDENTIFIERS)] if rng.random() < 0.3 else [])) + "?"
+            for _ in range(count)]
@@ -0,0 +1,230 @@
+#! /usr/bin/env python3
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from textwrap import dedent
+
+import numpy as np
+
+SEARCH_TYPES = ["similarity", "mmr", "similarity_score_threshold", "hybrid", "Score"]
+COLLECTION = "benchmark"
+
+
+def percentiles(samples: list[float]) -> dict:
+    # Latencies in milliseconds
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    return {"count": len(values), "mean_ms": float(values.mean()), "p50_ms": float(np.percentile(values, 50)),
+            "p95_ms": float(np.percentile(values, 95)), "p99_ms": float(np.percentile(values, 99)), "max_ms": float(values.max())}
+
+
+def _isolate(workdir: Path) -> None:
+    # Every cache, manifest and local store goes to workdir, so runs never touch the real ones and always start cold
+    os.environ["CACHE_DIRECTORY"] = workdir.joinpath("cache").as_posix()
+    os.environ["NUMPY_STORE_DIRECTORY"] = workdir.joinpath("numpy_store").as_posix()
+    os.environ["DOC_DIRECTORY"] = workdir.joinpath("docs").as_posix()
+    os.environ["LLM_SEMANTIC_CACHE"] = "false"
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args) -> dict:
+    """
+    run_benchmarks Run every stage against a synthetic corpus and return the results as a dict.
+    """
+    workdir = Path(tempfile.mkdtemp(prefix="langchain-lab-bench-"))
+    _isolate(workdir)
+    # Imported after _isolate, since modules read their config at import
+    import langchain
+    from benchmarks.fakes import FakeChatModel, HashEmbeddings, make_queries, write_corpus
+    from data import registry
+    from data.ai_api import Query, retrieval_cache
+    from data.embeddings import CachedEmbeddings
+    from document_handling import DocumentHandling
+
+    langchain.debug = False
+    if not args.llm_cache:
+        langchain.llm_cache = None
+
+    class BenchmarkQuery(Query):
+        def get_llm(self, model):
+            return FakeChatModel(model_name=model, latency=args.llm_latency)
+
+    if args.real_embeddings:
+        embedding_function = registry.get_embedding_function()
+    else:
+        embedding_function = registry.get_or_create("embedding_function", lambda: CachedEmbeddings(HashEmbeddings(), "benchmark-hash"))
+    if "ChromaDB" in args.stores and not args.chroma_server:
+        import chromadb
+        registry.get_or_create("chroma_client", chromadb.EphemeralClient)
+
+    results = {"meta": {"commit": _commit(), "timestamp": datetime.now(timezone.utc).isoformat(), "python": platform.python_version(),
+                        "platform": platform.platform(), "args": vars(args)}}
+    try:
+        doc_directory = Path(os.environ["DOC_DIRECTORY"])
+        names = write_corpus(doc_directory, args.files, args.paragraphs, seed=args.seed)
+        corpus_bytes = sum(doc_directory.joinpath(name).stat().st_size for name in names)
+
+        # Load and split
+        handler = DocumentHandling(directory=doc_directory)
+        start = time.perf_counter()
+        chunks = {name: handler.get_loader(name) for name in names}
+        seconds = time.perf_counter() - start
+        total_chunks = sum(len(docs) for docs in chunks.values())
+        results["load_split"] = {"files": len(names), "chunks": total_chunks, "seconds": seconds,
+                                 "chunks_per_sec": total_chunks / seconds, "mb_per_sec": corpus_bytes / 1e6 / seconds}
+
+        # Embedding, first into an empty cache and then served from it
+        texts = [doc.page_content for docs in chunks.values() for doc in docs]
+        results["embedding"] = {}
+        for phase in ("uncached", "cached"):
+            start = time.perf_counter()
+            embedding_function.embed_documents(texts)
+            seconds = time.perf_counter() - start
+            results["embedding"][phase] = {"chunks": len(texts), "seconds": seconds, "chunks_per_sec": len(texts) / seconds}
+
+        # Upsert, with embeddings already cached so the store write dominates
+        results["upsert"] = {}
+        for store in args.stores:
+            write = _writer(store)
+            start = time.perf_counter()
+            for name, docs in chunks.items():
+                write(name, docs, doc_directory.joinpath(name).as_posix())
+            seconds = time.perf_counter() - start
+            results["upsert"][store] = {"chunks": total_chunks, "seconds": seconds, "chunks_per_sec": total_chunks / seconds}
+
+        # Retrieval per search type, with the retrieval cache cleared before every search
+        queries = make_queries(args.queries, seed=args.seed + 1)
+        query_session = BenchmarkQuery()
+        results["retrieval"] = {}
+        for store in args.stores:
+            results["retrieval"][store] = {}
+            for search_type in SEARCH_TYPES:
+                search_kwargs = {"k": args.k, "score_threshold": 0.0} if search_type == "similarity_score_threshold" else {"k": args.k}
+                latencies = []
+                for query in queries:
+                    retrieval_cache.invalidate()
+                    start = time.perf_counter()
+                    asyncio.run(query_session.aretrieve(store, COLLECTION, "text", query, search_type, search_kwargs))
+                    latencies.append(time.perf_counter() - start)
+                results["retrieval"][store][search_type] = percentiles(latencies)
+
+        # End to end under concurrent users, each a thread like a Streamlit session
+        results["end_to_end"] = {}
+        for store in args.stores:
+            query_session.clear_memory()
+            retrieval_cache.invalidate()
+
+            def user(number):
+                latencies = []
+                for query in queries[number::args.users] or queries[:1]:
+                    start = time.perf_counter()
+                    query_session.get_query(args.model, query, store, COLLECTION, "text", "LG_PROMPT - Gen Use", args.chain_type, "Similarity", args.k)
+                    latencies.append(time.perf_counter() - start)
+                return latencies
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.users) as pool:
+                latencies = [latency for user_latencies in pool.map(user, range(args.users)) for latency in user_latencies]
+            seconds = time.perf_counter() - start
+            results["end_to_end"][store] = dict(percentiles(latencies), users=args.users, chain_type=args.chain_type,
+                                                queries_per_sec=len(latencies) / seconds)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def _writer(store: str):
+    if store == "ChromaDB":
+        from data.chroma_db import chroma_add_documents
+        return lambda name, docs, file_path: chroma_add_documents(name, COLLECTION, lambda: docs, file_path)
+    if store == "NumPy":
+        from data.numpy_db import numpy_add_documents
+        return lambda name, docs, file_path: numpy_add_documents(name, COLLECTION, lambda: docs, file_path)
+    from data.weaviate_db import weaviate_add_documents, weaviate_ensure_class
+    weaviate_ensure_class(COLLECTION)
+    return lambda name, docs, file_path: weaviate_add_documents(name, COLLECTION, "text", lambda: docs, file_path)
+
+
+def _flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(baseline: dict, current: dict) -> list[str]:
+    """
+    compare Lines with the relative change of every timing and throughput metric found in both runs.
+    """
+    old, new = _flatten({k: v for k, v in baseline.items() if k != "meta"}), _flatten({k: v for k, v in current.items() if k != "meta"})
+    lines = []
+    for key in sorted(old.keys() & new.keys()):
+        if key.endswith(("_ms", "_per_sec", "seconds")) and old[key]:
+            lines.append(f"{key:<70} {old[key]:>12.2f} -> {new[key]:>12.2f} ({(new[key] - old[key]) / old[key]:+.1%})")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="run.py",
+                                     formatter_class=argparse.RawTextHelpFormatter,
+                                     description="run.py - Ingestion and query latency benchmarks on a synthetic corpus",
+                                     epilog=dedent("""\
+                                            Examples:
+
+                                            `python -m benchmarks.run`
+                                            `python -m benchmarks.run -f 200 -u 16 -s NumPy ChromaDB -o after.json --compare before.json`
+
+                                            Please note:
+                                            - The LLM is a deterministic fake with a fixed delay (--llm-latency), so no API key is needed.
+                                            - ChromaDB runs in-process unless --chroma-server is given. Weaviate needs a running server.
+                                            - Caches and stores are created in a temporary directory, every run starts cold.
+                                            """))
+    parser.add_argument("-f", "--files", type=int, default=50, help="Synthetic files in the corpus. Default is 50.")
+    parser.add_argument("-p", "--paragraphs", type=int, default=20, help="Paragraphs per file. Default is 20.")
+    parser.add_argument("-q", "--queries", type=int, default=50, help="Distinct queries. Default is 50.")
+    parser.add_argument("-u", "--users", type=int, default=8, help="Concurrent simulated users for the end-to-end stage. Default is 8.")
+    parser.add_argument("-k", type=int, default=4, help="Documents retrieved per query. Default is 4.")
+    parser.add_argument("-s", "--stores", nargs="+", choices=["NumPy", "ChromaDB", "Weaviate"], default=["NumPy", "ChromaDB"],
+                        help="Vector stores to benchmark. Default is NumPy and ChromaDB.")
+    parser.add_argument("-c", "--chain-type", type=str, choices=["stuff", "map_reduce", "refine", "map_rerank"], default="stuff",
+                        help="QA chain for the end-to-end stage. Default is stuff.")
+    parser.add_argument("-m", "--model", type=str, default="gpt-3.5-turbo", help="Model name given to the fake LLM, sets the context window.")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per fake LLM call. Default is 0.2.")
+    parser.add_argument("--llm-cache", action="store_true", help="Keep the SQLite LLM cache on.")
+    parser.add_argument("--real-embeddings", action="store_true", help="Use EMBEDDING_MODEL instead of the hash embeddings.")
+    parser.add_argument("--chroma-server", action="store_true", help="Use the Chroma server at CHROMA_DB_URL instead of an in-process client.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the corpus and queries. Default is 0.")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary directory with the corpus and stores.")
+    parser.add_argument("-o", "--output", type=str, default=None, help="JSON results file. Default is benchmarks/results/<commit>-<time>.json.")
+    parser.add_argument("--compare", type=str, default=None, help="Earlier JSON results to compare against.")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    output = Path(args.output or f"benchmarks/results/{results['meta']['commit'] or 'nogit'}-{int(time.time())}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(json.dumps({key: value for key, value in results.items() if key != "meta"}, indent=2))
+    print(f"Results written to {output}")
+    if args.compare:
+        print("\n".join(compare(json.loads(Path(args.compare).read_text()), results)))
+    sys.exit(0)
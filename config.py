@@ -33,7 +33,45 @@ class Config:
         self.TOKENIZERS_PARALLELISM = os.environ.get("TOKENIZERS_PARALLELISM")
         self.WEAVIATE_URL = os.environ.get("WEAVIATE_URL")
         self.CHROMA_DB_URL = os.environ.get("CHROMA_DB_URL")
+        self.CHROMA_DB_REPLICA_URL = os.environ.get("CHROMA_DB_REPLICA_URL")
+        self.WEAVIATE_REPLICA_URL = os.environ.get("WEAVIATE_REPLICA_URL")
+        self.STORE_POOL_SIZE = int(os.environ.get("STORE_POOL_SIZE", 20))
+        self.STORE_CONNECT_TIMEOUT = float(os.environ.get("STORE_CONNECT_TIMEOUT", 5))
+        self.STORE_READ_TIMEOUT = float(os.environ.get("STORE_READ_TIMEOUT", 60))
+        self.STORE_RETRIES = int(os.environ.get("STORE_RETRIES", 3))
+        self.STORE_RETRY_BACKOFF = float(os.environ.get("STORE_RETRY_BACKOFF", 0.5))
+        self.STORE_HEARTBEAT_INTERVAL = float(os.environ.get("STORE_HEARTBEAT_INTERVAL", 30))
+        self.FANOUT_TIMEOUT = float(os.environ.get("FANOUT_TIMEOUT", 10))
+        self.HYBRID_FETCH_K = int(os.environ.get("HYBRID_FETCH_K", 20))
         self.SERPAPI_KEY = os.environ.get("SERPAPI_KEY")
+        self.EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+        self.CACHE_DIRECTORY = Path(os.environ.get("CACHE_DIRECTORY", "./.cache"))
+        self.NUMPY_STORE_DIRECTORY = Path(os.environ.get("NUMPY_STORE_DIRECTORY", "./numpy_store"))
+        self.EMBEDDING_CACHE_MAX_MB = int(os.environ.get("EMBEDDING_CACHE_MAX_MB", 512))
+        self.EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 64))
+        self.EMBEDDING_WORKERS = int(os.environ.get("EMBEDDING_WORKERS", os.cpu_count() or 1))
+        self.INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 256))
+        self.WEAVIATE_BATCH_WORKERS = int(os.environ.get("WEAVIATE_BATCH_WORKERS", 4))
+        self.WEAVIATE_BATCH_TARGET_SECONDS = float(os.environ.get("WEAVIATE_BATCH_TARGET_SECONDS", 1.0))
+        self.WEAVIATE_BATCH_RETRIES = int(os.environ.get("WEAVIATE_BATCH_RETRIES", 3))
+        self.RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", 256))
+        self.RETRIEVAL_CACHE_TTL = float(os.environ.get("RETRIEVAL_CACHE_TTL", 300))
+        self.METADATA_CACHE_TTL = float(os.environ.get("METADATA_CACHE_TTL", 30))
+        self.ANSWER_TOKEN_RESERVE = int(os.environ.get("ANSWER_TOKEN_RESERVE", 512))
+        self.MEMORY_TOKEN_LIMIT = int(os.environ.get("MEMORY_TOKEN_LIMIT", 1000))
+        self.MEMORY_SUMMARY_MODEL = os.environ.get("MEMORY_SUMMARY_MODEL", "gpt-3.5-turbo")
+        self.DEDUP_SIMILARITY = float(os.environ.get("DEDUP_SIMILARITY", 0.9))
+        self.MAP_CONCURRENCY = int(os.environ.get("MAP_CONCURRENCY", 4))
+        self.MAP_REQUESTS_PER_MINUTE = float(os.environ.get("MAP_REQUESTS_PER_MINUTE", 0))
+        self.LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 10000))
+        self.LLM_CACHE_MAX_AGE_DAYS = float(os.environ.get("LLM_CACHE_MAX_AGE_DAYS", 30))
+        self.LLM_SEMANTIC_CACHE = os.environ.get("LLM_SEMANTIC_CACHE", "false").lower() == "true"
+        self.LLM_SEMANTIC_CACHE_DISTANCE = float(os.environ.get("LLM_SEMANTIC_CACHE_DISTANCE", 0.05))
+        self.LANGCHAIN_DEBUG = os.environ.get("LANGCHAIN_DEBUG", "false").lower() == "true"
+        self.LANGCHAIN_VERBOSE = os.environ.get("LANGCHAIN_VERBOSE", "false").lower() == "true"
+        self.METRICS_JSONL = os.environ.get("METRICS_JSONL", self.CACHE_DIRECTORY.joinpath("metrics.jsonl").as_posix())
+        self.METRICS_JSONL_MAX_MB = int(os.environ.get("METRICS_JSONL_MAX_MB", 50))
+        self.METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
         self._custom_prompt_directory = None
         #  Process **kwargs
         for key, value in kwargs.items():
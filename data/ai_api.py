@@ -1,23 +1,42 @@
 #! /usr/bin/env python3
 
 import argparse
+import asyncio
+import contextvars
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
 from textwrap import dedent
 
 import langchain
-from langchain.cache import InMemoryCache
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
-from langchain.chains import RetrievalQA
 from langchain.chains.question_answering import load_qa_chain
 from langchain.chains.question_answering.stuff_prompt import \
     CHAT_PROMPT as LG_PROMPT
 from langchain.chat_models import ChatOpenAI
-from langchain.memory import ConversationStringBufferMemory
+from langchain.docstore.document import Document
+from langchain.chains import LLMChain
+from langchain.memory.prompt import SUMMARY_PROMPT
 
 from app_prompt import (BIZ_ANALYSIS_PROMPT, COMBINE_DOC_PROMPT,
                         GIT_BOOK_PROMPT, SWOT_1, TAE_KIM_PROMPT,
-                        get_custom_prompt)
+                        prompt_registry)
 from config import Config
+from data.caching import LRUTTLCache
 from data.chroma_db import chroma_vectordb
+from data.clients import with_retry
+from data.fusion import normalized_score_fusion, reciprocal_rank_fusion
+from data.llm_cache import SemanticAnswerCache, SQLiteLLMCache
+from data.manifest import DocumentManifest
+from data.memory import SessionMemory
+from data.metrics import MetricsCallbackHandler, serve, timed, trace_request
+from data.mmr import mmr_search
+from data.numpy_db import numpy_vectordb
+from data.packing import count_tokens, encoding_name, pack_documents
+from data.parallel_map import amap_documents
+from data.registry import (get_bm25_index, get_embedding_function,
+                           get_manifest)
+from data.streaming import TokenCallbackHandler
 from data.weaviate_db import weaviate_vectordb
 
 # Load config settings
@@ -29,9 +48,36 @@ logger = configs.logger
 # Retrieve OpenAI API Key from .env file
 openai_api_key = configs.OPENAI_API_KEY
 
-# When using Chat_Models the llm_cache will improve performance
-langchain.llm_cache = InMemoryCache()  # Turn this off when you want to test various models
-langchain.debug = True
+# When using Chat_Models the llm_cache will improve performance. It is on disk and shared by every worker process.
+langchain.llm_cache = SQLiteLLMCache()  # Turn this off when you want to test various models
+
+# Optional: answer near-identical questions over the same retrieved chunks from earlier answers
+semantic_cache = SemanticAnswerCache() if configs.LLM_SEMANTIC_CACHE else None
+
+# LLM clients per model and QA chains per (model, chain_type, prompt, prompt file mtime). Chains hold no
+# memory or per-request state, so one instance is shared by every query.
+llm_cache = LRUTTLCache(maxsize=16, ttl=float("inf"))
+qa_chain_cache = LRUTTLCache(maxsize=128, ttl=float("inf"))
+# Drop chains built from a custom prompt file as soon as the file changes
+prompt_registry.subscribe(lambda file_name: qa_chain_cache.invalidate(lambda key: file_name is None or key[3] == file_name))
+langchain.debug = configs.LANGCHAIN_DEBUG
+
+# Export the latency histograms for Prometheus to scrape
+if configs.METRICS_PORT:
+    serve(configs.METRICS_PORT)
+
+# Retrieved documents keyed by the search parameters and the collection version
+retrieval_cache = LRUTTLCache(configs.RETRIEVAL_CACHE_SIZE, configs.RETRIEVAL_CACHE_TTL)
+
+# Fan-out searches run here rather than on the event loop's default executor, which asyncio.run joins on exit.
+# A search that timed out keeps its thread until the store answers, without holding up the answer.
+fanout_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="fanout-search")
+
+
+async def _run_in_executor(executor, func, *args):
+    # Like asyncio.to_thread, with the context copied so the search is timed in the calling request's trace
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(context.run, func, *args))
 
 
 class Query:
@@ -50,10 +96,17 @@ class Query:
               "gpt-4-0613",
               ]
 
-    memory = ConversationStringBufferMemory(input_key="question", return_messages=True,)
+    # Context window in tokens for each model in MODELS
+    MODEL_CONTEXT_WINDOWS = {"gpt-3.5-turbo": 4096,
+                             "gpt-3.5-turbo-0613": 4096,
+                             "gpt-3.5-turbo-16k-0613": 16384,
+                             "gpt-4-0613": 8192,
+                             }
 
     def __init__(self, model=None, query=None, vectordb_choice=None, collection_name=None, text_key="text", prompt="LG_PROMPT", chain_type="stuff",
-                 search_name="Similarity", k_value=4, **kwargs) -> None:
+                 search_name="Similarity", k_value=4, memory: SessionMemory = None, **kwargs) -> None:
+        # Conversation history belongs to one session. Streamlit keeps it in st.session_state and passes it in on every rerun.
+        self.memory = memory if memory is not None else self.new_memory()
         self.model = model
         self.query = query
         self.vetordb_choice = vectordb_choice
@@ -76,45 +129,216 @@ class Query:
         self._custom_prompt_filename = name
 
     def get_query(self, model, query, vectordb_choice, collection_name, text_key="text", prompt="LG_PROMPT",
-                  chain_type="stuff", search_name="Similarity", k_value=4, **kwargs) -> list[str]:
-
+                  chain_type="stuff", search_name="Similarity", k_value=4, on_partial=None, on_token=None, on_sources=None, **kwargs) -> list[str]:
+        # Synchronous entry point for Streamlit and the CLI, runs aget_query on a private event loop
+        return asyncio.run(self.aget_query(model, query, vectordb_choice, collection_name, text_key, prompt,
+                                           chain_type, search_name, k_value, on_partial, on_token, on_sources, **kwargs))
+
+    async def aget_query(self, model, query, vectordb_choice, collection_name, text_key="text", prompt="LG_PROMPT",
+                         chain_type="stuff", search_name="Similarity", k_value=4, on_partial=None, on_token=None, on_sources=None,
+                         **kwargs) -> list[str]:
+        """
+        aget_query Async version of get_query. Many queries can be awaited concurrently on one event loop.
+
+        on_partial(index, output) receives each per-document answer of a map_reduce or map_rerank chain as it finishes.
+        on_sources(docs_and_scores) receives the retrieved (Document, score) pairs before the LLM is called, and
+        on_token(token) receives the tokens of the answer as they are generated. All three are called in the caller's thread.
+
+        The LLM call is natively async. Vector store searches and the semantic cache run in the
+        default thread pool, since the LangChain Chroma and Weaviate wrappers only search synchronously.
+        """
         logger.info("Query Values: %s | %s | %s | %s | %s | %d", query, vectordb_choice, collection_name, prompt, search_name, k_value)
-        llm = ChatOpenAI(streaming=True, callbacks=[StreamingStdOutCallbackHandler()], temperature=0, openai_api_key=openai_api_key, model=model,)
-
+        with trace_request("query", store=vectordb_choice, collection=collection_name, model=model, chain_type=chain_type, search=search_name):
+            llm = self.get_llm(model)
+
+            search_kwargs = {"k": k_value}
+            if kwargs:
+                search_kwargs.update(**kwargs)
+
+            search_dict = {
+                "Similarity": "similarity",
+                "MMR": "mmr",
+                "Similarity and Display Score": "Score",
+                "Similarity with Score Threshold": "similarity_score_threshold",
+                "Hybrid": "hybrid",
+                "Filter": None
+            }
+
+            search_type = search_dict[search_name]
+            docs_and_scores = await self.aretrieve(vectordb_choice, collection_name, text_key, query, search_type, search_kwargs)
+            docsearch = [doc for doc, _ in docs_and_scores]
+            if on_sources is not None:
+                on_sources(docs_and_scores)
+            if search_type == "Score":
+                chain_type = "stuff"  # chain_query always stuffs the documents
+
+            cached_answer, semantic_entry = await asyncio.to_thread(self.semantic_lookup, llm, query, prompt, chain_type, docsearch)
+            if cached_answer is not None:
+                self.semantic_update(semantic_entry, query, cached_answer, hit=True)
+                if on_token is not None:
+                    on_token(cached_answer)
+                response = {"query": query, "result": cached_answer, "source_documents": docsearch}
+            elif search_type == "Score":
+                response = {"result": await self.achain_query(llm, query, docsearch, prompt, on_token)}  # Can not use the score object.
+            else:
+                response = await self.aretrieval_qa(llm, query, prompt, docsearch, chain_type=chain_type, return_source_documents=True,
+                                                    on_partial=on_partial, on_token=on_token)
+            if cached_answer is None:
+                await asyncio.to_thread(self.semantic_update, semantic_entry, query, response["result"], False)
+
+            if search_type == "Score":
+                return [response["result"], docs_and_scores]
+            return response
+
+    def semantic_lookup(self, llm, query, prompt, chain_type, docsearch) -> tuple:
+        """
+        semantic_lookup Return (answer, entry) from the semantic cache. answer is None on a miss, entry is None when the cache is off.
+        """
+        if semantic_cache is None:
+            return None, None
+        chunk_ids = [DocumentManifest.chunk_hash(doc) for doc in docsearch]
+        prompt_key = f"{prompt}:{self.custom_prompt_filename}" if prompt == "CUSTOM PROMPT" else prompt
+        context_key = semantic_cache.context_key(llm.model_name, llm.temperature, prompt_key, chain_type, chunk_ids)
+        vector = get_embedding_function().embed_query(query)
+        return semantic_cache.lookup(context_key, vector), (context_key, vector, chain_type)
+
+    def semantic_update(self, semantic_entry, query, answer, hit) -> None:
+        if semantic_entry is None:
+            return
+        context_key, vector, chain_type = semantic_entry
+        if not hit:
+            semantic_cache.update(context_key, query, vector, answer)
+        elif chain_type == "stuff":
+            # The chain did not run, so record the turn in the conversation history here
+            self.memory.save_context({"question": query}, {"output_text": answer})
+
+    def vectordb(self, vectordb_choice, collection_name, text_key="text"):
         # Set the Vectore Store Based on vectordb_choice
         if vectordb_choice == "ChromaDB":
-            db = chroma_vectordb(collection_name)
+            return chroma_vectordb(collection_name)
         elif vectordb_choice == "Weaviate":
-            db = weaviate_vectordb(collection_name, text_key)
+            return weaviate_vectordb(collection_name, text_key)
+        elif vectordb_choice == "NumPy":
+            return numpy_vectordb(collection_name)
         else:
             raise ValueError("'collection_name' must defined.")
 
-        search_kwargs = {"k": k_value}
-        if kwargs:
-            search_kwargs.update(**kwargs)
-
-        search_dict = {
-            "Similarity": "similarity",
-            "MMR": "mmr",
-            "Similarity and Display Score": "Score",
-            "Similarity with Score Threshold": "similarity_score_threshold",
-            "Filter": None
-        }
-
-        search_type = search_dict[search_name]
-
+    def retrieve(self, vectordb_choice, collection_name, text_key, query, search_type, search_kwargs) -> list[tuple]:
+        """
+        retrieve Search the vector store and return (Document, score) pairs. Score is None for search types without one.
+
+        Results are cached per search parameters and collection version, so any ingest or delete
+        through the manifest makes earlier results unreachable.
+        """
+        version = get_manifest().get_version(vectordb_choice, collection_name)
+        key = (vectordb_choice, collection_name, text_key, query, search_type, json.dumps(search_kwargs, sort_keys=True, default=str), version)
+        cached = retrieval_cache.get(key)
+        if cached is not None:
+            logger.debug("Retrieval cache hit for %s | %s", collection_name, query)
+            return list(cached)
+
+        db = self.vectordb(vectordb_choice, collection_name, text_key)
+        # Searches are read-only, so transport failures can be retried
+        docs_and_scores = with_retry(self.search, db, query, search_type, search_kwargs)
+        retrieval_cache.set(key, docs_and_scores)
+        return list(docs_and_scores)
+
+    async def aretrieve(self, vectordb_choice, collection_name, text_key, query, search_type, search_kwargs, executor=None) -> list[tuple]:
+        with timed("retrieve", store=vectordb_choice, search=search_type):
+            if search_type == "hybrid":
+                return await self.ahybrid_retrieve(vectordb_choice, collection_name, text_key, query, search_kwargs)
+            return await _run_in_executor(executor, self.retrieve, vectordb_choice, collection_name, text_key, query, search_type, search_kwargs)
+
+    async def ahybrid_retrieve(self, vectordb_choice, collection_name, text_key, query, search_kwargs) -> list[tuple]:
+        """
+        ahybrid_retrieve Run the BM25 and vector searches concurrently and fuse their rankings. Scores are reciprocal rank fusion scores.
+
+        Each side returns HYBRID_FETCH_K candidates. Chunks are matched on text, since
+        Weaviate results only carry the metadata properties that were asked for.
+        """
+        k = search_kwargs.get("k", 4)
+        fetch_k = max(k, configs.HYBRID_FETCH_K)
+        dense, sparse = await asyncio.gather(
+            asyncio.to_thread(self.retrieve, vectordb_choice, collection_name, text_key, query, "similarity", {"k": fetch_k}),
+            asyncio.to_thread(get_bm25_index().search, vectordb_choice, collection_name, query, fetch_k))
+        return reciprocal_rank_fusion([[doc for doc, _ in dense], [doc for doc, _ in sparse]], top_k=k,
+                                      identity=lambda doc: doc.page_content)
+
+    def search(self, db, query, search_type, search_kwargs) -> list[tuple]:
         if search_type == "Score":
-            docsearch = db.similarity_search_with_score(query)
-            docsearch_no_tup = [doc[0] for doc in docsearch]  # Remove Score from tuple
-            response = self.chain_query(llm, query, docsearch_no_tup, prompt)  # Can not use the score object.
-            return [response, docsearch]
-        elif search_type is not None:
+            return db.similarity_search_with_score(query)
+        if search_type == "relevance":
+            # Scores in [0, 1], higher is better, for fusing results across stores
+            return db.similarity_search_with_relevance_scores(query, k=search_kwargs.get("k", 4))
+        if search_type == "mmr":
+            # One candidate fetch with vectors and a NumPy selection, the same on every store
+            docs = mmr_search(db, get_embedding_function().embed_query(query), k=search_kwargs.get("k", 4),
+                              fetch_k=search_kwargs.get("fetch_k", 20), lambda_mult=search_kwargs.get("lambda_mult", 0.5),
+                              filter=search_kwargs.get("filter"))
+            return [(doc, None) for doc in docs]
+        if search_type is not None:
             retriever = db.as_retriever(search_type=search_type, search_kwargs=search_kwargs)
         else:
             # For Filter based retriever
             retriever = db.as_retriever(search_kwargs={"filter": search_kwargs})
-        response = self.retrieval_qa(llm, query, prompt, retriever=retriever, chain_type=chain_type, return_source_documents=True)
-        return response
+        return [(doc, None) for doc in retriever.get_relevant_documents(query)]
+
+    async def afanout_retrieve(self, sources: list[tuple], query: str, k_value: int = 4, fusion: str = "rrf",
+                               timeout: float = None) -> list[tuple]:
+        """
+        afanout_retrieve Search every (vectordb_choice, collection_name, text_key) source concurrently and fuse the results into one top-k.
+
+        fusion is "rrf" (reciprocal rank fusion) or "score" (min-max normalized relevance scores).
+        A source that fails or exceeds the timeout is logged and left out, so one slow store
+        does not hold up the answer. Searches run on fanout_executor, so a timed out search is not
+        waited for when the event loop closes either.
+        """
+        timeout = configs.FANOUT_TIMEOUT if timeout is None else timeout
+
+        async def search_source(source):
+            vectordb_choice, collection_name, text_key = source
+            docs_and_scores = await asyncio.wait_for(
+                self.aretrieve(vectordb_choice, collection_name, text_key, query, "relevance", {"k": k_value}, executor=fanout_executor), timeout)
+            # Copies, so tagging the origin does not change documents held by the retrieval cache
+            return [(Document(page_content=doc.page_content, metadata={**doc.metadata, "vectordb": vectordb_choice, "collection": collection_name}), score)
+                    for doc, score in docs_and_scores]
+
+        results = await asyncio.gather(*(search_source(source) for source in sources), return_exceptions=True)
+        ranked = []
+        for source, result in zip(sources, results):
+            if isinstance(result, BaseException):
+                logger.warning("Fan-out search of %s/%s skipped: %r", source[0], source[1], result)
+                continue
+            ranked.append(result)
+
+        if fusion == "score":
+            return normalized_score_fusion(ranked, top_k=k_value)
+        if fusion == "rrf":
+            return reciprocal_rank_fusion([[doc for doc, _ in result] for result in ranked], top_k=k_value)
+        raise ValueError(f"Invalid fusion method: {fusion}.")
+
+    def get_fanout_query(self, model, query, sources, prompt="LG_PROMPT", chain_type="stuff", k_value=4, fusion="rrf", on_partial=None,
+                         on_token=None, on_sources=None) -> dict:
+        return asyncio.run(self.aget_fanout_query(model, query, sources, prompt, chain_type, k_value, fusion, on_partial, on_token, on_sources))
+
+    async def aget_fanout_query(self, model, query, sources, prompt="LG_PROMPT", chain_type="stuff", k_value=4, fusion="rrf",
+                                on_partial=None, on_token=None, on_sources=None) -> dict:
+        """
+        aget_fanout_query Answer a query from the fused top-k of several collections, possibly in different vector stores.
+
+        on_partial, on_token and on_sources are called as in aget_query.
+        """
+        logger.info("Fan-out Query Values: %s | %s | %s | %s", query, sources, prompt, fusion)
+        with trace_request("query", store="fanout", model=model, chain_type=chain_type, search=fusion):
+            llm = self.get_llm(model)
+            docs_and_scores = await self.afanout_retrieve(sources, query, k_value, fusion)
+            docsearch = [doc for doc, _ in docs_and_scores]
+            if on_sources is not None:
+                on_sources(docs_and_scores)
+            response = await self.aretrieval_qa(llm, query, prompt, docsearch, chain_type=chain_type, return_source_documents=True,
+                                                on_partial=on_partial, on_token=on_token)
+            response["scores"] = [score for _, score in docs_and_scores]
+            return response
 
     def vectordb_search_with_score(self, vectordb_choice, query, collection_name, text_key, k_value) -> tuple:
         if vectordb_choice == "ChromaDB":
@@ -126,10 +350,21 @@ class Query:
             docsearch = db.similarity_search_with_score(query, k_value, by_text=False)
             return docsearch
 
+    def get_llm(self, model) -> ChatOpenAI:
+        llm = llm_cache.get(model)
+        if llm is None:
+            # Echoing tokens to stdout is for debugging only, the metrics handler is always on
+            callbacks = [MetricsCallbackHandler()]
+            if configs.LANGCHAIN_VERBOSE:
+                callbacks.append(StreamingStdOutCallbackHandler())
+            llm = ChatOpenAI(streaming=True, callbacks=callbacks, temperature=0, openai_api_key=openai_api_key, model=model,)
+            llm_cache.set(model, llm)
+        return llm
+
     def prompt_selector(self, prompt):
         if prompt == "CUSTOM PROMPT":
             filename = self.custom_prompt_filename
-            return get_custom_prompt(filename)
+            return prompt_registry.get(filename)
         prompts = {"LG_PROMPT - Gen Use": LG_PROMPT,
                    "TK_CHAT_PROMPT": TAE_KIM_PROMPT,
                    "GIT_BOOK_PROMPT": GIT_BOOK_PROMPT,
@@ -140,31 +375,130 @@ class Query:
             raise ValueError(f"Invalid Prompt Name: {prompt}.")
         return prompts[prompt]
 
-    def chain_query(self, llm, query, docsearch, prompt):
-        # Initialize Memory Buffer for Conversation
-        prompt_template = self.prompt_selector(prompt)
-        chain = load_qa_chain(llm, chain_type="stuff", verbose=True, prompt=prompt_template, memory=self.memory)
-        return chain.run({"input_documents": docsearch, "question": query},)
+    def get_qa_chain(self, llm: ChatOpenAI, chain_type: str, prompt: str):
+        """
+        get_qa_chain Return the shared QA chain for this model, chain type and prompt, building it on first use.
 
-    def retrieval_qa(self, llm: ChatOpenAI, query: str, prompt: str, retriever,
-                     chain_type: str = "stuff", return_source_documents: bool = True) -> dict[str]:
-        # Initialize Memory Buffer for Conversation
+        Only "stuff" chains use the prompt template. Custom prompts are keyed by file name and
+        modification time, so an edited file produces a new chain.
+        """
         if chain_type in ["map_reduce", "refine", "map_rerank"]:
-            qa_chain = load_qa_chain(llm, chain_type=chain_type,)
+            key = (llm.model_name, chain_type, None, None, None)
+        elif prompt == "CUSTOM PROMPT":
+            filename = self.custom_prompt_filename
+            key = (llm.model_name, chain_type, prompt, filename, prompt_registry.mtime(filename))
         else:
-            prompt_template = self.prompt_selector(prompt)
-            qa_chain = load_qa_chain(llm, chain_type=chain_type, prompt=prompt_template, memory=self.memory)
-        qa = RetrievalQA(combine_documents_chain=qa_chain, retriever=retriever, verbose=True, return_source_documents=return_source_documents)
-        return qa.__call__({"query": query})
+            key = (llm.model_name, chain_type, prompt, None, None)
+        qa_chain = qa_chain_cache.get(key)
+        if qa_chain is None:
+            if chain_type in ["map_reduce", "refine", "map_rerank"]:
+                qa_chain = load_qa_chain(llm, chain_type=chain_type,)
+            else:
+                qa_chain = load_qa_chain(llm, chain_type=chain_type, verbose=configs.LANGCHAIN_VERBOSE, prompt=self.prompt_selector(prompt))
+            qa_chain_cache.set(key, qa_chain)
+        return qa_chain
+
+    def pack_context(self, llm: ChatOpenAI, prompt: str, inputs: dict) -> list:
+        """
+        pack_context Trim the stuff chain's documents to the model's context window.
+
+        The budget is the window less ANSWER_TOKEN_RESERVE and the tokens of the prompt template,
+        question and conversation history.
+        """
+        template = self.prompt_selector(prompt)
+        empty_context = {var: "" if var == "context" else inputs.get(var, "") for var in template.input_variables}
+        overhead = count_tokens(template.format(**empty_context), encoding_name(llm.model_name))
+        window = self.MODEL_CONTEXT_WINDOWS.get(llm.model_name, 4096)
+        return pack_documents(inputs["input_documents"], llm.model_name, window - configs.ANSWER_TOKEN_RESERVE - overhead)
+
+    async def arun_qa_chain(self, qa_chain, query: str, docsearch: list, use_memory: bool, llm: ChatOpenAI = None, prompt: str = None,
+                            callbacks: list = None) -> tuple:
+        """
+        arun_qa_chain Run a shared chain and return (answer, documents used). Documents are packed to the context window when llm and prompt are given.
+        """
+        # Memory is applied here instead of being attached to the shared chain
+        inputs = {"input_documents": docsearch, "question": query}
+        if use_memory:
+            inputs.update(self.memory.load_memory_variables(inputs))
+        if llm is not None:
+            inputs["input_documents"] = self.pack_context(llm, prompt, inputs)
+        outputs = await qa_chain.acall(inputs, return_only_outputs=True, callbacks=callbacks)
+        answer = outputs[qa_chain.output_key]
+        if use_memory:
+            self.memory.save_context({"question": query}, {qa_chain.output_key: answer})
+        return answer, inputs["input_documents"]
+
+    async def arun_map_chain(self, qa_chain, chain_type: str, query: str, docsearch: list, on_partial=None, on_token=None) -> str:
+        """
+        arun_map_chain Run a map_reduce or map_rerank chain with the per-document LLM calls in parallel.
+
+        The map calls are bounded by MAP_CONCURRENCY and MAP_REQUESTS_PER_MINUTE. The reduce step
+        (or the rerank) starts as soon as the last map call finishes.
+        """
+        outputs = await amap_documents(qa_chain.llm_chain, docsearch, qa_chain.document_variable_name, {"question": query},
+                                       on_result=on_partial)
+        if chain_type == "map_rerank":
+            parser = qa_chain.llm_chain.prompt.output_parser
+            answer, _ = qa_chain._process_results(docsearch, [parser.parse(output) for output in outputs])
+            if on_token is not None:
+                # The answer is one of the map outputs, there is no final LLM call to stream
+                on_token(answer)
+            return answer
+        mapped_docs = [Document(page_content=output, metadata=doc.metadata) for doc, output in zip(docsearch, outputs)]
+        callbacks = [TokenCallbackHandler(on_token)] if on_token is not None else None
+        answer, _ = await qa_chain.reduce_documents_chain.acombine_docs(mapped_docs, question=query, callbacks=callbacks)
+        return answer
+
+    async def achain_query(self, llm, query, docsearch, prompt, on_token=None):
+        # Initialize Memory Buffer for Conversation
+        chain = self.get_qa_chain(llm, "stuff", prompt)
+        callbacks = [TokenCallbackHandler(on_token)] if on_token is not None else None
+        answer, _ = await self.arun_qa_chain(chain, query, docsearch, use_memory=True, llm=llm, prompt=prompt, callbacks=callbacks)
+        return answer
+
+    def chain_query(self, llm, query, docsearch, prompt, on_token=None):
+        return asyncio.run(self.achain_query(llm, query, docsearch, prompt, on_token))
+
+    async def aretrieval_qa(self, llm: ChatOpenAI, query: str, prompt: str, docsearch: list,
+                            chain_type: str = "stuff", return_source_documents: bool = True, on_partial=None, on_token=None) -> dict[str]:
+        # Memory and custom prompts are only used by the stuff chain
+        qa_chain = self.get_qa_chain(llm, chain_type, prompt)
+        # Same output as RetrievalQA, but with documents that may have come from the retrieval cache
+        if chain_type in ["map_reduce", "map_rerank"]:
+            answer = await self.arun_map_chain(qa_chain, chain_type, query, docsearch, on_partial, on_token)
+        elif chain_type == "refine":
+            # One LLM call per document, each rewriting the answer. Only the last one is streamed.
+            callbacks = [TokenCallbackHandler(on_token, skip_calls=len(docsearch) - 1)] if on_token is not None else None
+            answer, docsearch = await self.arun_qa_chain(qa_chain, query, docsearch, use_memory=False, callbacks=callbacks)
+        else:
+            # Only the stuff chain puts every document into a single prompt, so only it is packed
+            callbacks = [TokenCallbackHandler(on_token)] if on_token is not None else None
+            answer, docsearch = await self.arun_qa_chain(qa_chain, query, docsearch, use_memory=True, llm=llm, prompt=prompt, callbacks=callbacks)
+        response = {"query": query, "result": answer}
+        if return_source_documents:
+            response["source_documents"] = docsearch
+        return response
+
+    def retrieval_qa(self, llm: ChatOpenAI, query: str, prompt: str, docsearch: list,
+                     chain_type: str = "stuff", return_source_documents: bool = True, on_partial=None, on_token=None) -> dict[str]:
+        return asyncio.run(self.aretrieval_qa(llm, query, prompt, docsearch, chain_type, return_source_documents, on_partial, on_token))
+
+    def new_memory(self) -> SessionMemory:
+        return SessionMemory(summarizer=self.summarize_history)
+
+    def summarize_history(self, summary: str, new_lines: str) -> str:
+        # Runs in a memory-summary thread, never on the request path
+        chain = LLMChain(llm=self.get_llm(configs.MEMORY_SUMMARY_MODEL), prompt=SUMMARY_PROMPT)
+        return chain.predict(summary=summary, new_lines=new_lines)
 
-    def load_memory(cls):
+    def load_memory(self):
         # Simple function to return history buffer*
-        output = cls.memory.load_memory_variables({''})
+        output = self.memory.load_memory_variables({''})
         return output
 
-    def clear_memory(cls):
+    def clear_memory(self):
         # Simple Function to reset Chat memory
-        cls.memory.clear()
+        self.memory.clear()
 
     def main(self, args):
         if args.collection:
@@ -179,8 +513,7 @@ class Query:
         while True:
             query = input("What is your question? >>> ")
             docsearch = db.similarity_search(query=query, k=4)
-            self.chain_query(llm=ChatOpenAI(streaming=True, callbacks=[StreamingStdOutCallbackHandler()], temperature=0,
-                                            openai_api_key=openai_api_key), query=query, docsearch=docsearch, prompt=prompt)
+            self.chain_query(llm=self.get_llm("gpt-3.5-turbo"), query=query, docsearch=docsearch, prompt=prompt)
 
 
 if __name__ == "__main__":
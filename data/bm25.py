@@ -0,0 +1,176 @@
+import argparse
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from textwrap import dedent
+
+from langchain.docstore.document import Document
+
+from config import Config
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+_WORD = re.compile(r"\w+(?:[.\-:/]\w+)*")
+# Kana, CJK ideographs and half-width katakana. Japanese is not space separated, so runs are indexed as character bigrams.
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff66-\uff9f]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    tokenize Lowercased words, plus the parts of dotted or dashed identifiers, plus character bigrams of CJK runs.
+    """
+    text = text.lower()
+    tokens = []
+    for run in _CJK.findall(text):
+        if len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    for word in _WORD.findall(_CJK.sub(" ", text)):
+        tokens.append(word)
+        parts = [part for part in re.split(r"[.\-:/]", word) if part]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """
+     BM25Index is an inverted index over the chunks of every collection, kept in one SQLite file and
+     maintained by the same ingest and delete calls that write the vector stores.
+
+     Each chunk is stored under its vector store id with its text and metadata, so lexical search
+     returns Documents without a round trip to the store.
+    """
+
+    def __init__(self, path: str = None, k1: float = 1.5, b: float = 0.75):
+        if path is None:
+            configs.CACHE_DIRECTORY.mkdir(parents=True, exist_ok=True)
+            path = configs.CACHE_DIRECTORY.joinpath("bm25.sqlite3").as_posix()
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS chunks ("
+                           "store TEXT NOT NULL, collection TEXT NOT NULL, chunk_id TEXT NOT NULL, text TEXT NOT NULL, "
+                           "metadata TEXT NOT NULL, length INTEGER NOT NULL, PRIMARY KEY (store, collection, chunk_id))")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS postings ("
+                           "store TEXT NOT NULL, collection TEXT NOT NULL, term TEXT NOT NULL, chunk_id TEXT NOT NULL, "
+                           "tf INTEGER NOT NULL, PRIMARY KEY (store, collection, term, chunk_id)) WITHOUT ROWID")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS postings_chunk ON postings (store, collection, chunk_id)")
+
+    def _delete(self, store: str, collection: str, ids: list[str]) -> None:
+        self._conn.executemany("DELETE FROM postings WHERE store = ? AND collection = ? AND chunk_id = ?",
+                               [(store, collection, chunk_id) for chunk_id in ids])
+        self._conn.executemany("DELETE FROM chunks WHERE store = ? AND collection = ? AND chunk_id = ?",
+                               [(store, collection, chunk_id) for chunk_id in ids])
+
+    def add(self, store: str, collection: str, docs: list[Document], ids: list[str]) -> None:
+        chunks, postings = [], []
+        for doc, chunk_id in zip(docs, ids):
+            terms = Counter(tokenize(doc.page_content))
+            chunks.append((store, collection, chunk_id, doc.page_content, json.dumps(doc.metadata, default=str), sum(terms.values())))
+            postings.extend((store, collection, term, chunk_id, tf) for term, tf in terms.items())
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                # Re-adding an id replaces it, like the vector stores
+                self._delete(store, collection, ids)
+                self._conn.executemany("INSERT INTO chunks (store, collection, chunk_id, text, metadata, length) VALUES (?, ?, ?, ?, ?, ?)", chunks)
+                self._conn.executemany("INSERT INTO postings (store, collection, term, chunk_id, tf) VALUES (?, ?, ?, ?, ?)", postings)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, store: str, collection: str, ids: list[str]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._delete(store, collection, ids)
+            self._conn.execute("COMMIT")
+
+    def remove_collection(self, store: str, collection: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM postings WHERE store = ? AND collection = ?", (store, collection))
+            self._conn.execute("DELETE FROM chunks WHERE store = ? AND collection = ?", (store, collection))
+            self._conn.execute("COMMIT")
+
+    def search(self, store: str, collection: str, query: str, k: int = 4) -> list[tuple[Document, float]]:
+        """
+        search Return the k best (Document, BM25 score) pairs for the query, best first.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            total_docs, total_length = self._conn.execute("SELECT COUNT(*), SUM(length) FROM chunks WHERE store = ? AND collection = ?",
+                                                          (store, collection)).fetchone()
+            if not total_docs:
+                return []
+            avg_length = total_length / total_docs
+            scores = Counter()
+            for term in terms:
+                rows = self._conn.execute("SELECT p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c "
+                                          "ON c.store = p.store AND c.collection = p.collection AND c.chunk_id = p.chunk_id "
+                                          "WHERE p.store = ? AND p.collection = ? AND p.term = ?", (store, collection, term)).fetchall()
+                idf = math.log(1 + (total_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+                for chunk_id, tf, length in rows:
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_length))
+            best = scores.most_common(k)
+            if not best:
+                return []
+            found = {chunk_id: (text, metadata) for chunk_id, text, metadata in self._conn.execute(
+                f"SELECT chunk_id, text, metadata FROM chunks WHERE store = ? AND collection = ? AND chunk_id IN ({','.join('?' * len(best))})",
+                [store, collection, *[chunk_id for chunk_id, _ in best]])}
+        return [(Document(page_content=found[chunk_id][0], metadata=json.loads(found[chunk_id][1])), score) for chunk_id, score in best]
+
+
+def rebuild_index(store: str, collection: str, text_key: str = "text") -> int:
+    """
+    rebuild_index Re-index every chunk already in a collection, for collections loaded before the index existed.
+    """
+    from data.registry import get_bm25_index
+    if store == "ChromaDB":
+        from data.chroma_db import chroma_iter_chunks
+        batches = chroma_iter_chunks(collection)
+    elif store == "Weaviate":
+        from data.weaviate_db import weaviate_iter_chunks
+        batches = weaviate_iter_chunks(collection, text_key)
+    else:
+        from data.numpy_db import numpy_vectordb
+        batches = numpy_vectordb(collection).iter_chunks()
+    index = get_bm25_index()
+    index.remove_collection(store, collection)
+    total = 0
+    for ids, docs in batches:
+        index.add(store, collection, docs, ids)
+        total += len(ids)
+    logger.info("Indexed %d chunks of %s %s", total, store, collection)
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bm25.py",
+                                     formatter_class=argparse.RawTextHelpFormatter,
+                                     description="bm25.py - Rebuild the keyword index of a collection used by Hybrid search",
+                                     epilog=dedent("""\
+                                            Collections are indexed as documents are loaded. Run this once for a collection
+                                            loaded before Hybrid search was available:
+
+                                            `python -m data.bm25 -s Weaviate -c YourClass -t text`
+                                            """))
+    parser.add_argument("-s", "--store", type=str, choices=["ChromaDB", "Weaviate", "NumPy"], default="ChromaDB", help="Vector store. Default is ChromaDB.")
+    parser.add_argument("-c", "--collection", type=str, required=True, help="Chroma collection, Weaviate class or NumPy collection.")
+    parser.add_argument("-t", "--text-key", type=str, default="text", help="Weaviate class property holding the text. Default is text.")
+    args = parser.parse_args()
+    print(f"Indexed {rebuild_index(args.store, args.collection, args.text_key)} chunks")
@@ -0,0 +1,194 @@
+#! /usr/bin/env python3
+
+import argparse
+import glob
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from textwrap import dedent
+
+from config import Config
+from document_handling import DocumentHandling
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+SUPPORTED_SUFFIXES = {".docx", ".pdf", ".rtdocs", ".txt", ".csv"}
+
+
+def find_files(target: str) -> tuple[Path, list[str]]:
+    """
+    find_files Resolve a directory or glob pattern to a root directory and the supported files below it, named relative to the root.
+
+    Targets inside the document directory have the document directory as their root.
+    """
+    path = Path(target)
+    if path.is_dir():
+        root = path
+        matches = path.rglob("*")
+    else:
+        # The root is the part of the pattern before the first wildcard
+        fixed = []
+        for part in path.parts:
+            if any(char in part for char in "*?["):
+                break
+            fixed.append(part)
+        root = Path(*fixed) if len(fixed) < len(path.parts) else path.parent
+        matches = (Path(match) for match in glob.glob(target, recursive=True))
+    matches = [match for match in matches if match.suffix in SUPPORTED_SUFFIXES and (match.is_file() or match.suffix == ".rtdocs")]
+    # Below the document directory, files are named as the UI names them, so both load them under the same manifest source
+    try:
+        root.resolve().relative_to(configs.doc_directory.resolve())
+        root, matches = configs.doc_directory, [match.resolve().relative_to(configs.doc_directory.resolve()) for match in matches]
+    except ValueError:
+        matches = [match.relative_to(root) for match in matches]
+    return root, sorted(match.as_posix() for match in matches)
+
+
+def _parse_file(root: str, name: str, known_hash: str = None) -> tuple:
+    # Runs in a worker process, hashes, loads and splits one file. Files whose hash is known_hash are not parsed
+    # and come back with docs None. Errors are returned so the writer can report them per file.
+    from data.manifest import DocumentManifest
+
+    start = time.perf_counter()
+    docs, file_hash, error = None, None, None
+    try:
+        file_hash = DocumentManifest.file_hash(Path(root).joinpath(name).as_posix())
+        if file_hash != known_hash:
+            docs = DocumentHandling(directory=root).get_loader(name)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return name, docs, file_hash, time.perf_counter() - start, error
+
+
+def _get_writer(store: str, collection: str, text_key: str):
+    if store == "ChromaDB":
+        from data.chroma_db import chroma_add_documents
+
+        def write(name, docs, file_path, file_hash):
+            return chroma_add_documents(name, collection, lambda: docs, file_path, file_hash=file_hash)
+    elif store == "NumPy":
+        from data.numpy_db import numpy_add_documents
+
+        def write(name, docs, file_path, file_hash):
+            return numpy_add_documents(name, collection, lambda: docs, file_path, file_hash=file_hash)
+    else:
+        from data.weaviate_db import weaviate_add_documents, weaviate_ensure_class
+        weaviate_ensure_class(collection)
+
+        def write(name, docs, file_path, file_hash):
+            return weaviate_add_documents(name, collection, text_key, lambda: docs, file_path, file_hash=file_hash)
+    return write
+
+
+def bulk_ingest(target: str, store: str, collection: str, text_key: str = "text", workers: int = None, queue_size: int = None) -> dict:
+    """
+    bulk_ingest Parse and split every supported file under target in a process pool and write the chunks to one collection.
+
+    Parsed files pass through a bounded queue to a single writer, so at most queue_size files
+    (default twice the worker count) are being parsed or waiting to be written at any time.
+    Every file is hashed once, in its worker, and files whose hash is already in the manifest are
+    skipped before parsing. A file that fails to parse or to write is counted as failed and the
+    run goes on with the next one.
+    """
+    from data.registry import get_manifest
+
+    workers = workers or configs.EMBEDDING_WORKERS
+    queue_size = queue_size or 2 * workers
+    start = time.perf_counter()
+    root, files = find_files(target)
+    manifest = get_manifest()
+    known_hashes = {name: manifest.get_file_hash(store, collection, name) for name in files}
+    print(f"Found {len(files)} files under {target}")
+
+    write = _get_writer(store, collection, text_key)
+    # The semaphore bounds the queue. Done-callbacks run on the pool's own thread and must never block on put().
+    parsed = queue.Queue()
+    in_flight = threading.Semaphore(queue_size)
+    totals = {"files": len(files), "skipped": 0, "failed": 0, "chunks": 0, "added": 0, "deleted": 0}
+
+    def produce(pool):
+        for name in files:
+            in_flight.acquire()
+            try:
+                future = pool.submit(_parse_file, root.as_posix(), name, known_hashes[name])
+            except Exception as e:
+                # A broken pool refuses new files, each is reported as failed rather than waited for
+                future = Future()
+                future.set_exception(e)
+            future.add_done_callback(lambda future, name=name: parsed.put((name, future)))
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        threading.Thread(target=produce, args=(pool,), daemon=True).start()
+        for _ in range(len(files)):
+            name, future = parsed.get()
+            try:
+                try:
+                    _, docs, file_hash, parse_seconds, error = future.result()
+                except Exception as e:
+                    # The worker died or its result could not be pickled
+                    docs, file_hash, parse_seconds, error = None, None, 0.0, f"{type(e).__name__}: {e}"
+                if error is not None:
+                    totals["failed"] += 1
+                    logger.warning("Failed to parse %s: %s", name, error)
+                    print(f"{name}: FAILED | {error}")
+                    continue
+                if docs is None:
+                    totals["skipped"] += 1
+                    continue
+                write_start = time.perf_counter()
+                result = write(name, docs, root.joinpath(name).as_posix(), file_hash)
+                write_seconds = time.perf_counter() - write_start
+            except Exception as e:
+                totals["failed"] += 1
+                logger.exception("Failed to write %s", name)
+                print(f"{name}: FAILED | {type(e).__name__}: {e}")
+                continue
+            finally:
+                in_flight.release()
+            totals["chunks"] += len(docs)
+            totals["added"] += result["added"]
+            totals["deleted"] += result["deleted"]
+            print(f"{name}: {len(docs)} chunks | parse {parse_seconds:.2f}s | write {write_seconds:.2f}s | "
+                  f"{result['added']} added, {result['deleted']} deleted")
+
+    totals["seconds"] = time.perf_counter() - start
+    totals["chunks_per_sec"] = totals["chunks"] / totals["seconds"] if totals["seconds"] else 0.0
+    print(f"Done: {totals['files']} files ({totals['skipped']} unchanged, {totals['failed']} failed), {totals['chunks']} chunks, "
+          f"{totals['added']} added, {totals['deleted']} deleted in {totals['seconds']:.1f}s ({totals['chunks_per_sec']:.1f} chunks/sec)")
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter,
+                                     description="bulk_ingest.py - Load a whole directory of documents into a vector store",
+                                     epilog=dedent("""
+                                            Usage examples:
+                                            1. Load everything in the document repo into a Chroma collection:
+
+                                            `python -m data.bulk_ingest ./document_repo -c your_collection_name`
+
+                                            2. Load only PDFs into a Weaviate class with 8 parser processes:
+
+                                            `python -m data.bulk_ingest "./document_repo/**/*.pdf" -s Weaviate -c YourClass -w 8`
+
+                                            Please note:
+                                            - Files already loaded and unchanged since are skipped, changed files only write the changed chunks.
+                                            - Quote glob patterns so the shell does not expand them.
+                                            """))
+    parser.add_argument("target", type=str, help="Directory or glob pattern of files to load.")
+    parser.add_argument("-s", "--store", type=str, choices=["ChromaDB", "Weaviate", "NumPy"], default="ChromaDB", help="Vector store. Default is ChromaDB.")
+    parser.add_argument("-c", "--collection", type=str, required=True, help="Chroma collection, Weaviate class or NumPy collection to write to.")
+    parser.add_argument("-t", "--text-key", type=str, default="text", help="Weaviate class property holding the text. Default is text.")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Parser processes. Default is EMBEDDING_WORKERS.")
+    parser.add_argument("-q", "--queue-size", type=int, default=None, help="Files parsed ahead of the writer. Default is twice the workers.")
+    args = parser.parse_args()
+    totals = bulk_ingest(args.target, args.store, args.collection, args.text_key, args.workers, args.queue_size)
+    sys.exit(1 if totals["failed"] else 0)
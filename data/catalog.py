@@ -0,0 +1,40 @@
+from config import Config
+from data.caching import LRUTTLCache
+from data.registry import get_manifest
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+# Collection lists, schemas and counts shared by every Streamlit session. Keys start with the store name.
+metadata_cache = LRUTTLCache(maxsize=256, ttl=configs.METADATA_CACHE_TTL)
+
+_MISSING = object()
+
+
+def cached(key: tuple, factory):
+    """
+    cached Return the cached value for key, calling factory on a miss. A factory that raises is not cached.
+    """
+    value = metadata_cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = factory()
+        metadata_cache.set(key, value)
+    return value
+
+
+def cached_counts(store: str, names: list[str], factory) -> dict[str, int]:
+    """
+    cached_counts Return factory(names) cached under the manifest version of every collection, so any ingest
+    or delete through the manifest, from any process, makes the counts stale before the TTL runs out.
+    """
+    manifest = get_manifest()
+    key = (store, "counts", tuple(names), tuple(manifest.get_version(store, name) for name in names))
+    return cached(key, lambda: factory(names))
+
+
+def invalidate(store: str = None) -> int:
+    # Called after a collection is created or deleted
+    return metadata_cache.invalidate(lambda key: store is None or key[0] == store)
@@ -1,11 +1,16 @@
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
 
-import chromadb
-from chromadb.config import Settings as chroma_settings
-from langchain.embeddings import HuggingFaceEmbeddings
+from langchain.docstore.document import Document
 from langchain.vectorstores import Chroma
 
 from config import Config
+from data import catalog
+from data.manifest import sync_document
+from data.metrics import timed, trace_request
+from data.registry import (get_bm25_index, get_chroma_client,
+                           get_embedding_function, get_manifest)
 from document_handling import DocumentHandling
 
 # Load config settings
@@ -14,58 +19,152 @@ configs = Config()
 # Set Logging
 logger = configs.logger
 
-# CHROMA DB URL
-CHROMA_DB_URL = configs.CHROMA_DB_URL.split(":")
-
 # Document Loaders and handling
 handler = DocumentHandling()
 
-embedding_function = HuggingFaceEmbeddings(
-    model_name="all-MiniLM-L6-v2")
-
-CHROMA_CLIENT = chromadb.HttpClient(host=CHROMA_DB_URL[0], port=CHROMA_DB_URL[1],
-                                    settings=chroma_settings(anonymized_telemetry=False))
 
-
-def chroma_create_vectordb(filename, collection_name):
-    docs = handler.get_loader(filename)
-    db = Chroma.from_documents(docs, embedding_function, collection_name=collection_name, client=CHROMA_CLIENT,)
-    logger.info("Loaded %s to Chroma Collection  %s", filename, collection_name)
-    return db
+def chroma_create_vectordb(filename, collection_name, stream=True, batch_size=None):
+    # When streaming, chunks flow from the loader to Chroma in batches and are never held as one list
+    load_chunks = (lambda: handler.stream_loader(filename)) if stream else (lambda: handler.get_loader(filename))
+    chroma_add_documents(filename, collection_name, load_chunks, handler.doc_directory.joinpath(filename).as_posix(), batch_size)
+    return chroma_vectordb(collection_name)
+
+
+def chroma_add_documents(source, collection_name, load_chunks, file_path, batch_size=None, file_hash=None) -> dict:
+    # The manifest limits the writes to chunks that are new since the last load of this file
+    embedding_function = get_embedding_function()
+    db = chroma_vectordb(collection_name)
+    with trace_request("ingest", store="ChromaDB", collection=collection_name):
+        result = sync_document(get_manifest(), "ChromaDB", collection_name, source, file_path,
+                               load_chunks=load_chunks,
+                               add_chunks=lambda docs, ids: _add_chunks(db, collection_name, docs, ids),
+                               delete_ids=lambda ids: _delete_ids(collection_name, ids),
+                               batch_size=batch_size, file_hash=file_hash)
+    # The collection is created on first use, so the cached collection names may be missing it
+    catalog.invalidate("ChromaDB")
+    logger.info("Loaded %s to Chroma Collection  %s (%d added, %d deleted)", source, collection_name, result["added"], result["deleted"])
+    logger.info("Embedding cache stats: %s", embedding_function.cache.stats())
+    return result
+
+
+def _add_chunks(db, collection_name, docs, ids):
+    with timed("upsert", store="ChromaDB"):
+        db.add_documents(docs, ids=ids)
+        get_bm25_index().add("ChromaDB", collection_name, docs, ids)
+
+
+def _delete_ids(collection_name, ids):
+    get_chroma_client().get_collection(collection_name).delete(ids=ids)
+    get_bm25_index().delete("ChromaDB", collection_name, ids)
+
+
+def chroma_delete_source(source, collection_name) -> int:
+    """
+    chroma_delete_source Delete every chunk whose "source" metadata is source with one server-side where filter, and return how many there were.
+
+    Chunks loaded before the manifest existed, or by other tools, are deleted too.
+    """
+    collection = get_chroma_client().get_collection(collection_name)
+    where = {"source": source}
+    # Only the ids are fetched, to count the chunks and drop them from the keyword index and manifest
+    ids = collection.get(where=where, include=[])["ids"]
+    if ids:
+        collection.delete(where=where)
+        get_bm25_index().delete("ChromaDB", collection_name, ids)
+        get_manifest().forget_ids("ChromaDB", collection_name, ids)
+    return len(ids)
+
+
+def chroma_delete_document(filename, collection_name) -> int:
+    # Chunks are matched on their source path first. Any left in the manifest, such as pages of a ReadTheDocs site, are deleted by id.
+    deleted = chroma_delete_source(handler.doc_directory.joinpath(filename).as_posix(), collection_name)
+    ids = get_manifest().remove_document("ChromaDB", collection_name, filename)
+    if ids:
+        _delete_ids(collection_name, ids)
+    logger.info("Deleted %d chunks of %s from Chroma Collection %s", deleted + len(ids), filename, collection_name)
+    return deleted + len(ids)
+
+
+def chroma_replace_document(filename, collection_name, batch_size=None) -> dict:
+    # Delete first: chunk ids are derived from the content, so reloaded chunks would otherwise be deleted with the old ones
+    deleted = chroma_delete_document(filename, collection_name)
+    result = chroma_add_documents(filename, collection_name, lambda: handler.stream_loader(filename),
+                                  handler.doc_directory.joinpath(filename).as_posix(), batch_size)
+    return dict(result, deleted=deleted)
+
+
+def chroma_iter_chunks(collection_name, batch_size=None) -> Iterator[tuple[list[str], list[Document]]]:
+    # Page through every chunk of a collection as (ids, documents)
+    collection = get_chroma_client().get_collection(collection_name)
+    batch_size = batch_size or configs.INGEST_BATCH_SIZE
+    offset = 0
+    while True:
+        batch = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            return
+        yield batch["ids"], [Document(page_content=text, metadata=metadata or {}) for text, metadata in zip(batch["documents"], batch["metadatas"])]
+        offset += len(batch["ids"])
 
 
 def chroma_vectordb(collection_name):
-    db = Chroma(client=CHROMA_CLIENT, embedding_function=embedding_function, collection_name=collection_name,)
+    db = Chroma(client=get_chroma_client(), embedding_function=get_embedding_function(), collection_name=collection_name,)
     logger.debug("Accessing Chroma Collection %s", collection_name)
     return db
 
 
 def list_collections():
     try:
-        collection_list = CHROMA_CLIENT.list_collections()
+        collection_list = get_chroma_client().list_collections()
         for collection in collection_list:
             yield collection
     except ValueError as e:
         logger.warning("%s The Vector Store does not have any collections", e)
+    except OSError as e:
+        logger.warning("%s The Chroma server is unreachable", e)
+
+
+def chroma_collection_names() -> list[str]:
+    # Names of every collection, cached for METADATA_CACHE_TTL. Empty when the server is unreachable, and not cached then.
+    try:
+        return catalog.cached(("ChromaDB", "collections"), lambda: [collection.name for collection in get_chroma_client().list_collections()])
+    except OSError as e:
+        logger.warning("%s The Chroma server is unreachable", e)
+        return []
+
+
+def chroma_collection_counts(collection_names: list[str]) -> dict[str, int]:
+    """
+    chroma_collection_counts Chunk count per collection. Chroma has no batched count, so the counts are requested
+    concurrently and cached until a collection changes.
+    """
+    def count(names):
+        client = get_chroma_client()
+        with ThreadPoolExecutor(max_workers=min(8, len(names) or 1)) as pool:
+            return dict(zip(names, pool.map(lambda name: client.get_collection(name).count(), names)))
+    return catalog.cached_counts("ChromaDB", list(collection_names), count)
 
 
 def create_collection(collection_name):
-    CHROMA_CLIENT.create_collection(
+    get_chroma_client().create_collection(
         name=collection_name,
         metadata={"hnsw:space": "cosine"},  # l2 is the default
         # distance function are "l2", "ip, "or "cosine"
         )
+    catalog.invalidate("ChromaDB")
     for coll in list_collections():
         print(coll)
 
 
 def delete_collection(collection_name):
-    CHROMA_CLIENT.delete_collection(collection_name)
+    get_chroma_client().delete_collection(collection_name)
+    catalog.invalidate("ChromaDB")
+    get_manifest().remove_collection("ChromaDB", collection_name)
+    get_bm25_index().remove_collection("ChromaDB", collection_name)
     logger.info("Deleting Chroma Collection %s", collection_name)
 
 
 if __name__ == "__main__":
-    if CHROMA_CLIENT.heartbeat():
+    if get_chroma_client().heartbeat():
         list_collections()
     else:
         "Chroma Server Is not Running"
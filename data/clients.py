@@ -0,0 +1,148 @@
+import functools
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import Config
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+# Last heartbeat result per client name, read by the admin pages
+health = {}
+
+
+def configure_session(session, pool_size: int = None, retries: int = None, backoff: float = None, timeout: tuple = None) -> None:
+    """
+    configure_session Give a requests.Session a sized keep-alive pool, transport retries and default timeouts.
+
+    Connection failures are retried for every method since the request never reached the
+    server. Read and status (502/503/504) retries only apply to idempotent methods.
+    """
+    pool_size = pool_size or configs.STORE_POOL_SIZE
+    retries = configs.STORE_RETRIES if retries is None else retries
+    backoff = configs.STORE_RETRY_BACKOFF if backoff is None else backoff
+    timeout = timeout or (configs.STORE_CONNECT_TIMEOUT, configs.STORE_READ_TIMEOUT)
+    retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff,
+                  status_forcelist=(502, 503, 504), allowed_methods=Retry.DEFAULT_ALLOWED_METHODS, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if not getattr(session.request, "_default_timeout", False):
+        # Calls that pass their own timeout still override this one
+        request = functools.partial(session.request, timeout=timeout)
+        request._default_timeout = True
+        session.request = request
+
+
+def with_retry(func, *args, attempts: int = None, backoff: float = None, retry_on: tuple = (OSError,), **kwargs):
+    """
+    with_retry Call func, retrying on transport errors with exponential backoff and jitter.
+
+    Only wrap calls that are safe to repeat, such as searches and reads.
+    """
+    attempts = attempts or configs.STORE_RETRIES + 1
+    backoff = configs.STORE_RETRY_BACKOFF if backoff is None else backoff
+    for attempt in range(attempts):
+        try:
+            return func(*args, **kwargs)
+        except retry_on as e:
+            if attempt == attempts - 1:
+                raise
+            delay = backoff * 2 ** attempt * (1 + random.random())
+            logger.warning("%s failed (%s), retry %d/%d in %.2fs", getattr(func, "__name__", func), e, attempt + 1, attempts - 1, delay)
+            time.sleep(delay)
+
+
+def _chroma_client(url: str):
+    import chromadb
+    from chromadb.config import Settings as chroma_settings
+
+    # CHROMA_DB_URL is usually "host:port", but a full URL is accepted too
+    parsed = urlparse(url if "//" in url else f"http://{url}")
+    client = chromadb.HttpClient(host=parsed.hostname, port=str(parsed.port or 8000), ssl=parsed.scheme == "https",
+                                 settings=chroma_settings(anonymized_telemetry=False))
+    configure_session(client._session)
+    client.heartbeat()
+    return client
+
+
+def _weaviate_client(url: str):
+    import weaviate
+
+    client = weaviate.Client(url, timeout_config=(configs.STORE_CONNECT_TIMEOUT, configs.STORE_READ_TIMEOUT),
+                             startup_period=None)
+    configure_session(client._connection._session)
+    return client
+
+
+def _first_reachable(name: str, factory, urls: list[str]):
+    # Try the primary first, then the replica
+    error = None
+    for url in urls:
+        if not url:
+            continue
+        try:
+            client = factory(url)
+            logger.info("Connected %s to %s", name, url)
+            return client
+        except Exception as e:
+            logger.warning("%s at %s is unreachable: %s", name, url, e)
+            error = e
+    raise ConnectionError(f"No reachable {name}") from error
+
+
+def create_chroma_client():
+    return _first_reachable("Chroma", _chroma_client, [configs.CHROMA_DB_URL, configs.CHROMA_DB_REPLICA_URL])
+
+
+def create_weaviate_client():
+    return _first_reachable("Weaviate", _weaviate_client, [configs.WEAVIATE_URL, configs.WEAVIATE_REPLICA_URL])
+
+
+def chroma_is_healthy(client) -> bool:
+    return bool(client.heartbeat())
+
+
+def weaviate_is_healthy(client) -> bool:
+    return client.is_ready()
+
+
+def start_heartbeat(name: str, get_client, check, on_unhealthy, interval: float = None, failures: int = 2) -> threading.Thread:
+    """
+    start_heartbeat Check a client every interval seconds from a daemon thread.
+
+    After failures consecutive failed checks on_unhealthy is called, which lets the registry
+    drop the client so the next caller reconnects (to the replica if the primary is down).
+    """
+    interval = interval or configs.STORE_HEARTBEAT_INTERVAL
+
+    def beat():
+        failed = 0
+        while True:
+            time.sleep(interval)
+            client = get_client()
+            if client is None:
+                continue
+            try:
+                ok = check(client)
+            except Exception as e:
+                logger.debug("%s heartbeat error: %s", name, e)
+                ok = False
+            health[name] = {"healthy": ok, "checked": time.time()}
+            failed = 0 if ok else failed + 1
+            if failed >= failures:
+                logger.warning("%s failed %d heartbeats, reconnecting on next use", name, failed)
+                on_unhealthy()
+                failed = 0
+
+    thread = threading.Thread(target=beat, name=f"{name}-heartbeat", daemon=True)
+    thread.start()
+    return thread
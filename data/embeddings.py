@@ -0,0 +1,245 @@
+import atexit
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+from langchain.embeddings.base import Embeddings
+
+from config import Config
+from data.metrics import timed
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+# SQLite limits the number of bound parameters per statement
+_SQL_CHUNK = 500
+
+# Model loaded once per embedding worker process
+_worker_model = None
+
+
+class EmbeddingCache:
+    """
+     EmbeddingCache is an on-disk, content-addressed store for embedding vectors.
+
+     Vectors are keyed by the model name and a SHA-256 of the text and stored as packed
+     float32 blobs in SQLite. When the store grows past max_bytes the least recently used
+     vectors are evicted.
+    """
+
+    def __init__(self, path: str = None, max_bytes: int = None):
+        if path is None:
+            configs.CACHE_DIRECTORY.mkdir(parents=True, exist_ok=True)
+            path = configs.CACHE_DIRECTORY.joinpath("embeddings.sqlite3").as_posix()
+        if max_bytes is None:
+            max_bytes = configs.EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings ("
+                           "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        # Running total of the vector sizes, so a put does not sum the whole table
+        self._total = self._size_on_disk()
+
+    def _size_on_disk(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(namespace: str, text: str) -> str:
+        return hashlib.sha256(f"{namespace}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQL_CHUNK):
+                chunk = keys[start:start + _SQL_CHUNK]
+                rows = self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: dict[str, list[float]]) -> None:
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            blob = array("f", vector).tobytes()
+            rows.append((key, blob, len(blob), now))
+        with self._lock:
+            # Replaced vectors no longer count towards the total
+            keys = [row[0] for row in rows]
+            replaced = 0
+            for start in range(0, len(keys), _SQL_CHUNK):
+                chunk = keys[start:start + _SQL_CHUNK]
+                replaced += self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                                               chunk).fetchone()[0]
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)", rows)
+            self._total += sum(row[2] for row in rows) - replaced
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Other processes may share the file, so the running total is only a hint that eviction may be due
+        total = self._total = self._size_on_disk()
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% of the limit so eviction does not run on every insert
+        excess = total - int(self.max_bytes * 0.9)
+        stale = []
+        for key, size in self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_used"):
+            stale.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", stale)
+        self._total = self._size_on_disk()
+        logger.info("Embedding cache evicted %d vectors", len(stale))
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": size, }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._total = 0
+            self.hits = 0
+            self.misses = 0
+
+
+class CachedEmbeddings(Embeddings):
+    """
+     CachedEmbeddings wraps a LangChain Embeddings object and serves repeated texts from an EmbeddingCache.
+
+     Only texts that are not already cached for model_name are sent to the wrapped model.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache: EmbeddingCache = None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache if cache is not None else EmbeddingCache()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self.cache.make_key(self.model_name, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            with timed("embed", kind="document"):
+                computed = self.embeddings.embed_documents(list(missing.values()))
+            new_vectors = dict(zip(missing.keys(), computed))
+            self.cache.put_many(new_vectors)
+            vectors.update(new_vectors)
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        # Some models embed queries differently from documents, so queries get their own namespace
+        key = self.cache.make_key(f"{self.model_name}:query", text)
+        vectors = self.cache.get_many([key])
+        if key in vectors:
+            return vectors[key]
+        with timed("embed", kind="query"):
+            vector = self.embeddings.embed_query(text)
+        self.cache.put_many({key: vector})
+        return vector
+
+
+def _init_worker(model_name: str, batch_size: int) -> None:
+    global _worker_model
+    # Each process gets one core, parallelism comes from the pool
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    import torch
+    from langchain.embeddings import HuggingFaceEmbeddings
+    torch.set_num_threads(1)
+    _worker_model = HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"batch_size": batch_size})
+
+
+def _encode_batch(texts: list[str]) -> list[list[float]]:
+    return _worker_model.embed_documents(texts)
+
+
+class EmbeddingStage(Embeddings):
+    """
+     EmbeddingStage encodes document chunks in length-sorted batches across a pool of worker processes.
+
+     Sorting by length keeps texts of similar size in the same batch, which cuts padding. Jobs
+     that fit in a single batch are encoded in-process. The throughput of the last call is kept
+     in last_report.
+    """
+
+    def __init__(self, model_name: str, batch_size: int = None, workers: int = None):
+        self.model_name = model_name
+        self.batch_size = batch_size or configs.EMBEDDING_BATCH_SIZE
+        self.workers = workers or configs.EMBEDDING_WORKERS
+        self.last_report = None
+        self._model = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            from langchain.embeddings import HuggingFaceEmbeddings
+            self._model = HuggingFaceEmbeddings(model_name=self.model_name, encode_kwargs={"batch_size": self.batch_size})
+        return self._model
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn avoids forking the threads Streamlit and torch already started
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_init_worker,
+                                                 initargs=(self.model_name, self.batch_size))
+                atexit.register(self._pool.shutdown)
+        return self._pool
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        start = time.perf_counter()
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [[texts[i] for i in order[pos:pos + self.batch_size]] for pos in range(0, len(order), self.batch_size)]
+        if self.workers > 1 and len(batches) > 1:
+            results = self._get_pool().map(_encode_batch, batches)
+        else:
+            results = (self.model.embed_documents(batch) for batch in batches)
+        vectors = [None] * len(texts)
+        for index, vector in zip(order, chain.from_iterable(results)):
+            vectors[index] = vector
+        elapsed = time.perf_counter() - start
+        self.last_report = {"chunks": len(texts),
+                            "seconds": elapsed,
+                            "chunks_per_sec": len(texts) / elapsed if elapsed else 0.0,
+                            "batch_size": self.batch_size,
+                            "workers": self.workers if len(batches) > 1 else 1, }
+        logger.info("Embedded %d chunks in %.2fs (%.1f chunks/sec, %d workers)",
+                    len(texts), elapsed, self.last_report["chunks_per_sec"], self.last_report["workers"])
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.model.embed_query(text)
@@ -0,0 +1,45 @@
+import hashlib
+
+from langchain.docstore.document import Document
+
+
+def doc_key(doc: Document) -> str:
+    # The same chunk can live in several collections, so identity is its text and source file
+    payload = f"{doc.metadata.get('source', '')}\x00{doc.page_content}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(rankings: list[list[Document]], top_k: int, k: int = 60, identity=doc_key) -> list[tuple[Document, float]]:
+    """
+    reciprocal_rank_fusion Merge ranked lists by summing 1 / (k + rank) for every list a document appears in.
+
+    Only ranks are used, so lists from stores with incomparable score scales can be merged.
+    A document found by several lists is returned as it appears in the first of them.
+    """
+    scores, docs = {}, {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = identity(doc)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    ordered = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [(docs[key], scores[key]) for key in ordered]
+
+
+def normalized_score_fusion(results: list[list[tuple[Document, float]]], top_k: int) -> list[tuple[Document, float]]:
+    """
+    normalized_score_fusion Min-max normalize each list's relevance scores (higher is better) to [0, 1] and sum them per document.
+    """
+    scores, docs = {}, {}
+    for result in results:
+        if not result:
+            continue
+        values = [score for _, score in result]
+        low, high = min(values), max(values)
+        for doc, score in result:
+            key = doc_key(doc)
+            docs.setdefault(key, doc)
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            scores[key] = scores.get(key, 0.0) + normalized
+    ordered = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [(docs[key], scores[key]) for key in ordered]
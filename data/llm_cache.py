@@ -0,0 +1,165 @@
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Optional
+
+from langchain.cache import RETURN_VAL_TYPE, BaseCache
+from langchain.load.dump import dumps
+from langchain.load.load import loads
+
+from config import Config
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    # WAL lets several Streamlit workers read while one writes, busy_timeout makes writers wait instead of failing
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+def _default_path() -> str:
+    configs.CACHE_DIRECTORY.mkdir(parents=True, exist_ok=True)
+    return configs.CACHE_DIRECTORY.joinpath("llm_cache.sqlite3").as_posix()
+
+
+class _EvictingStore:
+    # Shared size and age eviction for the two cache tiers
+
+    table = None
+
+    def __init__(self, path: str = None, max_entries: int = None, max_age: float = None):
+        self.path = path or _default_path()
+        self.max_entries = max_entries if max_entries is not None else configs.LLM_CACHE_MAX_ENTRIES
+        self.max_age = max_age if max_age is not None else configs.LLM_CACHE_MAX_AGE_DAYS * 86400
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = _connect(self.path)
+
+    def _evict(self) -> None:
+        self._conn.execute(f"DELETE FROM {self.table} WHERE created < ?", (time.time() - self.max_age,))
+        count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE rowid IN "
+                               f"(SELECT rowid FROM {self.table} ORDER BY last_used LIMIT ?)", (count - self.max_entries,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries, }
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+
+class SQLiteLLMCache(_EvictingStore, BaseCache):
+    """
+     SQLiteLLMCache is a persistent exact-match LLM cache shared by every process using the same file.
+
+     Entries are keyed by a hash of the LLM settings string (model, temperature and the other
+     call parameters) and the full prompt, and are evicted by age and by count.
+    """
+
+    table = "llm_cache"
+
+    def __init__(self, path: str = None, max_entries: int = None, max_age: float = None):
+        super().__init__(path, max_entries, max_age)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS llm_cache ("
+                           "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or time.time() - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        return [loads(generation) for generation in json.loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        now = time.time()
+        response = json.dumps([dumps(generation) for generation in return_val])
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO llm_cache (key, response, created, last_used) VALUES (?, ?, ?, ?)",
+                               (self._key(prompt, llm_string), response, now, now))
+            self._evict()
+
+
+class SemanticAnswerCache(_EvictingStore):
+    """
+     SemanticAnswerCache returns a stored answer for a new question when a cached question was
+     asked with the same model settings, prompt and retrieved chunks and its embedding is within
+     max_distance (cosine distance).
+    """
+
+    table = "semantic_cache"
+
+    def __init__(self, path: str = None, max_distance: float = None, max_entries: int = None, max_age: float = None):
+        super().__init__(path, max_entries, max_age)
+        self.max_distance = max_distance if max_distance is not None else configs.LLM_SEMANTIC_CACHE_DISTANCE
+        self._conn.execute("CREATE TABLE IF NOT EXISTS semantic_cache ("
+                           "context_key TEXT NOT NULL, question TEXT NOT NULL, vector BLOB NOT NULL, answer TEXT NOT NULL, "
+                           "created REAL NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS semantic_cache_context ON semantic_cache (context_key)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS semantic_cache_last_used ON semantic_cache (last_used)")
+
+    @staticmethod
+    def context_key(model: str, temperature: float, prompt: str, chain_type: str, chunk_ids: list[str]) -> str:
+        payload = json.dumps([model, temperature, prompt, chain_type, sorted(chunk_ids)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _cosine_distance(a: array, b: list[float]) -> float:
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return 1.0 - dot / norm if norm else 1.0
+
+    def lookup(self, context_key: str, vector: list[float]) -> Optional[str]:
+        best_distance, best = None, None
+        with self._lock:
+            rows = self._conn.execute("SELECT rowid, vector, answer, created FROM semantic_cache WHERE context_key = ?", (context_key,))
+            for rowid, blob, answer, created in rows:
+                if time.time() - created > self.max_age:
+                    continue
+                cached = array("f")
+                cached.frombytes(blob)
+                distance = self._cosine_distance(cached, vector)
+                if distance <= self.max_distance and (best_distance is None or distance < best_distance):
+                    best_distance, best = distance, (rowid, answer)
+            if best is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE semantic_cache SET last_used = ? WHERE rowid = ?", (time.time(), best[0]))
+            self.hits += 1
+        logger.info("Semantic cache hit at distance %.4f", best_distance)
+        return best[1]
+
+    def update(self, context_key: str, question: str, vector: list[float], answer: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT INTO semantic_cache (context_key, question, vector, answer, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                               (context_key, question, array("f", vector).tobytes(), answer, now, now))
+            self._evict()
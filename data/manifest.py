@@ -0,0 +1,205 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Iterable
+
+from langchain.docstore.document import Document
+
+from config import Config
+from document_handling import batched
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+
+class DocumentManifest:
+    """
+     DocumentManifest records, for every collection, which files were ingested and which chunks
+     (by content hash) were written under which store ids.
+
+     It lets a re-load skip unchanged files, upsert only new chunks and delete removed ones,
+     and turns deleting a document into an id lookup.
+    """
+
+    # Metadata keys that are part of a chunk's hash, next to its text
+    HASHED_METADATA = ("source",)
+
+    def __init__(self, path: str = None):
+        if path is None:
+            configs.CACHE_DIRECTORY.mkdir(parents=True, exist_ok=True)
+            path = configs.CACHE_DIRECTORY.joinpath("manifest.sqlite3").as_posix()
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS documents ("
+                           "store TEXT NOT NULL, collection TEXT NOT NULL, source TEXT NOT NULL, file_hash TEXT NOT NULL, "
+                           "updated REAL NOT NULL, PRIMARY KEY (store, collection, source))")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS chunks ("
+                           "store TEXT NOT NULL, collection TEXT NOT NULL, source TEXT NOT NULL, chunk_hash TEXT NOT NULL, "
+                           "store_id TEXT NOT NULL, PRIMARY KEY (store, collection, source, chunk_hash))")
+        # Bumped on every write so caches of query results can tell when a collection changed, across processes
+        self._conn.execute("CREATE TABLE IF NOT EXISTS versions ("
+                           "store TEXT NOT NULL, collection TEXT NOT NULL, version INTEGER NOT NULL, PRIMARY KEY (store, collection))")
+
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        # ReadTheDocs sources are directories, hash every file below them in a stable order
+        path = Path(file_path)
+        files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+        digest = hashlib.sha256()
+        for file in files:
+            digest.update(file.relative_to(path).as_posix().encode("utf-8") if path.is_dir() else b"")
+            with open(file, "rb") as f:
+                while block := f.read(1 << 20):
+                    digest.update(block)
+        return digest.hexdigest()
+
+    @classmethod
+    def chunk_hash(cls, doc: Document) -> str:
+        # Only metadata that does not move when the rest of the file changes. Page numbers, page counts and
+        # token counts would give every chunk after an inserted page a new hash, and re-embed it.
+        metadata = {key: doc.metadata[key] for key in cls.HASHED_METADATA if key in doc.metadata}
+        payload = json.dumps([doc.page_content, metadata], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def chunk_id(store: str, collection: str, source: str, chunk_hash: str) -> str:
+        # Deterministic UUIDs, so re-writing a chunk replaces it instead of duplicating it
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{store}/{collection}/{source}/{chunk_hash}"))
+
+    def get_version(self, store: str, collection: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM versions WHERE store = ? AND collection = ?", (store, collection)).fetchone()
+        return row[0] if row else 0
+
+    def bump_version(self, store: str, collection: str) -> None:
+        with self._lock:
+            self._bump_version(store, collection)
+
+    def _bump_version(self, store: str, collection: str) -> None:
+        self._conn.execute("INSERT INTO versions (store, collection, version) VALUES (?, ?, 1) "
+                           "ON CONFLICT (store, collection) DO UPDATE SET version = version + 1", (store, collection))
+
+    def get_file_hash(self, store: str, collection: str, source: str) -> str:
+        with self._lock:
+            row = self._conn.execute("SELECT file_hash FROM documents WHERE store = ? AND collection = ? AND source = ?",
+                                     (store, collection, source)).fetchone()
+        return row[0] if row else None
+
+    def set_file_hash(self, store: str, collection: str, source: str, file_hash: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO documents (store, collection, source, file_hash, updated) VALUES (?, ?, ?, ?, ?)",
+                               (store, collection, source, file_hash, time.time()))
+
+    def get_chunks(self, store: str, collection: str, source: str) -> dict[str, str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_hash, store_id FROM chunks WHERE store = ? AND collection = ? AND source = ?",
+                                      (store, collection, source)).fetchall()
+        return dict(rows)
+
+    def add_chunks(self, store: str, collection: str, source: str, chunks: Iterable[tuple[str, str]]) -> None:
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO chunks (store, collection, source, chunk_hash, store_id) VALUES (?, ?, ?, ?, ?)",
+                                   [(store, collection, source, chunk_hash, store_id) for chunk_hash, store_id in chunks])
+            self._bump_version(store, collection)
+
+    def remove_chunks(self, store: str, collection: str, source: str, chunk_hashes: Iterable[str]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE store = ? AND collection = ? AND source = ? AND chunk_hash = ?",
+                                   [(store, collection, source, chunk_hash) for chunk_hash in chunk_hashes])
+            self._bump_version(store, collection)
+
+    def remove_document(self, store: str, collection: str, source: str) -> list[str]:
+        """
+        remove_document Forget a document and return the store ids of its chunks so the caller can delete them.
+        """
+        with self._lock:
+            ids = [row[0] for row in self._conn.execute("SELECT store_id FROM chunks WHERE store = ? AND collection = ? AND source = ?",
+                                                        (store, collection, source))]
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM chunks WHERE store = ? AND collection = ? AND source = ?", (store, collection, source))
+            self._conn.execute("DELETE FROM documents WHERE store = ? AND collection = ? AND source = ?", (store, collection, source))
+            self._bump_version(store, collection)
+            self._conn.execute("COMMIT")
+        return ids
+
+    def forget_ids(self, store: str, collection: str, store_ids: list[str]) -> None:
+        """
+        forget_ids Drop chunks deleted outside the manifest and mark their documents for a full re-sync.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            for store_id in store_ids:
+                row = self._conn.execute("SELECT source FROM chunks WHERE store = ? AND collection = ? AND store_id = ?",
+                                         (store, collection, store_id)).fetchone()
+                if row:
+                    self._conn.execute("DELETE FROM chunks WHERE store = ? AND collection = ? AND store_id = ?", (store, collection, store_id))
+                    self._conn.execute("DELETE FROM documents WHERE store = ? AND collection = ? AND source = ?", (store, collection, row[0]))
+            self._bump_version(store, collection)
+            self._conn.execute("COMMIT")
+
+    def remove_collection(self, store: str, collection: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM chunks WHERE store = ? AND collection = ?", (store, collection))
+            self._conn.execute("DELETE FROM documents WHERE store = ? AND collection = ?", (store, collection))
+            self._bump_version(store, collection)
+            self._conn.execute("COMMIT")
+
+    def documents(self, store: str, collection: str) -> list[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT source FROM documents WHERE store = ? AND collection = ? ORDER BY source", (store, collection))
+            return [row[0] for row in rows]
+
+
+def sync_document(manifest: DocumentManifest, store: str, collection: str, source: str, file_path: str,
+                  load_chunks: Callable[[], Iterable[Document]], add_chunks: Callable[[list[Document], list[str]], None],
+                  delete_ids: Callable[[list[str]], None], batch_size: int = None, file_hash: str = None) -> dict:
+    """
+    sync_document Bring one file's chunks in a collection in line with the file on disk.
+
+    Unchanged files are skipped without loading them. Otherwise only chunks whose hash is not in
+    the manifest are passed to add_chunks (in batches, with deterministic ids), and chunks that
+    disappeared from the file are passed to delete_ids.
+    """
+    # Callers that already hashed the file pass its hash, so it is read once
+    file_hash = file_hash or manifest.file_hash(file_path)
+    if manifest.get_file_hash(store, collection, source) == file_hash:
+        logger.info("%s is unchanged in %s %s, skipping", source, store, collection)
+        return {"source": source, "unchanged": True, "added": 0, "deleted": 0, "kept": 0}
+
+    existing = manifest.get_chunks(store, collection, source)
+    seen = set()
+
+    def new_chunks():
+        for doc in load_chunks():
+            chunk_hash = manifest.chunk_hash(doc)
+            if chunk_hash in seen:
+                continue
+            seen.add(chunk_hash)
+            if chunk_hash not in existing:
+                yield chunk_hash, doc
+
+    added = 0
+    for batch in batched(new_chunks(), batch_size or configs.INGEST_BATCH_SIZE):
+        ids = [manifest.chunk_id(store, collection, source, chunk_hash) for chunk_hash, _ in batch]
+        add_chunks([doc for _, doc in batch], ids)
+        manifest.add_chunks(store, collection, source, zip([chunk_hash for chunk_hash, _ in batch], ids))
+        added += len(batch)
+
+    removed = {chunk_hash: store_id for chunk_hash, store_id in existing.items() if chunk_hash not in seen}
+    if removed:
+        delete_ids(list(removed.values()))
+        manifest.remove_chunks(store, collection, source, removed.keys())
+    manifest.set_file_hash(store, collection, source, file_hash)
+    result = {"source": source, "unchanged": False, "added": added, "deleted": len(removed), "kept": len(seen) - added}
+    logger.info("Synced %s to %s %s: %s", source, store, collection, result)
+    return result
@@ -0,0 +1,121 @@
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from config import Config
+from data.packing import count_tokens
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+# Summaries are written off the request path, by a few threads shared by every session
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+
+
+class SessionMemory:
+    """
+     SessionMemory is the conversation history of one session, kept under max_tokens.
+
+     Recent turns are kept verbatim. When they exceed the budget the oldest are handed to summarizer
+     in a background thread and folded into a running summary, so saving a turn never waits on an LLM.
+     Without a summarizer the oldest turns are dropped. Every method is thread safe.
+
+     It has the load_memory_variables / save_context / clear interface of a LangChain memory,
+     with the same "history" string, so the prompts need no change.
+    """
+
+    memory_key = "history"
+    input_key = "question"
+
+    def __init__(self, max_tokens: int = None, summarizer: Optional[Callable[[str, str], str]] = None):
+        self.max_tokens = configs.MEMORY_TOKEN_LIMIT if max_tokens is None else max_tokens
+        self.summarizer = summarizer
+        self._lock = threading.Lock()
+        self._turns = deque()  # (lines, tokens)
+        self._turn_tokens = 0
+        self._summary = ""
+        self._summary_tokens = 0
+        self._pending = []
+        self._generation = 0  # Bumped by clear, so a summary of cleared turns is discarded
+        self._summarizing = False
+        self._future: Optional[Future] = None
+
+    @staticmethod
+    def _lines(question: str, answer: str) -> str:
+        return f"Human: {question}\nAI: {answer}"
+
+    def load_memory_variables(self, inputs: dict = None) -> dict:
+        with self._lock:
+            parts = [f"System: Summary of the earlier conversation: {self._summary}"] if self._summary else []
+            parts.extend(lines for lines, _ in self._turns)
+        return {self.memory_key: "\n".join(parts)}
+
+    def save_context(self, inputs: dict, outputs: dict) -> None:
+        lines = self._lines(inputs[self.input_key], next(iter(outputs.values())))
+        tokens = count_tokens(lines)
+        with self._lock:
+            self._turns.append((lines, tokens))
+            self._turn_tokens += tokens
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._turns.clear()
+            self._turn_tokens = 0
+            self._summary = ""
+            self._summary_tokens = 0
+            self._pending = []
+            self._summarizing = False
+            self._future = None
+
+    def tokens(self) -> int:
+        with self._lock:
+            return self._summary_tokens + self._turn_tokens
+
+    def wait(self, timeout: float = None) -> None:
+        # Block until pending turns are summarized, for tests and shutdown
+        future = self._future
+        if future is not None:
+            future.result(timeout)
+
+    def _evict(self) -> None:
+        # Called with the lock held
+        while self._turns and self._summary_tokens + self._turn_tokens > self.max_tokens:
+            lines, tokens = self._turns.popleft()
+            self._turn_tokens -= tokens
+            if self.summarizer is not None:
+                self._pending.append(lines)
+        if self._pending and not self._summarizing:
+            self._summarizing = True
+            self._future = _executor.submit(self._summarize, self._generation)
+
+    def _summarize(self, generation: int) -> None:
+        while True:
+            with self._lock:
+                if generation != self._generation:
+                    return
+                if not self._pending:
+                    self._summarizing = False
+                    return
+                new_lines, self._pending = "\n".join(self._pending), []
+                summary = self._summary
+            try:
+                summary = self.summarizer(summary, new_lines)
+            except Exception as e:
+                # The turns are lost, but the conversation goes on with the previous summary
+                logger.warning("Conversation summary failed: %s", e)
+            with self._lock:
+                if generation != self._generation:
+                    return
+                self._summary = summary
+                self._summary_tokens = count_tokens(summary)
+                # A longer summary leaves less room for turns, which may evict more of them into _pending
+                while self._turns and self._summary_tokens + self._turn_tokens > self.max_tokens:
+                    lines, tokens = self._turns.popleft()
+                    self._turn_tokens -= tokens
+                    self._pending.append(lines)
@@ -0,0 +1,309 @@
+import json
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+from config import Config
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# The request being traced by the current thread or task
+_current = ContextVar("metrics_request", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RequestTrace:
+    """
+     RequestTrace collects the stage timings and token counts of one query or ingest.
+
+     Stages that run more than once in a request (several LLM calls, several batches) are summed.
+    """
+
+    def __init__(self, kind: str, **labels):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.labels = labels
+        self.start = time.perf_counter()
+        self.timestamp = time.time()
+        self.stages = defaultdict(float)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.error = None
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] += seconds
+
+    def add_first(self, stage: str, seconds: float) -> None:
+        # Only the first occurrence counts, for time to first token
+        with self._lock:
+            self.stages.setdefault(stage, seconds)
+
+    def add_tokens(self, prompt: int, completion: int) -> None:
+        with self._lock:
+            self.prompt_tokens += prompt
+            self.completion_tokens += completion
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "timestamp": self.timestamp, "kind": self.kind, **self.labels,
+                "stages": dict(self.stages), "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens, "error": self.error}
+
+
+class Metrics:
+    """
+     Metrics holds process-wide latency histograms and token counters, plus the most recent request traces.
+
+     Histograms are cumulative since process start and exported in the Prometheus text format.
+     Each finished trace is also appended to a JSON lines file when one is configured.
+    """
+
+    def __init__(self, jsonl_path: str = None, recent: int = 1000):
+        self.jsonl_path = jsonl_path
+        self.recent = deque(maxlen=recent)
+        self._histograms = {}
+        self._counters = defaultdict(float)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return (name, tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None)))
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            histogram[0][bisect_left(BUCKETS, seconds)] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        with self._lock:
+            self._counters[self._key(name, labels)] += value
+
+    def record(self, trace: RequestTrace) -> None:
+        entry = trace.to_dict()
+        with self._lock:
+            self.recent.append(entry)
+        if self.jsonl_path:
+            try:
+                path = Path(self.jsonl_path)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                if path.exists() and path.stat().st_size > configs.METRICS_JSONL_MAX_MB * 1024 * 1024:
+                    path.replace(path.with_suffix(path.suffix + ".1"))
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, default=str) + "\n")
+            except OSError as e:
+                logger.warning("Could not write metrics to %s: %s", self.jsonl_path, e)
+
+    def recent_traces(self) -> list[dict]:
+        # A copy, since other sessions append while the caller iterates
+        with self._lock:
+            return list(self.recent)
+
+    @staticmethod
+    def _labels(labels: Iterable[tuple], **extra) -> str:
+        pairs = list(labels) + list(extra.items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+    def prometheus(self) -> str:
+        """
+        prometheus Every histogram and counter in the Prometheus text exposition format.
+        """
+        with self._lock:
+            histograms = {key: ([*value[0]], value[1], value[2]) for key, value in self._histograms.items()}
+            counters = dict(self._counters)
+        lines, typed = [], set()
+        for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+            metric = f"langchain_lab_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, buckets):
+                cumulative += bucket_count
+                lines.append(f"{metric}_bucket{self._labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{metric}_bucket{self._labels(labels, le='+Inf')} {count}")
+            lines.append(f"{metric}_sum{self._labels(labels)} {total}")
+            lines.append(f"{metric}_count{self._labels(labels)} {count}")
+        for (name, labels), value in sorted(counters.items()):
+            metric = f"langchain_lab_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{self._labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.recent.clear()
+
+
+metrics = Metrics(configs.METRICS_JSONL or None)
+
+
+@contextmanager
+def trace_request(kind: str, **labels) -> Iterator[RequestTrace]:
+    """
+    trace_request Trace one query or ingest. Stages timed inside it, in this thread or in tasks and threads started from it, are added to the trace.
+    """
+    trace = RequestTrace(kind, **labels)
+    token = _current.set(trace)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.error = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        total = time.perf_counter() - trace.start
+        trace.add("total", total)
+        metrics.observe("request_seconds", total, kind=kind, **labels)
+        metrics.record(trace)
+
+
+def observe(stage: str, seconds: float, **labels) -> None:
+    metrics.observe("stage_seconds", seconds, stage=stage, **labels)
+    trace = _current.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str, **labels) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start, **labels)
+
+
+def timed_iter(iterable: Iterable, stage: str, **labels) -> Iterator:
+    """
+    timed_iter Yield from iterable, timing only the work done to produce each item and recording it once at the end.
+    """
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        observe(stage, elapsed, **labels)
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+     MetricsCallbackHandler records LLM latency, time to first token and token counts for each LLM call.
+
+     It runs inline in the calling task, so it sees the request being traced and adds no thread hop per token.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._runs = {}
+
+    def _start(self, run_id, serialized: dict, texts: list[str], **kwargs) -> None:
+        from data.packing import count_tokens  # tiktoken is only loaded once an LLM is called
+        model = (kwargs.get("invocation_params") or {}).get("model_name") or (kwargs.get("invocation_params") or {}).get("model")
+        self._runs[run_id] = {"start": time.perf_counter(), "trace": _current.get(), "model": model, "first_token": None,
+                              "prompt_tokens": sum(count_tokens(text) for text in texts)}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        self._start(run_id, serialized, prompts, **kwargs)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self._start(run_id, serialized, [message.content for batch in messages for message in batch], **kwargs)
+
+    def on_llm_new_token(self, token: str, *, run_id, **kwargs) -> None:
+        run = self._runs.get(run_id)
+        if run is not None and run["first_token"] is None:
+            run["first_token"] = time.perf_counter() - run["start"]
+            metrics.observe("stage_seconds", run["first_token"], stage="first_token", model=run["model"])
+            if run["trace"] is not None:
+                run["trace"].add_first("first_token", run["first_token"])
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        from data.packing import count_tokens
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        seconds = time.perf_counter() - run["start"]
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens") or run["prompt_tokens"]
+        completion_tokens = usage.get("completion_tokens") or sum(count_tokens(generation.text)
+                                                                  for generations in response.generations for generation in generations)
+        metrics.observe("stage_seconds", seconds, stage="llm", model=run["model"])
+        metrics.inc("tokens_total", prompt_tokens, type="prompt", model=run["model"])
+        metrics.inc("tokens_total", completion_tokens, type="completion", model=run["model"])
+        if run["trace"] is not None:
+            run["trace"].add("llm", seconds)
+            run["trace"].add_tokens(prompt_tokens, completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._runs.pop(run_id, None)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = metrics.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+
+
+def serve(port: int) -> None:
+    """
+    serve Expose the Prometheus metrics over HTTP on port from a daemon thread. Only the first call starts a server.
+    """
+    global _server
+    if _server is not None:
+        return
+    try:
+        _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsRequestHandler)
+    except OSError as e:
+        logger.warning("Metrics server not started on port %d: %s", port, e)
+        return
+    threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Serving metrics on port %d", port)
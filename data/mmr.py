@@ -0,0 +1,76 @@
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.vectorstores import Chroma, Weaviate
+
+from config import Config
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+
+def mmr_select(query_vector, candidate_vectors, k: int = 4, lambda_mult: float = 0.5) -> list[int]:
+    """
+    mmr_select Return the indexes of the k candidates chosen by maximal marginal relevance, in selection order.
+
+    Each step picks the candidate maximizing lambda_mult * sim(query) - (1 - lambda_mult) * max sim(selected),
+    using cosine similarity. All pairwise similarities come from one matrix product, so each step is
+    a vector update instead of a loop over candidates.
+    """
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    if not len(candidates) or k <= 0:
+        return []
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    query_similarity = candidates @ query
+    pairwise = candidates @ candidates.T
+
+    selected = [int(np.argmax(query_similarity))]
+    redundancy = pairwise[selected[0]].copy()  # Highest similarity of each candidate to anything selected so far
+    available = np.ones(len(candidates), dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * query_similarity - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return selected
+
+
+def fetch_candidates(db, embedding: list[float], fetch_k: int, filter: dict = None) -> tuple[list[Document], np.ndarray]:
+    """
+    fetch_candidates Return the fetch_k nearest documents and their stored vectors from one request to the store.
+    """
+    if isinstance(db, Chroma):
+        result = db._collection.query(query_embeddings=[embedding], n_results=fetch_k, where=filter or None,
+                                      include=["documents", "metadatas", "embeddings"])
+        docs = [Document(page_content=text, metadata=metadata or {}) for text, metadata in zip(result["documents"][0], result["metadatas"][0])]
+        return docs, np.asarray(result["embeddings"][0], dtype=np.float32)
+    if isinstance(db, Weaviate):
+        query = db._client.query.get(db._index_name, db._query_attrs)
+        if filter:
+            query = query.with_where(filter)
+        result = query.with_additional("vector").with_near_vector({"vector": embedding}).with_limit(fetch_k).do()
+        if "errors" in result:
+            raise ValueError(f"Error during query: {result['errors']}")
+        docs, vectors = [], []
+        for obj in result["data"]["Get"][db._index_name]:
+            vectors.append(obj.pop("_additional")["vector"])
+            docs.append(Document(page_content=obj.pop(db._text_key), metadata=obj))
+        return docs, np.asarray(vectors, dtype=np.float32)
+    if hasattr(db, "candidates"):
+        return db.candidates(embedding, fetch_k, filter)
+    raise TypeError(f"MMR is not supported for {type(db).__name__}.")
+
+
+def mmr_search(db, embedding: list[float], k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, filter: dict = None) -> list[Document]:
+    """
+    mmr_search Maximal marginal relevance search that behaves the same on every store.
+    """
+    docs, vectors = fetch_candidates(db, embedding, max(fetch_k, k), filter)
+    return [docs[i] for i in mmr_select(embedding, vectors, k, lambda_mult)]
@@ -0,0 +1,99 @@
+import shutil
+
+from config import Config
+from data.manifest import sync_document
+from data.metrics import timed, trace_request
+from data.numpy_store import NumpyVectorStore
+from data.registry import (get_bm25_index, get_embedding_function,
+                           get_manifest, get_or_create, reset)
+from document_handling import DocumentHandling
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+# Document Loaders and handling
+handler = DocumentHandling()
+
+
+def numpy_vectordb(collection_name: str) -> NumpyVectorStore:
+    # One store per collection per process, so the memory map is shared by every session
+    db = get_or_create(f"numpy_store:{collection_name}",
+                       lambda: NumpyVectorStore(configs.NUMPY_STORE_DIRECTORY, get_embedding_function(), collection_name))
+    logger.debug("Accessing NumPy Collection %s", collection_name)
+    return db
+
+
+def numpy_create_vectordb(filename: str, collection_name: str, stream: bool = True, batch_size: int = None) -> NumpyVectorStore:
+    load_chunks = (lambda: handler.stream_loader(filename)) if stream else (lambda: handler.get_loader(filename))
+    numpy_add_documents(filename, collection_name, load_chunks, handler.doc_directory.joinpath(filename).as_posix(), batch_size)
+    return numpy_vectordb(collection_name)
+
+
+def numpy_add_documents(source: str, collection_name: str, load_chunks, file_path: str, batch_size: int = None,
+                        file_hash: str = None) -> dict:
+    db = numpy_vectordb(collection_name)
+    with trace_request("ingest", store="NumPy", collection=collection_name):
+        result = sync_document(get_manifest(), "NumPy", collection_name, source, file_path,
+                               load_chunks=load_chunks,
+                               add_chunks=lambda docs, ids: _add_chunks(db, collection_name, docs, ids),
+                               delete_ids=lambda ids: _delete_ids(collection_name, ids),
+                               batch_size=batch_size, file_hash=file_hash)
+    logger.info("Loaded %s to NumPy Collection %s (%d added, %d deleted)", source, collection_name, result["added"], result["deleted"])
+    return result
+
+
+def _add_chunks(db: NumpyVectorStore, collection_name: str, docs: list, ids: list[str]) -> None:
+    with timed("upsert", store="NumPy"):
+        db.add_documents(docs, ids=ids)
+        get_bm25_index().add("NumPy", collection_name, docs, ids)
+
+
+def _delete_ids(collection_name: str, ids: list[str]) -> None:
+    numpy_vectordb(collection_name).delete(ids)
+    get_bm25_index().delete("NumPy", collection_name, ids)
+
+
+def numpy_delete_source(source: str, collection_name: str) -> int:
+    # Every chunk whose "source" metadata is source, in one update of the row table
+    ids = numpy_vectordb(collection_name).delete_where({"source": source})
+    if ids:
+        get_bm25_index().delete("NumPy", collection_name, ids)
+        get_manifest().forget_ids("NumPy", collection_name, ids)
+    return len(ids)
+
+
+def numpy_delete_document(filename: str, collection_name: str) -> int:
+    deleted = numpy_delete_source(handler.doc_directory.joinpath(filename).as_posix(), collection_name)
+    ids = get_manifest().remove_document("NumPy", collection_name, filename)
+    if ids:
+        _delete_ids(collection_name, ids)
+    logger.info("Deleted %d chunks of %s from NumPy Collection %s", deleted + len(ids), filename, collection_name)
+    return deleted + len(ids)
+
+
+def numpy_replace_document(filename: str, collection_name: str, batch_size: int = None) -> dict:
+    deleted = numpy_delete_document(filename, collection_name)
+    result = numpy_add_documents(filename, collection_name, lambda: handler.stream_loader(filename),
+                                 handler.doc_directory.joinpath(filename).as_posix(), batch_size)
+    return dict(result, deleted=deleted)
+
+
+def numpy_list_collections() -> list[str]:
+    if not configs.NUMPY_STORE_DIRECTORY.exists():
+        return []
+    return sorted(path.name for path in configs.NUMPY_STORE_DIRECTORY.iterdir() if path.is_dir())
+
+
+def numpy_create_collection(collection_name: str) -> None:
+    numpy_vectordb(collection_name)
+
+
+def numpy_delete_collection(collection_name: str) -> None:
+    reset(f"numpy_store:{collection_name}")
+    shutil.rmtree(configs.NUMPY_STORE_DIRECTORY.joinpath(collection_name), ignore_errors=True)
+    get_manifest().remove_collection("NumPy", collection_name)
+    get_bm25_index().remove_collection("NumPy", collection_name)
+    logger.info("Deleting NumPy Collection %s", collection_name)
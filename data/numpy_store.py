@@ -0,0 +1,294 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores.base import VectorStore
+
+from config import Config
+from data.mmr import mmr_select
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+
+class NumpyVectorStore(VectorStore):
+    """
+     NumpyVectorStore keeps a collection in one directory: vectors.f32, a memory-mapped float32
+     matrix of unit-length embeddings with one row per chunk, and rows.sqlite3, which holds each
+     row's id, text, metadata and deleted flag.
+
+     Search is an exact top-k over the whole matrix with one NumPy dot product. Scores are cosine
+     distances, the same as a Chroma collection created with "hnsw:space": "cosine".
+    """
+
+    VECTOR_FILE = "vectors.f32"
+    ROWS_FILE = "rows.sqlite3"
+
+    def __init__(self, directory: str, embedding: Embeddings, collection_name: str):
+        self.directory = Path(directory).joinpath(collection_name)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.collection_name = collection_name
+        self._embedding = embedding
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.directory.joinpath(self.ROWS_FILE).as_posix(), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS rows ("
+                           "row INTEGER PRIMARY KEY, id TEXT NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL, deleted INTEGER NOT NULL DEFAULT 0)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS rows_id ON rows (id)")
+        # dim, and generation, which is bumped by every write so readers in any process know to remap
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._snapshot = (None, None, None)  # (generation, matrix, live row mask)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def _meta(self, key: str) -> Optional[int]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _bump_generation(self) -> None:
+        self._conn.execute("INSERT INTO meta (key, value) VALUES ('generation', 1) "
+                           "ON CONFLICT (key) DO UPDATE SET value = value + 1")
+
+    def _load(self) -> tuple:
+        # Reuse the mapping until another write changes the generation
+        with self._lock:
+            generation = self._meta("generation")
+            if generation == self._snapshot[0]:
+                return self._snapshot
+            dim = self._meta("dim")
+            count = self._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+            if not count:
+                self._snapshot = (generation, np.zeros((0, dim or 0), dtype=np.float32), np.zeros(0, dtype=bool))
+                return self._snapshot
+            matrix = np.memmap(self.directory.joinpath(self.VECTOR_FILE), dtype=np.float32, mode="r", shape=(count, dim))
+            live = np.ones(count, dtype=bool)
+            deleted = [row for row, in self._conn.execute("SELECT row FROM rows WHERE deleted = 1")]
+            live[deleted] = False
+            self._snapshot = (generation, matrix, live)
+            return self._snapshot
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[list[dict]] = None, ids: Optional[list[str]] = None, **kwargs: Any) -> list[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_vectors(texts, self._embedding.embed_documents(texts), metadatas, ids)
+
+    def add_vectors(self, texts: list[str], vectors, metadatas: Optional[list[dict]] = None, ids: Optional[list[str]] = None) -> list[str]:
+        """
+        add_vectors Add chunks with embeddings computed elsewhere, such as a snapshot of another collection.
+        """
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        vectors = self._normalize(vectors)
+        with self._lock:
+            dim = self._meta("dim")
+            if dim is None:
+                dim = vectors.shape[1]
+                self._conn.execute("INSERT INTO meta (key, value) VALUES ('dim', ?)", (dim,))
+            elif dim != vectors.shape[1]:
+                raise ValueError(f"Collection {self.collection_name} holds {dim}-dimensional vectors, got {vectors.shape[1]}.")
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Re-adding an id replaces it, the same as a Chroma or Weaviate upsert
+                self._conn.executemany("UPDATE rows SET deleted = 1 WHERE id = ?", [(id_,) for id_ in ids])
+                start = self._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+                self._conn.executemany("INSERT INTO rows (row, id, text, metadata) VALUES (?, ?, ?, ?)",
+                                       [(start + i, id_, text, json.dumps(metadata, default=str))
+                                        for i, (id_, text, metadata) in enumerate(zip(ids, texts, metadatas))])
+                with open(self.directory.joinpath(self.VECTOR_FILE), "r+b" if start else "wb") as f:
+                    # Truncate any tail left by a write that failed before its rows were committed
+                    f.truncate(start * dim * 4)
+                    f.seek(start * dim * 4)
+                    f.write(vectors.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._bump_generation()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def delete(self, ids: Optional[list[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany("UPDATE rows SET deleted = 1 WHERE id = ? AND deleted = 0", [(id_,) for id_ in ids])
+            self._bump_generation()
+            self._conn.execute("COMMIT")
+            dead, total = self._conn.execute("SELECT SUM(deleted), COUNT(*) FROM rows").fetchone()
+            if total and dead * 2 > total:
+                self.compact()
+        return True
+
+    def delete_where(self, filter: dict) -> list[str]:
+        """
+        delete_where Delete every live chunk whose metadata matches filter (equality on top-level keys) and return their ids.
+        """
+        clauses = " AND ".join("json_extract(metadata, ?) = ?" for _ in filter)
+        params = [value for key, val in filter.items() for value in (f'$."{key}"', val)]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [id_ for id_, in self._conn.execute(f"SELECT id FROM rows WHERE deleted = 0 AND {clauses}", params)]
+                if ids:
+                    self._conn.execute(f"UPDATE rows SET deleted = 1 WHERE deleted = 0 AND {clauses}", params)
+                    self._bump_generation()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            dead, total = self._conn.execute("SELECT SUM(deleted), COUNT(*) FROM rows").fetchone()
+            if total and dead * 2 > total:
+                self.compact()
+        return ids
+
+    def compact(self) -> None:
+        """
+        compact Rewrite the matrix and row table without deleted rows.
+        """
+        with self._lock:
+            _, matrix, live = self._load()
+            keep = np.flatnonzero(live)
+            tmp_path = self.directory.joinpath(self.VECTOR_FILE + ".tmp")
+            with open(tmp_path, "wb") as f:
+                for start in range(0, len(keep), 65536):
+                    f.write(np.ascontiguousarray(matrix[keep[start:start + 65536]]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM rows WHERE deleted = 1")
+                self._conn.execute("CREATE TEMP TABLE renumber AS SELECT row AS old, ROW_NUMBER() OVER (ORDER BY row) - 1 AS new FROM rows")
+                # Negate first so the new numbers never collide with old ones during the update
+                self._conn.execute("UPDATE rows SET row = -1 - (SELECT new FROM renumber WHERE old = rows.row)")
+                self._conn.execute("UPDATE rows SET row = -1 - row")
+                self._conn.execute("DROP TABLE renumber")
+                os.replace(tmp_path, self.directory.joinpath(self.VECTOR_FILE))
+                self._bump_generation()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            logger.info("Compacted NumPy collection %s to %d rows", self.collection_name, len(keep))
+
+    def _filter_mask(self, filter: dict, size: int) -> np.ndarray:
+        # Equality on top-level metadata keys, like a simple Chroma where filter
+        mask = np.zeros(size, dtype=bool)
+        clauses = " AND ".join("json_extract(metadata, ?) = ?" for _ in filter)
+        params = [value for key, val in filter.items() for value in (f'$."{key}"', val)]
+        rows = [row for row, in self._conn.execute(f"SELECT row FROM rows WHERE deleted = 0 AND {clauses}", params)]
+        mask[[row for row in rows if row < size]] = True
+        return mask
+
+    def _top_rows(self, embedding, k: int, filter: Optional[dict] = None) -> tuple:
+        """
+        _top_rows Return (rows, cosine similarities, matrix) for the k nearest live rows, best first.
+        """
+        _, matrix, live = self._load()
+        if filter:
+            with self._lock:
+                live = live & self._filter_mask(filter, len(live))
+        if not live.any():
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), matrix
+        query = self._normalize(embedding)
+        similarities = matrix @ query
+        similarities[~live] = -np.inf
+        k = min(k, int(live.sum()))
+        rows = np.argpartition(-similarities, k - 1)[:k]
+        rows = rows[np.argsort(-similarities[rows])]
+        return rows, similarities[rows], matrix
+
+    def _documents(self, rows) -> list[Document]:
+        with self._lock:
+            found = {row: (text, metadata) for row, text, metadata in self._conn.execute(
+                f"SELECT row, text, metadata FROM rows WHERE row IN ({','.join('?' * len(rows))})", [int(row) for row in rows])}
+        return [Document(page_content=found[row][0], metadata=json.loads(found[row][1])) for row in rows]
+
+    def similarity_search_by_vector_with_score(self, embedding: list[float], k: int = 4, filter: Optional[dict] = None) -> list[tuple]:
+        rows, similarities, _ = self._top_rows(embedding, k, filter)
+        return list(zip(self._documents(rows), (1.0 - similarities).tolist()))
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any) -> list[tuple]:
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, filter: Optional[dict] = None, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        return self._cosine_relevance_score_fn
+
+    def max_marginal_relevance_search_by_vector(self, embedding: list[float], k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5,
+                                                filter: Optional[dict] = None, **kwargs: Any) -> list[Document]:
+        docs, vectors = self.candidates(embedding, fetch_k, filter)
+        return [docs[i] for i in mmr_select(embedding, vectors, k, lambda_mult)]
+
+    def candidates(self, embedding: list[float], fetch_k: int, filter: Optional[dict] = None) -> tuple[list[Document], np.ndarray]:
+        # The fetch_k nearest documents with their vectors, for data.mmr
+        rows, _, matrix = self._top_rows(embedding, fetch_k, filter)
+        return self._documents(rows), np.asarray(matrix[rows])
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5,
+                                      filter: Optional[dict] = None, **kwargs: Any) -> list[Document]:
+        return self.max_marginal_relevance_search_by_vector(self._embedding.embed_query(query), k, fetch_k, lambda_mult, filter)
+
+    def iter_chunks(self, batch_size: int = 1000):
+        # Every live chunk as (ids, documents) batches
+        last_row = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute("SELECT row, id, text, metadata FROM rows WHERE deleted = 0 AND row > ? ORDER BY row LIMIT ?",
+                                          (last_row, batch_size)).fetchall()
+            if not rows:
+                return
+            yield [id_ for _, id_, _, _ in rows], [Document(page_content=text, metadata=json.loads(metadata)) for _, _, text, metadata in rows]
+            last_row = rows[-1][0]
+
+    def iter_vectors(self, batch_size: int = 1000):
+        # Every live chunk as (ids, documents, vectors) batches, vectors as a float32 array
+        last_row = -1
+        while True:
+            with self._lock:
+                # Rows and matrix are read together, so a compaction can not renumber rows in between
+                matrix = self._load()[1]
+                rows = self._conn.execute("SELECT row, id, text, metadata FROM rows WHERE deleted = 0 AND row > ? ORDER BY row LIMIT ?",
+                                          (last_row, batch_size)).fetchall()
+                vectors = np.array(matrix[[row for row, _, _, _ in rows]])
+            if not rows:
+                return
+            yield [id_ for _, id_, _, _ in rows], [Document(page_content=text, metadata=json.loads(metadata)) for _, _, text, metadata in rows], vectors
+            last_row = rows[-1][0]
+
+    def count(self) -> int:
+        return int(self._load()[2].sum())
+
+    @classmethod
+    def from_texts(cls, texts: list[str], embedding: Embeddings, metadatas: Optional[list[dict]] = None, directory: str = None,
+                   collection_name: str = "langchain", ids: Optional[list[str]] = None, **kwargs: Any) -> "NumpyVectorStore":
+        store = cls(directory or configs.NUMPY_STORE_DIRECTORY, embedding, collection_name)
+        store.add_texts(texts, metadatas, ids)
+        return store
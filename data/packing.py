@@ -0,0 +1,113 @@
+import re
+from functools import lru_cache
+
+from langchain.docstore.document import Document
+
+from config import Config
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+# Encoding used for the token counts stored in chunk metadata at ingest. Every model in Query.MODELS uses it.
+INGEST_ENCODING = "cl100k_base"
+# The top-ranked chunk is cut to no fewer tokens than this, even when history leaves less room
+MIN_TOP_CHUNK_TOKENS = 128
+
+
+@lru_cache(maxsize=None)
+def _encoding(name: str):
+    import tiktoken  # Imported on first use, it is only needed at ingest and query time
+    return tiktoken.get_encoding(name)
+
+
+@lru_cache(maxsize=None)
+def encoding_name(model: str) -> str:
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model).name
+    except KeyError:
+        return INGEST_ENCODING
+
+
+def count_tokens(text: str, encoding: str = INGEST_ENCODING) -> int:
+    return len(_encoding(encoding).encode(text, disallowed_special=()))
+
+
+def add_token_counts(docs):
+    """
+    add_token_counts Yield each chunk with its token count stored as metadata["tokens"].
+    """
+    for doc in docs:
+        doc.metadata["tokens"] = count_tokens(doc.page_content)
+        yield doc
+
+
+def doc_tokens(doc: Document, model: str) -> int:
+    # Counts stored at ingest are reused when the model shares their encoding
+    encoding = encoding_name(model)
+    if encoding == INGEST_ENCODING and isinstance(doc.metadata.get("tokens"), int):
+        return doc.metadata["tokens"]
+    return count_tokens(doc.page_content, encoding)
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+
+def drop_near_duplicates(docs: list[Document], threshold: float = None) -> list[Document]:
+    """
+    drop_near_duplicates Keep the higher-ranked of any two chunks whose word 3-gram Jaccard similarity is at least threshold.
+    """
+    threshold = configs.DEDUP_SIMILARITY if threshold is None else threshold
+    kept, kept_shingles = [], []
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        if any(len(shingles & other) / len(shingles | other) >= threshold for other in kept_shingles if shingles | other):
+            continue
+        kept.append(doc)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def truncate_tokens(doc: Document, model: str, tokens: int) -> Document:
+    """
+    truncate_tokens Return a copy of doc cut to its first tokens tokens. The original is left as it is, it may be cached.
+    """
+    encoding = _encoding(encoding_name(model))
+    text = encoding.decode(encoding.encode(doc.page_content, disallowed_special=())[:tokens])
+    metadata = {**doc.metadata, "tokens": tokens, "truncated": True}
+    return Document(page_content=text, metadata=metadata)
+
+
+def pack_documents(docs: list[Document], model: str, budget: int) -> list[Document]:
+    """
+    pack_documents Return the highest-ranked chunks, in rank order, whose tokens fit the budget after near-duplicates are removed.
+
+    docs must be in rank order. Chunks are trimmed from the lowest rank up, so a lower-ranked
+    chunk is never kept in place of a higher-ranked one. The top-ranked chunk is always kept, cut
+    to the budget (and to no less than MIN_TOP_CHUNK_TOKENS) when it does not fit, so the chain
+    never answers without context.
+    """
+    unique = drop_near_duplicates(docs)
+    packed, used = [], 0
+    for doc in unique:
+        tokens = doc_tokens(doc, model)
+        if used + tokens > budget:
+            break
+        packed.append(doc)
+        used += tokens
+    if not packed and unique:
+        keep = max(budget, MIN_TOP_CHUNK_TOKENS)
+        logger.warning("The top chunk has %d tokens but only %d fit the prompt, keeping its first %d. "
+                       "Long conversation history leaves less room, clearing it may help.", doc_tokens(unique[0], model), budget, keep)
+        packed, used = [truncate_tokens(unique[0], model, keep)], keep
+    if len(packed) < len(unique):
+        logger.warning("Dropped %d of %d chunks over the %d token budget", len(unique) - len(packed), len(unique), budget)
+    if len(packed) < len(docs):
+        logger.info("Packed %d of %d chunks into %d tokens (budget %d, %d near-duplicates)",
+                    len(packed), len(docs), used, budget, len(docs) - len(unique))
+    return packed
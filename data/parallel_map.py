@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+
+from config import Config
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+
+class RateLimiter:
+    """
+     RateLimiter spaces request starts evenly so no more than requests_per_minute begin in any minute.
+     A limit of 0 disables it.
+
+     One instance can be shared by every event loop in the process: the lock is only held to book
+     the next start, and the wait itself is an asyncio sleep.
+    """
+
+    def __init__(self, requests_per_minute: float = 0):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# Shared by every map call of every session, so MAP_REQUESTS_PER_MINUTE holds for the whole process
+shared_rate_limiter = RateLimiter(configs.MAP_REQUESTS_PER_MINUTE)
+
+
+async def amap_documents(llm_chain, docs: list, document_variable_name: str, inputs: dict, concurrency: int = None,
+                         rate_limiter: RateLimiter = None, on_result=None) -> list[str]:
+    """
+    amap_documents Run llm_chain once per document, at most `concurrency` calls at a time, and return the outputs in document order.
+
+    on_result(index, output) is called as each call finishes, in completion order, so partial
+    results can be shown while the remaining calls are still running.
+    """
+    semaphore = asyncio.Semaphore(concurrency or configs.MAP_CONCURRENCY)
+    rate_limiter = rate_limiter or shared_rate_limiter
+
+    async def map_one(index, doc):
+        async with semaphore:
+            await rate_limiter.wait()
+            outputs = await llm_chain.acall({document_variable_name: doc.page_content, **inputs}, return_only_outputs=True)
+        return index, outputs[llm_chain.output_key]
+
+    results = [None] * len(docs)
+    for finished in asyncio.as_completed([map_one(index, doc) for index, doc in enumerate(docs)]):
+        index, output = await finished
+        results[index] = output
+        if on_result is not None:
+            on_result(index, output)
+    return results
@@ -0,0 +1,84 @@
+import threading
+import time
+
+from config import Config
+from data import clients
+from data.bm25 import BM25Index
+from data.embeddings import CachedEmbeddings, EmbeddingStage
+from data.manifest import DocumentManifest
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+# Process-wide objects shared by every module and Streamlit session. They are created on
+# first use so importing the data package never loads a model or opens a connection.
+_instances = {}
+_heartbeats = {}
+_lock = threading.RLock()
+
+
+def get_or_create(name: str, factory):
+    """
+    get_or_create Return the shared object registered under name, building it with factory on first use.
+
+    A factory that raises is not cached, so an unreachable store is retried on the next call.
+    """
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                start = time.perf_counter()
+                instance = factory()
+                _instances[name] = instance
+                logger.info("Initialized %s in %.2fs", name, time.perf_counter() - start)
+    return instance
+
+
+def loaded() -> list[str]:
+    return list(_instances)
+
+
+def reset(name: str = None) -> None:
+    with _lock:
+        if name is None:
+            _instances.clear()
+        else:
+            _instances.pop(name, None)
+
+
+def _create_embedding_function():
+    return CachedEmbeddings(EmbeddingStage(configs.EMBEDDING_MODEL), configs.EMBEDDING_MODEL)
+
+
+def get_embedding_function() -> CachedEmbeddings:
+    return get_or_create("embedding_function", _create_embedding_function)
+
+
+def get_manifest() -> DocumentManifest:
+    return get_or_create("manifest", DocumentManifest)
+
+
+def get_bm25_index() -> BM25Index:
+    return get_or_create("bm25_index", BM25Index)
+
+
+def _monitored(name: str, factory, check):
+    # Wrap a client factory so the first successful connection starts a heartbeat for it
+    def create():
+        client = factory()
+        if name not in _heartbeats:
+            _heartbeats[name] = clients.start_heartbeat(name, lambda: _instances.get(name), check, lambda: reset(name))
+        return client
+    return create
+
+
+def get_chroma_client():
+    return get_or_create("chroma_client", _monitored("chroma_client", clients.create_chroma_client, clients.chroma_is_healthy))
+
+
+def get_weaviate_client():
+    return get_or_create("weaviate_client", _monitored("weaviate_client", clients.create_weaviate_client, clients.weaviate_is_healthy))
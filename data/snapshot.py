@@ -0,0 +1,313 @@
+import argparse
+import json
+import queue
+import threading
+import time
+import uuid
+from pathlib import Path
+from textwrap import dedent
+from typing import Iterable, Iterator
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from config import Config
+from data import catalog
+from data.manifest import DocumentManifest
+from data.registry import get_bm25_index, get_chroma_client, get_manifest
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+SNAPSHOT_VERSION = 1
+# One file per column. Row i of every file is the same chunk.
+MANIFEST_FILE = "snapshot.json"
+IDS_FILE = "ids.jsonl"
+TEXT_FILE = "text.jsonl"
+METADATA_FILE = "metadata.jsonl"
+VECTOR_FILE = "vectors.f32"
+
+_DONE = object()
+
+
+def prefetched(pages: Iterable, depth: int = 1) -> Iterator:
+    """
+    prefetched Yield from pages while a background thread fetches up to depth pages ahead.
+
+    The store round trip for the next page overlaps the work done on the current one.
+    Errors raised by the fetch are re-raised in the consumer.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def offer(item) -> bool:
+        # False once the consumer has stopped, so an abandoned export does not leave this thread blocked
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for page in pages:
+                if not offer(page):
+                    return
+            offer(_DONE)
+        except BaseException as e:
+            offer(e)
+
+    threading.Thread(target=produce, name="snapshot-prefetch", daemon=True).start()
+    try:
+        while True:
+            page = buffer.get()
+            if page is _DONE:
+                return
+            if isinstance(page, BaseException):
+                raise page
+            yield page
+    finally:
+        stop.set()
+
+
+def chroma_iter_vectors(collection_name: str, batch_size: int = None) -> Iterator[tuple[list[str], list[Document], np.ndarray]]:
+    collection = get_chroma_client().get_collection(collection_name)
+    batch_size = batch_size or configs.INGEST_BATCH_SIZE
+    offset = 0
+    while True:
+        batch = collection.get(include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            return
+        yield (batch["ids"], [Document(page_content=text or "", metadata=metadata or {}) for text, metadata in zip(batch["documents"], batch["metadatas"])],
+               np.asarray(batch["embeddings"], dtype=np.float32))
+        offset += len(batch["ids"])
+
+
+def weaviate_iter_vectors(index_name: str, text_key: str, batch_size: int = None) -> Iterator[tuple[list[str], list[Document], np.ndarray]]:
+    from data.weaviate_db import weaviate_get_batch_with_cursor, weaviate_get_schema
+    # Every primitive property. Cross-references have a class name as their data type, which starts upper case.
+    properties = [prop["name"] for prop in weaviate_get_schema(index_name)["properties"] if prop["dataType"][0][:1].islower()]
+    cursor = "None"
+    while True:
+        result = weaviate_get_batch_with_cursor(class_name=index_name, class_properties=properties,
+                                                batch_size=batch_size or configs.INGEST_BATCH_SIZE, cursor=cursor)
+        objects = result["data"]["Get"][index_name]
+        if not objects:
+            return
+        ids = [obj["_additional"]["id"] for obj in objects]
+        yield (ids, [Document(page_content=obj.get(text_key) or "",
+                              metadata={key: value for key, value in obj.items() if key not in (text_key, "_additional") and value is not None})
+                     for obj in objects],
+               np.asarray([obj["_additional"]["vector"] for obj in objects], dtype=np.float32))
+        cursor = ids[-1]
+
+
+def iter_vectors(store: str, collection: str, text_key: str = "text", batch_size: int = None) -> Iterator[tuple[list[str], list[Document], np.ndarray]]:
+    if store == "ChromaDB":
+        return chroma_iter_vectors(collection, batch_size)
+    if store == "Weaviate":
+        return weaviate_iter_vectors(collection, text_key, batch_size)
+    if store == "NumPy":
+        from data.numpy_db import numpy_vectordb
+        return numpy_vectordb(collection).iter_vectors(batch_size or configs.INGEST_BATCH_SIZE)
+    raise ValueError(f"Unknown vector store: {store}.")
+
+
+def export_collection(store: str, collection: str, path: str, text_key: str = "text", batch_size: int = None) -> dict:
+    """
+    export_collection Write every chunk of a collection, with its vector, to a snapshot directory at path.
+
+    Pages are read by cursor with the next page fetched while the current one is written,
+    so memory holds at most two pages whatever the size of the collection.
+    """
+    directory = Path(path)
+    directory.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    count, dim = 0, None
+    with open(directory.joinpath(IDS_FILE), "w", encoding="utf-8") as ids_file, \
+            open(directory.joinpath(TEXT_FILE), "w", encoding="utf-8") as text_file, \
+            open(directory.joinpath(METADATA_FILE), "w", encoding="utf-8") as metadata_file, \
+            open(directory.joinpath(VECTOR_FILE), "wb") as vector_file:
+        for ids, docs, vectors in prefetched(iter_vectors(store, collection, text_key, batch_size)):
+            if dim is None:
+                dim = vectors.shape[1]
+            elif vectors.shape[1] != dim:
+                raise ValueError(f"{store} {collection} mixes {dim} and {vectors.shape[1]}-dimensional vectors.")
+            ids_file.writelines(json.dumps(id_) + "\n" for id_ in ids)
+            text_file.writelines(json.dumps(doc.page_content, ensure_ascii=False) + "\n" for doc in docs)
+            metadata_file.writelines(json.dumps(doc.metadata, ensure_ascii=False, default=str) + "\n" for doc in docs)
+            vector_file.write(np.ascontiguousarray(vectors, dtype="<f4").tobytes())
+            count += len(ids)
+    manifest = {"version": SNAPSHOT_VERSION, "store": store, "collection": collection, "count": count, "dim": dim,
+                "embedding_model": configs.EMBEDDING_MODEL, "created": time.time()}
+    directory.joinpath(MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+    seconds = time.perf_counter() - start
+    logger.info("Exported %d chunks of %s %s to %s in %.1fs", count, store, collection, path, seconds)
+    return dict(manifest, seconds=seconds)
+
+
+def read_manifest(path: str) -> dict:
+    return json.loads(Path(path).joinpath(MANIFEST_FILE).read_text())
+
+
+def read_snapshot(path: str, batch_size: int = None) -> Iterator[tuple[list[str], list[Document], np.ndarray]]:
+    """
+    read_snapshot Yield a snapshot as (ids, documents, vectors) batches. Vectors are read from a memory map.
+    """
+    directory = Path(path)
+    manifest = read_manifest(path)
+    if manifest["version"] != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {manifest['version']}.")
+    if not manifest["count"]:
+        return
+    batch_size = batch_size or configs.INGEST_BATCH_SIZE
+    matrix = np.memmap(directory.joinpath(VECTOR_FILE), dtype="<f4", mode="r", shape=(manifest["count"], manifest["dim"]))
+    with open(directory.joinpath(IDS_FILE), encoding="utf-8") as ids_file, \
+            open(directory.joinpath(TEXT_FILE), encoding="utf-8") as text_file, \
+            open(directory.joinpath(METADATA_FILE), encoding="utf-8") as metadata_file:
+        for offset in range(0, manifest["count"], batch_size):
+            rows = [(json.loads(next(ids_file)), json.loads(next(text_file)), json.loads(next(metadata_file)))
+                    for _ in range(min(batch_size, manifest["count"] - offset))]
+            yield ([id_ for id_, _, _ in rows], [Document(page_content=text, metadata=metadata) for _, text, metadata in rows],
+                   np.array(matrix[offset:offset + len(rows)]))
+
+
+def _scalar_metadata(metadata: dict, bools: bool = True) -> dict:
+    # Chroma and Weaviate properties hold scalars only. Chroma has no booleans either, they are stored as JSON like lists.
+    def scalar(value):
+        # bool is an int subclass
+        return isinstance(value, (str, int, float)) and (bools or not isinstance(value, bool))
+    return {key: value if scalar(value) else json.dumps(value, default=str) for key, value in metadata.items() if value is not None}
+
+
+def _uuid(id_: str) -> str:
+    # Weaviate ids must be UUIDs. Chunk ids written through the manifest already are.
+    try:
+        return str(uuid.UUID(id_))
+    except ValueError:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, id_))
+
+
+def _manifest_source(source: str) -> str:
+    """
+    _manifest_source The name sync_document keys a chunk's file by: its path below the document directory.
+
+    Chunk metadata holds the full path. Pages of a ReadTheDocs site belong to the .rtdocs directory.
+    Sources outside the document directory are kept as they are.
+    """
+    path = Path(source)
+    for root in (configs.doc_directory, configs.doc_directory.resolve()):
+        try:
+            parts = path.relative_to(root).parts
+        except ValueError:
+            continue
+        rtdocs = next((i for i, part in enumerate(parts) if part.endswith(".rtdocs")), None)
+        return Path(*parts[:rtdocs + 1] if rtdocs is not None else parts).as_posix()
+    return source
+
+
+def _chroma_writer(collection_name: str, text_key: str):
+    collection = get_chroma_client().get_or_create_collection(collection_name, metadata={"hnsw:space": "cosine"})
+
+    def write(ids, docs, vectors):
+        collection.upsert(ids=ids, embeddings=vectors.tolist(), documents=[doc.page_content for doc in docs],
+                          metadatas=[_scalar_metadata(doc.metadata, bools=False) or None for doc in docs])
+        return ids
+    return write
+
+
+def _weaviate_writer(index_name: str, text_key: str):
+    from data.weaviate_batch import weaviate_batch_write
+    from data.weaviate_db import (check_batch_result, object_properties,
+                                  warn_collisions, weaviate_ensure_class)
+    weaviate_ensure_class(index_name)
+
+    def write(ids, docs, vectors):
+        ids = [_uuid(id_) for id_ in ids]
+        collisions = []
+        result = weaviate_batch_write(index_name, ((id_, object_properties(_scalar_metadata(doc.metadata), text_key, doc.page_content, collisions), vector)
+                                                   for id_, doc, vector in zip(ids, docs, vectors)))
+        warn_collisions(collisions, text_key, index_name)
+        check_batch_result(result, index_name)
+        return ids
+    return write
+
+
+def _numpy_writer(collection_name: str, text_key: str):
+    from data.numpy_db import numpy_vectordb
+    db = numpy_vectordb(collection_name)
+    return lambda ids, docs, vectors: db.add_vectors([doc.page_content for doc in docs], vectors, [doc.metadata for doc in docs], ids)
+
+
+def import_snapshot(path: str, store: str, collection: str, text_key: str = "text", batch_size: int = None, force: bool = False) -> dict:
+    """
+    import_snapshot Load a snapshot into a collection of any store, using the stored vectors instead of re-embedding.
+
+    Chunks are upserted by id, so importing twice does not duplicate them. The keyword index and the
+    document manifest are updated as for a normal ingest, so Hybrid search works and re-loading a
+    source file later only writes the chunks that changed.
+    """
+    manifest = read_manifest(path)
+    if manifest["embedding_model"] != configs.EMBEDDING_MODEL and not force:
+        raise ValueError(f"The snapshot was embedded with {manifest['embedding_model']} but EMBEDDING_MODEL is {configs.EMBEDDING_MODEL}. "
+                         "Queries would be embedded with a different model. Use force to import anyway.")
+    writers = {"ChromaDB": _chroma_writer, "Weaviate": _weaviate_writer, "NumPy": _numpy_writer}
+    if store not in writers:
+        raise ValueError(f"Unknown vector store: {store}.")
+    write = writers[store](collection, text_key)
+    document_manifest, index = get_manifest(), get_bm25_index()
+    start = time.perf_counter()
+    count = 0
+    for ids, docs, vectors in prefetched(read_snapshot(path, batch_size)):
+        # Chunks of a file get the ids a load of that file into this collection would give them, so
+        # re-loading the file later finds them in the manifest instead of writing them a second time
+        by_source = {}
+        for i, doc in enumerate(docs):
+            if "source" in doc.metadata:
+                source, chunk_hash = _manifest_source(doc.metadata["source"]), DocumentManifest.chunk_hash(doc)
+                ids[i] = DocumentManifest.chunk_id(store, collection, source, chunk_hash)
+                by_source.setdefault(source, []).append((chunk_hash, ids[i]))
+        ids = write(ids, docs, vectors)
+        index.add(store, collection, docs, ids)
+        for source, chunks in by_source.items():
+            document_manifest.add_chunks(store, collection, source, chunks)
+        count += len(ids)
+    # Cached retrievals of the collection are stale even when no chunk had a source
+    document_manifest.bump_version(store, collection)
+    catalog.invalidate(store)
+    seconds = time.perf_counter() - start
+    logger.info("Imported %d chunks from %s to %s %s in %.1fs", count, path, store, collection, seconds)
+    return {"store": store, "collection": collection, "count": count, "seconds": seconds}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="snapshot.py",
+                                     formatter_class=argparse.RawTextHelpFormatter,
+                                     description="snapshot.py - Export a collection with its vectors, or import one without re-embedding",
+                                     epilog=dedent("""\
+                                            Examples:
+
+                                            `python -m data.snapshot export -s ChromaDB -c my_collection -p ./snapshots/my_collection`
+                                            `python -m data.snapshot import -s Weaviate -c MyCollection -p ./snapshots/my_collection`
+
+                                            Please note:
+                                            - The import must run with the EMBEDDING_MODEL used for the export, or queries will not match.
+                                            - Chunks keep their ids, so importing into a collection that already has them replaces them.
+                                            """))
+    parser.add_argument("action", choices=["export", "import"], help="Export a collection to a snapshot, or import a snapshot.")
+    parser.add_argument("-s", "--store", type=str, choices=["ChromaDB", "Weaviate", "NumPy"], required=True, help="Vector store.")
+    parser.add_argument("-c", "--collection", type=str, required=True, help="Chroma collection, Weaviate class or NumPy collection.")
+    parser.add_argument("-p", "--path", type=str, required=True, help="Snapshot directory.")
+    parser.add_argument("-t", "--text-key", type=str, default="text", help="Weaviate class property holding the text. Default is text.")
+    parser.add_argument("-b", "--batch-size", type=int, default=None, help="Chunks per page. Default is INGEST_BATCH_SIZE.")
+    parser.add_argument("--force", action="store_true", help="Import even if the snapshot used another embedding model.")
+    args = parser.parse_args()
+    if args.action == "export":
+        print(export_collection(args.store, args.collection, args.path, args.text_key, args.batch_size))
+    else:
+        print(import_snapshot(args.path, args.store, args.collection, args.text_key, args.batch_size, args.force))
@@ -0,0 +1,56 @@
+from langchain.callbacks.base import BaseCallbackHandler
+
+from config import Config
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+
+class TokenCallbackHandler(BaseCallbackHandler):
+    """
+     TokenCallbackHandler passes each token of an answer to on_token(token) as the LLM produces it.
+
+     skip_calls LLM calls are ignored first, so a refine chain streams only its final answer and not every draft.
+     A call that streams nothing, such as an LLM cache hit, sends its whole text as one token when it ends.
+    """
+
+    # Called in the caller's thread, so on_token can update a Streamlit element
+    run_inline = True
+
+    def __init__(self, on_token, skip_calls: int = 0):
+        self.on_token = on_token
+        self.skip_calls = skip_calls
+        self._calls = 0
+        self._streaming = set()
+        self._streamed = set()
+
+    def _start(self, run_id) -> None:
+        self._calls += 1
+        if self._calls > self.skip_calls:
+            self._streaming.add(run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        self._start(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self._start(run_id)
+
+    def on_llm_new_token(self, token: str, *, run_id, **kwargs) -> None:
+        if run_id in self._streaming and token:
+            self._streamed.add(run_id)
+            self.on_token(token)
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        if run_id in self._streaming and run_id not in self._streamed:
+            text = "".join(generation.text for generations in response.generations for generation in generations)
+            if text:
+                self.on_token(text)
+        self._streaming.discard(run_id)
+        self._streamed.discard(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._streaming.discard(run_id)
+        self._streamed.discard(run_id)
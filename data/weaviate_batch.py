@@ -0,0 +1,149 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Iterable, Sequence
+
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import ReadTimeout
+from weaviate.exceptions import UnexpectedStatusCodeException
+from weaviate.util import get_valid_uuid, get_vector
+
+from config import Config
+from data.registry import get_weaviate_client
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+# Failed objects wait RETRY_BACKOFF, then twice that, and so on
+RETRY_BACKOFF = 0.5
+# Only the first errors are kept in the result, the rest are counted
+MAX_REPORTED_ERRORS = 20
+
+
+class AdaptiveBatchSize:
+    """
+     AdaptiveBatchSize picks the next batch size from the throughput of the batches before it.
+
+     Each batch should take about target_seconds on the server: large enough to amortize the request,
+     far enough from the client timeout that a slow server does not fail it. The size at most doubles
+     per batch, and a failed batch halves it. It is thread safe and kept between writes.
+    """
+
+    def __init__(self, initial: int = 64, minimum: int = 8, maximum: int = 1000, target_seconds: float = None):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = configs.WEAVIATE_BATCH_TARGET_SECONDS if target_seconds is None else target_seconds
+        self._size = initial
+        self._rate = None  # Objects per second, smoothed
+        self._lock = threading.Lock()
+
+    def get(self) -> int:
+        with self._lock:
+            return self._size
+
+    def observe(self, count: int, seconds: float) -> None:
+        if count == 0 or seconds <= 0:
+            return
+        with self._lock:
+            rate = count / seconds
+            self._rate = rate if self._rate is None else 0.7 * self._rate + 0.3 * rate
+            size = min(round(self._rate * self.target_seconds), 2 * self._size)
+            self._size = max(self.minimum, min(self.maximum, size))
+
+    def backoff(self) -> None:
+        with self._lock:
+            self._size = max(self.minimum, self._size // 2)
+
+
+# Shared by every write to the server
+batch_sizer = AdaptiveBatchSize()
+
+
+def _item(class_name: str, uuid: str, properties: dict, vector: Sequence[float]) -> dict:
+    item = {"class": class_name, "properties": properties, "id": get_valid_uuid(uuid)}
+    if vector is not None:
+        item["vector"] = get_vector(vector)
+    return item
+
+
+def _post(client, items: list[dict]) -> dict[str, str]:
+    """
+    _post Send one batch and return the error message of every object that was not written, by id.
+    """
+    # Posted through the client's connection rather than client.batch, whose object queue is one shared
+    # instance per client and cannot be filled from several threads
+    response = client._connection.post(path="/batch/objects", weaviate_object={"fields": ["ALL"], "objects": items})
+    if response.status_code != 200:
+        raise UnexpectedStatusCodeException("Create objects in batch", response)
+    errors = {}
+    for entry in response.json():
+        error = (entry.get("result") or {}).get("errors")
+        if error:
+            errors[entry["id"]] = "; ".join(message["message"] for message in error["error"])
+    return errors
+
+
+def weaviate_batch_write(class_name: str, objects: Iterable[tuple[str, dict, Sequence[float]]], client=None,
+                         workers: int = None, retries: int = None, sizer: AdaptiveBatchSize = None) -> dict:
+    """
+    weaviate_batch_write Write (uuid, properties, vector) objects to a class with several concurrent batches.
+
+    Vectors are stored as given, so Weaviate does no vectorizing. Objects are upserted by uuid, which makes
+    retries safe: a batch that failed or timed out is sent again, and objects that Weaviate rejected are
+    sent again on their own, waiting longer each time. Objects still failing after retries are counted in
+    "failed" with their errors, never dropped silently.
+    """
+    client = client or get_weaviate_client()
+    workers = workers or configs.WEAVIATE_BATCH_WORKERS
+    retries = configs.WEAVIATE_BATCH_RETRIES if retries is None else retries
+    sizer = sizer or batch_sizer
+    result = {"successful": 0, "failed": 0, "retried": 0, "errors": []}
+    lock = threading.Lock()
+
+    def send(items):
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            started = time.perf_counter()
+            try:
+                errors = _post(client, items)
+            except (RequestsConnectionError, ReadTimeout, UnexpectedStatusCodeException) as e:
+                sizer.backoff()
+                errors = {item["id"]: str(e) for item in items}
+            else:
+                sizer.observe(len(items), time.perf_counter() - started)
+            failed = [item for item in items if item["id"] in errors]
+            with lock:
+                result["successful"] += len(items) - len(failed)
+                if failed and attempt < retries:
+                    result["retried"] += len(failed)
+                elif failed:
+                    result["failed"] += len(failed)
+                    room = MAX_REPORTED_ERRORS - len(result["errors"])
+                    result["errors"].extend({"id": item["id"], "message": errors[item["id"]]} for item in failed[:max(room, 0)])
+            if not failed:
+                return
+            items = failed
+
+    start = time.perf_counter()
+    iterator = iter(objects)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="weaviate-batch") as executor:
+        in_flight = set()
+        while batch := list(islice(iterator, sizer.get())):
+            # Bounded, so a large load does not build every batch before the first is sent
+            if len(in_flight) >= 2 * workers:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            in_flight.add(executor.submit(send, [_item(class_name, *obj) for obj in batch]))
+        for future in in_flight:
+            future.result()
+    seconds = time.perf_counter() - start
+    result.update(seconds=seconds, objects_per_sec=result["successful"] / seconds if seconds else 0.0, batch_size=sizer.get())
+    logger.info("Wrote %s objects to %s at %.0f objects/sec (%s failed, %s retried, batch size %s)",
+                result["successful"], class_name, result["objects_per_sec"], result["failed"], result["retried"], result["batch_size"])
+    return result
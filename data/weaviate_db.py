@@ -1,12 +1,20 @@
 import json
+import uuid
+from typing import Iterator
 
 from jinja2 import Environment, FileSystemLoader
-from langchain.embeddings import HuggingFaceEmbeddings
+from langchain.docstore.document import Document
 from langchain.vectorstores import Weaviate
+from weaviate.exceptions import WeaviateStartUpError
 
-import weaviate
 from config import Config
-from document_handling import DocumentHandling
+from data import catalog
+from data.manifest import sync_document
+from data.metrics import timed, trace_request
+from data.registry import (get_bm25_index, get_embedding_function,
+                           get_manifest, get_weaviate_client)
+from data.weaviate_batch import batch_sizer, weaviate_batch_write
+from document_handling import DocumentHandling, batched
 
 # Load config settings
 configs = Config()
@@ -14,57 +22,237 @@ configs = Config()
 # Set Logging
 logger = configs.logger
 
-WEAVIATE_URL = configs.WEAVIATE_URL
-
-CLIENT = weaviate.Client(WEAVIATE_URL)
-
-embedding_function = HuggingFaceEmbeddings(
-    model_name="all-MiniLM-L6-v2")
-
 # Set Document Handling
 handler = DocumentHandling()
 
-# @cache_resource  # Speeds up app
-# def weaviate_client():
-#     client = weaviate.Client(WEAVIATE_URL)
-#     return client
+# Chunks handed to one writer call, enough for every worker to send full-size batches. Smaller sync
+# batches would cap concurrency and batch size at the sync batch.
+WRITE_BATCH_SIZE = configs.WEAVIATE_BATCH_WORKERS * batch_sizer.maximum
 
 
 def weaviate_vectordb(index_name: str, text_key: str = "text") -> Weaviate:
-    db = Weaviate(CLIENT, index_name=index_name, text_key=text_key, embedding=embedding_function, by_text=False)
+    db = Weaviate(get_weaviate_client(), index_name=index_name, text_key=text_key, embedding=get_embedding_function(), by_text=False)
     return db
 
 
-def weaviate_create_vectordb(file: str, index_name: str = None) -> Weaviate:
-    docs = handler.get_loader(file)
-    db = Weaviate.from_documents(docs, embedding=embedding_function, weaviate_url=WEAVIATE_URL, index_name=index_name,
-                                 by_text=False)
+def weaviate_create_vectordb(file: str, index_name: str = None, stream: bool = True, batch_size: int = None) -> Weaviate:
+    index_name = index_name or f"LangChain_{uuid.uuid4().hex}"
+    weaviate_ensure_class(index_name)
     logger.info("Creating Weaviate Class %s", index_name)
-    return db
+    weaviate_add_doc_to_class(file, index_name, "text", stream=stream, batch_size=batch_size)
+    return weaviate_vectordb(index_name, "text")
+
+
+def weaviate_ensure_class(index_name: str) -> None:
+    # Same default class that LangChain's Weaviate.from_documents creates, with source declared so a
+    # document's chunks can be matched on the whole path rather than on its words
+    client = get_weaviate_client()
+    if not client.schema.exists(index_name):
+        client.schema.create_class({"class": index_name, "properties": [{"name": "text", "dataType": ["text"]},
+                                                                       {"name": "source", "dataType": ["text"], "tokenization": "field"}]})
+        catalog.invalidate("Weaviate")
 
 
 def weaviate_get_schema(class_name: str = None) -> dict:
+    """
+    weaviate_get_schema The schema of every class, or of one class. Served from one cached request for the whole schema.
+
+    The result is shared with other sessions and must not be modified.
+    """
+    schema = catalog.cached(("Weaviate", "schema"), lambda: get_weaviate_client().schema.get())
     if class_name is None:
-        return CLIENT.schema.get()
-    else:
-        return CLIENT.schema.get(class_name)
+        return schema
+    # Weaviate capitalizes the first letter of class names
+    capitalized = class_name[:1].upper() + class_name[1:]
+    for class_obj in schema["classes"]:
+        if class_obj["class"] == capitalized:
+            return class_obj
+    # Created since the schema was cached, or missing, in which case the client raises
+    return get_weaviate_client().schema.get(class_name)
+
+
+def weaviate_class_counts(class_names: list[str]) -> dict[str, int]:
+    """
+    weaviate_class_counts Object count per class, from a single aggregate query for all of them.
+    """
+    def count(names):
+        if not names:
+            return {}
+        query = "{ Aggregate { " + " ".join(f"{name} {{ meta {{ count }} }}" for name in names) + " } }"
+        result = get_weaviate_client().query.raw(query)
+        if result.get("errors"):
+            raise ValueError(f"Weaviate aggregate failed: {result['errors']}")
+        return {name: result["data"]["Aggregate"][name][0]["meta"]["count"] for name in names}
+    return catalog.cached_counts("Weaviate", list(class_names), count)
 
 
 def weaviate_create_schema(class_obj: dict) -> None:
-    CLIENT.schema.create_class(class_obj)
+    get_weaviate_client().schema.create_class(class_obj)
+    catalog.invalidate("Weaviate")
     return weaviate_get_schema(class_obj["class"])
 
 
 def weaviate_get_classes():
-    db_schema = weaviate_get_schema()
+    try:
+        db_schema = weaviate_get_schema()
+    except (OSError, WeaviateStartUpError) as e:
+        logger.warning("%s The Weaviate server is unreachable", e)
+        return
     for _ in range(len(db_schema["classes"])):
         yield db_schema["classes"][_]["class"]
 
 
-def weaviate_add_doc_to_class(file: str, index_name: str, text_tag: str) -> list[str]:
-    docs = handler.get_loader(file)
-    db = weaviate_vectordb(index_name, text_tag)
-    db.add_documents(docs)
+def weaviate_add_doc_to_class(file: str, index_name: str, text_tag: str, stream: bool = True, batch_size: int = None) -> dict:
+    load_chunks = (lambda: handler.stream_loader(file)) if stream else (lambda: handler.get_loader(file))
+    return weaviate_add_documents(file, index_name, text_tag, load_chunks, handler.doc_directory.joinpath(file).as_posix(), batch_size)
+
+
+def weaviate_add_documents(source: str, index_name: str, text_tag: str, load_chunks, file_path: str, batch_size: int = None,
+                           file_hash: str = None) -> dict:
+    # Only chunks that are new since the last load of this file are embedded and written
+    with trace_request("ingest", store="Weaviate", collection=index_name):
+        result = sync_document(get_manifest(), "Weaviate", index_name, source, file_path,
+                               load_chunks=load_chunks,
+                               add_chunks=lambda docs, ids: _add_objects(index_name, text_tag, docs, ids),
+                               delete_ids=lambda ids: _delete_objects(index_name, ids),
+                               batch_size=batch_size or WRITE_BATCH_SIZE, file_hash=file_hash)
+    logger.info("Embedding cache stats: %s", get_embedding_function().cache.stats())
+    return result
+
+
+def object_properties(metadata: dict, text_tag: str, text: str, collisions: list) -> dict:
+    """
+    object_properties The metadata of a chunk with its text under text_tag.
+
+    LangChain's Weaviate.add_documents let a metadata key named like text_tag replace the text. That key is
+    left out instead, and appended to collisions so the caller can warn once per write.
+    """
+    if text_tag in metadata:
+        collisions.append(metadata[text_tag])
+        metadata = {key: value for key, value in metadata.items() if key != text_tag}
+    return {**metadata, text_tag: text}
+
+
+def warn_collisions(collisions: list, text_tag: str, index_name: str) -> None:
+    if collisions:
+        logger.warning("%d chunks written to %s had a %r metadata key, which was dropped to keep the chunk text",
+                       len(collisions), index_name, text_tag)
+
+
+def _add_objects(index_name: str, text_tag: str, docs: list, ids: list[str]) -> None:
+    embeddings = get_embedding_function()
+    collisions = []
+
+    def objects():
+        # Each slice is embedded while the batches before it are being written
+        for start in range(0, len(docs), configs.INGEST_BATCH_SIZE):
+            part = docs[start:start + configs.INGEST_BATCH_SIZE]
+            vectors = embeddings.embed_documents([doc.page_content for doc in part])
+            for id_, doc, vector in zip(ids[start:start + len(part)], part, vectors):
+                yield id_, object_properties(doc.metadata, text_tag, doc.page_content, collisions), vector
+
+    # Includes the embed time of the chunks, which overlaps with writing
+    with timed("upsert", store="Weaviate"):
+        result = weaviate_batch_write(index_name, objects())
+        warn_collisions(collisions, text_tag, index_name)
+        check_batch_result(result, index_name)
+        get_bm25_index().add("Weaviate", index_name, docs, ids)
+
+
+def check_batch_result(result: dict, index_name: str) -> None:
+    # Raising keeps the chunks out of the manifest, so the next load of the file writes them again
+    if result["failed"]:
+        raise ValueError(f"{result['failed']} objects were not written to {index_name}: {result['errors'][:3]}")
+
+
+def _delete_objects(index_name: str, ids: list[str]) -> None:
+    client = get_weaviate_client()
+    for batch in batched(ids, 100):
+        where = {"operator": "Or",
+                 "operands": [{"path": ["id"], "operator": "Equal", "valueText": _id} for _id in batch]}
+        client.batch.delete_objects(class_name=index_name, where=where)
+    get_bm25_index().delete("Weaviate", index_name, ids)
+
+
+def weaviate_delete_source(source: str, index_name: str) -> int:
+    """
+    weaviate_delete_source Delete every object whose "source" property is source with a batch delete by where filter, and return how many were deleted.
+
+    Weaviate deletes at most QUERY_MAXIMUM_RESULTS objects per call, so the call is repeated until fewer match.
+    Classes whose source property is word tokenized, as auto-schema creates it, would also match other paths
+    with the same words, so their matches are compared with source first and deleted by id.
+    """
+    client = get_weaviate_client()
+    # Read past the schema cache, the class may have been created a moment ago
+    prop = next((prop for prop in client.schema.get(index_name)["properties"] if prop["name"] == "source"), None)
+    if prop is None:
+        return 0
+    where = {"path": ["source"], "operator": "Equal", "valueText": source}
+    if prop.get("tokenization") != "field":
+        ids = _exact_source_ids(client, index_name, source, where)
+        if ids:
+            _delete_objects(index_name, ids)
+            get_manifest().forget_ids("Weaviate", index_name, ids)
+        return len(ids)
+    ids = []
+    while True:
+        # verbose returns the deleted ids, which the keyword index and manifest need
+        results = client.batch.delete_objects(class_name=index_name, where=where, output="verbose")["results"]
+        ids.extend(obj["id"] for obj in results.get("objects") or [] if obj.get("status") == "SUCCESS")
+        if results["failed"]:
+            logger.warning("%d objects of %s in Class %s were not deleted", results["failed"], source, index_name)
+        if results["matches"] < results["limit"] or not results["successful"]:
+            break
+    if ids:
+        get_bm25_index().delete("Weaviate", index_name, ids)
+        get_manifest().forget_ids("Weaviate", index_name, ids)
+    return len(ids)
+
+
+def _exact_source_ids(client, index_name: str, source: str, where: dict, page_size: int = 500) -> list[str]:
+    # The where filter narrows the class to objects sharing the words of source, the comparison keeps the exact ones
+    ids, offset = [], 0
+    while True:
+        result = (client.query.get(index_name, ["source"]).with_additional(["id"]).with_where(where)
+                  .with_limit(page_size).with_offset(offset).do())
+        if result.get("errors"):
+            raise ValueError(f"Error during query: {result['errors']}")
+        objects = result["data"]["Get"][index_name]
+        ids.extend(obj["_additional"]["id"] for obj in objects if obj["source"] == source)
+        if len(objects) < page_size:
+            return ids
+        offset += page_size
+
+
+def weaviate_delete_document(file: str, index_name: str) -> int:
+    deleted = weaviate_delete_source(handler.doc_directory.joinpath(file).as_posix(), index_name)
+    ids = get_manifest().remove_document("Weaviate", index_name, file)
+    if ids:
+        _delete_objects(index_name, ids)
+    logger.info("Deleted %d chunks of %s from Class %s", deleted + len(ids), file, index_name)
+    return deleted + len(ids)
+
+
+def weaviate_replace_document(file: str, index_name: str, text_tag: str, batch_size: int = None) -> dict:
+    deleted = weaviate_delete_document(file, index_name)
+    result = weaviate_add_doc_to_class(file, index_name, text_tag, batch_size=batch_size)
+    return dict(result, deleted=deleted)
+
+
+def weaviate_iter_chunks(index_name: str, text_key: str, batch_size: int = None) -> Iterator[tuple[list[str], list[Document]]]:
+    # Page through every object of a class as (ids, documents), with the other text properties as metadata
+    properties = [prop["name"] for prop in weaviate_get_schema(index_name)["properties"] if prop["dataType"] in (["text"], ["string"])]
+    cursor = "None"
+    while True:
+        result = weaviate_get_batch_with_cursor(class_name=index_name, class_properties=properties,
+                                                batch_size=batch_size or configs.INGEST_BATCH_SIZE, cursor=cursor)
+        objects = result["data"]["Get"][index_name]
+        if not objects:
+            return
+        ids = [obj["_additional"]["id"] for obj in objects]
+        yield ids, [Document(page_content=obj.get(text_key) or "",
+                             metadata={key: value for key, value in obj.items() if key not in (text_key, "_additional")}) for obj in objects]
+        cursor = ids[-1]
 
 
 def create_class_obj(schema_template: str, schema_values: str) -> dict:
@@ -84,16 +272,23 @@ def create_class_obj(schema_template: str, schema_values: str) -> dict:
 
 
 def weaviate_delete_class(class_name: str) -> None:
-    CLIENT.schema.delete_class(class_name)
+    get_weaviate_client().schema.delete_class(class_name)
+    catalog.invalidate("Weaviate")
+    get_manifest().remove_collection("Weaviate", class_name)
+    get_bm25_index().remove_collection("Weaviate", class_name)
 
 
 def weaviate_delete_id(ids: list[str], index_name: str, text_key: str) -> None:
     db = weaviate_vectordb(index_name, text_key)
     db.delete(ids=ids, class_name=index_name)  # Note must add in LangChain Library to Weaviate.delete() the class_name attribute
+    get_manifest().forget_ids("Weaviate", index_name, ids)
+    get_bm25_index().delete("Weaviate", index_name, ids)
     logger.info("ids %s deleted from Class %s Name %s", ids, index_name, text_key)
 
 
-def weaviate_get_batch_with_cursor(client=CLIENT, class_name=None, class_properties=None, batch_size=20, cursor="None"):
+def weaviate_get_batch_with_cursor(client=None, class_name=None, class_properties=None, batch_size=20, cursor="None"):
+    if client is None:
+        client = get_weaviate_client()
     query = (client.query.get(class_name, class_properties)
              # Optionally retrieve the vector embedding by adding `vector` to the _additional fields
              .with_additional(["id vector"])
@@ -1,16 +1,33 @@
+import csv
+from itertools import islice
 from pathlib import Path
+from typing import Iterable, Iterator
 
-from langchain.document_loaders import (CSVLoader, Docx2txtLoader,
-                                        PyMuPDFLoader, ReadTheDocsLoader,
-                                        TextLoader)
+import fitz
+from langchain.docstore.document import Document
+from langchain.document_loaders import Docx2txtLoader, ReadTheDocsLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 from config import Config
+from data.metrics import timed, timed_iter
+from data.packing import add_token_counts
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """
+    batched Yield lists of up to size items from iterable without materializing it.
+    """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
 
 
 class DocumentHandling:
     logger = Config().logger
 
+    # Characters read per segment when streaming plain text files
+    text_segment_size = 1 << 20
+
     def __init__(self, directory: Path = None, chunk_size: int = 1000, chunk_overlap: int = 100,):
         if directory is None:
             # Load config settings
@@ -21,57 +38,129 @@ class DocumentHandling:
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
 
-    def readthedocs_loader(self, file: str) -> list[str]:
+    def _text_splitter(self) -> RecursiveCharacterTextSplitter:
+        return RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,)
+
+    @staticmethod
+    def _split_each(raw_docs: Iterable[Document], text_splitter) -> Iterator[Document]:
+        # split_documents handles each document independently, so splitting one at a time gives the same chunks
+        for raw_doc in timed_iter(raw_docs, "load"):
+            with timed("split"):
+                chunks = text_splitter.split_documents([raw_doc])
+            yield from chunks
+
+    def lazy_readthedocs_loader(self, file: str) -> Iterator[Document]:
         loader = ReadTheDocsLoader(
             file=file,
             features="html.parser",
             custom_html_tag=("article", {"role": "main"})
             )
-        raw_docs = loader.load()
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap,)
-        docs = text_splitter.split_documents(raw_docs)
-        return docs
+        raw_docs = self._iter_readthedocs(loader, file)
+        yield from self._split_each(raw_docs, self._text_splitter())
+
+    @staticmethod
+    def _iter_readthedocs(loader: ReadTheDocsLoader, file: str) -> Iterator[Document]:
+        # ReadTheDocsLoader.load() reads the whole site before returning, so walk it one page at a time
+        for path in Path(file).rglob("*"):
+            if path.is_dir():
+                continue
+            with open(path, encoding=loader.encoding, errors=loader.errors) as f:
+                text = loader._clean_data(f.read())
+            yield Document(page_content=text, metadata={"source": str(path)})
+
+    def lazy_worddoc_loader(self, file: str) -> Iterator[Document]:
+        # docx is a zip archive and is read in one piece
+        raw_docs = Docx2txtLoader(file).load()
+        yield from self._split_each(raw_docs, RecursiveCharacterTextSplitter())
+
+    def lazy_pdf_loader(self, file: str) -> Iterator[Document]:
+        yield from self._split_each(self._iter_pdf_pages(file), RecursiveCharacterTextSplitter())
+
+    @staticmethod
+    def _iter_pdf_pages(file: str) -> Iterator[Document]:
+        # Same page metadata as PyMuPDFLoader, but pages are extracted one at a time
+        with fitz.open(file) as pdf:
+            pdf_metadata = {k: v for k, v in pdf.metadata.items() if type(v) in [str, int]}
+            for page in pdf:
+                yield Document(page_content=page.get_text(),
+                               metadata=dict({"source": file, "file_path": file, "page": page.number, "total_pages": len(pdf)},
+                                             **pdf_metadata))
+
+    def lazy_text_loader(self, file: str) -> Iterator[Document]:
+        yield from self._split_each(self._iter_text_segments(file), self._text_splitter())
+
+    def _iter_text_segments(self, file: str) -> Iterator[Document]:
+        # Read large files in segments that end on a paragraph (or at least line) break so chunks rarely straddle two reads
+        with open(file) as f:
+            remainder = ""
+            while block := f.read(self.text_segment_size):
+                text = remainder + block
+                cut = text.rfind("\n\n")
+                if cut < len(text) // 2:
+                    cut = text.rfind("\n")
+                if cut <= 0:
+                    cut = len(text)
+                remainder = text[cut:].lstrip("\n")
+                yield Document(page_content=text[:cut], metadata={"source": file})
+            if remainder:
+                yield Document(page_content=remainder, metadata={"source": file})
+
+    def lazy_csv_loader(self, file: str) -> Iterator[Document]:
+        # One Document per row, matching CSVLoader
+        with open(file, newline="") as csvfile:
+            for i, row in enumerate(csv.DictReader(csvfile)):
+                content = "\n".join(f"{k.strip()}: {v.strip()}" for k, v in row.items())
+                yield Document(page_content=content, metadata={"source": file, "row": i})
+
+    def readthedocs_loader(self, file: str) -> list[str]:
+        return list(self.lazy_readthedocs_loader(file))
 
     def worddoc_loader(self, file: str) -> list[str]:
-        loader = Docx2txtLoader(file)
-        raw_docs = loader.load()
-        text_splitter = RecursiveCharacterTextSplitter()
-        docs = text_splitter.split_documents(raw_docs)
-        return docs
+        return list(self.lazy_worddoc_loader(file))
 
     def pdf_loader(self, file: str) -> list[str]:
-        docs = PyMuPDFLoader(file).load_and_split(RecursiveCharacterTextSplitter())
-        return docs
+        return list(self.lazy_pdf_loader(file))
 
     def text_loader(self, file: str) -> list[str]:
-        loader = TextLoader(file)
-        raw_docs = loader.load()
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap,)
-        docs = text_splitter.split_documents(raw_docs)
-        return docs
+        return list(self.lazy_text_loader(file))
 
     def csv_loader(self, file: str) -> list[str]:
-        loader = CSVLoader(file)
-        data = loader.load()
-        return data
+        return list(self.lazy_csv_loader(file))
 
-    def get_loader(self, file: str) -> list[str]:
+    def _select_method(self, file: str, lazy: bool):
         file_path = self.doc_directory.joinpath(file)
         doc_extension = file_path.suffix
-        method_mapping = {".docx": self.worddoc_loader,
-                          ".pdf": self.pdf_loader,
-                          ".rtdocs": self.readthedocs_loader,
-                          ".txt": self.text_loader,
-                          ".csv": self.csv_loader, }
+        if lazy:
+            method_mapping = {".docx": self.lazy_worddoc_loader,
+                              ".pdf": self.lazy_pdf_loader,
+                              ".rtdocs": self.lazy_readthedocs_loader,
+                              ".txt": self.lazy_text_loader,
+                              ".csv": self.lazy_csv_loader, }
+        else:
+            method_mapping = {".docx": self.worddoc_loader,
+                              ".pdf": self.pdf_loader,
+                              ".rtdocs": self.readthedocs_loader,
+                              ".txt": self.text_loader,
+                              ".csv": self.csv_loader, }
 
         if doc_extension in method_mapping:
-            method_to_call = method_mapping[doc_extension]
-            docs = method_to_call(file_path.as_posix())
-            return docs
+            return method_mapping[doc_extension], file_path.as_posix()
         else:
             # Handle the case when the object's value is not in the dictionary
             raise NameError("No method defined for this object's value.")
+
+    def get_loader(self, file: str) -> list[str]:
+        method_to_call, file_path = self._select_method(file, lazy=False)
+        docs = list(add_token_counts(method_to_call(file_path)))
+        return docs
+
+    def stream_loader(self, file: str) -> Iterator[Document]:
+        """
+        stream_loader Yield split chunks lazily, one page, row or text segment at a time.
+
+        Memory use is bounded by the largest single page rather than the size of the file.
+        """
+        method_to_call, file_path = self._select_method(file, lazy=True)
+        yield from add_token_counts(method_to_call(file_path))
@@ -3,10 +3,14 @@ import os
 import streamlit as st
 
 from config import Config
-from data.chroma_db import chroma_create_vectordb, list_collections
-from data.weaviate_db import (weaviate_add_doc_to_class, weaviate_get_classes,
-                              weaviate_get_schema)
-from Home import session_state
+from data.chroma_db import (chroma_collection_names, chroma_create_vectordb,
+                            chroma_delete_document, chroma_replace_document)
+from data.numpy_db import (numpy_create_vectordb, numpy_delete_document,
+                           numpy_list_collections, numpy_replace_document)
+from data.weaviate_db import (weaviate_add_doc_to_class,
+                              weaviate_delete_document, weaviate_get_classes,
+                              weaviate_get_schema, weaviate_replace_document)
+from session import session_state
 
 # Load config settings
 configs = Config()
@@ -30,11 +34,12 @@ if "uploadWeaviateHide" not in st.session_state:
 
 def doc_loader_select(vectordb_docload):
     if vectordb_docload == "ChromaDB":
-        collection = [coll.name for coll in list_collections()]
-        return collection
+        return chroma_collection_names()
     elif vectordb_docload == "Weaviate":
         collection = [cn for cn in weaviate_get_classes()]
         return collection
+    elif vectordb_docload == "NumPy":
+        return numpy_list_collections()
 
 
 st.header("Loading Documents to Vector Store")
@@ -54,7 +59,7 @@ with st.expander("Expand to load a document to 'document_repo' directory."):
 
 # Load a file to Vector Store
 st.write("Load a Document from the 'document_repo' directory to vector store collection.")
-vectordb_docload = st.radio("Choose the vector store", ("ChromaDB", "Weaviate",), key="vectordb_docload", horizontal=True)
+vectordb_docload = st.radio("Choose the vector store", ("ChromaDB", "Weaviate", "NumPy",), key="vectordb_docload", horizontal=True)
 if configs.doc_directory.exists():
     session_state("docs_hide", False)
     filename = st.selectbox("Choose Document", [doc for doc in os.listdir(configs.doc_directory_str) if doc[-4:] != ".csv"],
@@ -64,15 +69,17 @@ else:
     st.warning("The 'docs' file doesn't exist. Please be sure a directory name 'docs' is in your root directory of the app. ")
 collection_name = st.selectbox("Choose a Collection | Weviate Class", options=doc_loader_select(vectordb_docload),
                                help="Chroma Collection Name or Weaviate Class Name", key="docUploadcn")
+if vectordb_docload == "NumPy":
+    # NumPy collections are created on first load, so a new name can be typed in
+    collection_name = st.text_input("Or a new NumPy Collection", key="docUploadNumpyNew") or collection_name
 if collection_name is None or filename is None:
     session_state("docs_hide", True)
     st.warning("No documents / No collections available. Please add the missing items. ")
 
-if vectordb_docload == "Weaviate":
+if vectordb_docload == "Weaviate" and collection_name:
     session_state("uploadWeaviateHide", False)
-    total_properties = len(weaviate_get_schema(collection_name)["properties"])
     text_tag = st.selectbox("Choose Class Property Name",
-                            options=[weaviate_get_schema(collection_name)["properties"][prop]["name"] for prop in range(total_properties)],
+                            options=[prop["name"] for prop in weaviate_get_schema(collection_name)["properties"]],
                             help="Class Property Name, also known as, text_tag",
                             key="docLoadingWvClProp")
 
@@ -82,8 +89,33 @@ if st.button("Submitted", disabled=st.session_state["docs_hide"], help="This wil
             chroma_create_vectordb(filename, collection_name)
         elif vectordb_docload == "Weaviate":
             weaviate_add_doc_to_class(filename, collection_name, text_tag)
+        elif vectordb_docload == "NumPy":
+            numpy_create_vectordb(filename, collection_name)
         st.experimental_rerun()
 
+# Remove or replace every chunk of one document
+
+with st.expander("Remove or Replace a Document"):
+    st.write("Deletes every chunk loaded from the chosen file in the collection above. Replace then loads the current version of the file.")
+    if st.button("Remove Document", disabled=st.session_state["docs_hide"], key="docRemoveButton"):
+        with st.spinner("Deleting..."):
+            if vectordb_docload == "ChromaDB":
+                deleted = chroma_delete_document(filename, collection_name)
+            elif vectordb_docload == "Weaviate":
+                deleted = weaviate_delete_document(filename, collection_name)
+            else:
+                deleted = numpy_delete_document(filename, collection_name)
+        st.success(f"Deleted {deleted} chunks of {filename} from {collection_name}")
+    if st.button("Replace Document", disabled=st.session_state["docs_hide"], key="docReplaceButton"):
+        with st.spinner("Replacing..."):
+            if vectordb_docload == "ChromaDB":
+                result = chroma_replace_document(filename, collection_name)
+            elif vectordb_docload == "Weaviate":
+                result = weaviate_replace_document(filename, collection_name, text_tag)
+            else:
+                result = numpy_replace_document(filename, collection_name)
+        st.success(f"Deleted {result['deleted']} and added {result['added']} chunks of {filename} in {collection_name}")
+
 # CSV LOADER SECTION
 
 st.divider()
@@ -107,7 +139,7 @@ if configs.doc_directory.exists() or csv_file:
 else:
     session_state("csv_hide", True)
     st.warning("Please be sure a 'csv' file is in your 'docs' directory of the app.")
-collection_name = st.selectbox("Choose a Collection", options=[coll.name for coll in list_collections()], key="docLoadSelectCollection")
+collection_name = st.selectbox("Choose a Collection", options=chroma_collection_names(), key="docLoadSelectCollection")
 if collection_name is None or csv_file is None:
     session_state('csv_hide', True)
     st.warning("No 'csv' / No collections available. Please add the missing items. ")
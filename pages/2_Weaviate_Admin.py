@@ -5,10 +5,11 @@ import streamlit as st
 
 from config import Config
 from weaviate import exceptions
-from data.weaviate_db import (create_class_obj, CLIENT,
+from data.weaviate_db import (create_class_obj,
                               weaviate_create_schema,
                               weaviate_get_batch_with_cursor,
-                              weaviate_get_classes, weaviate_get_schema, weaviate_delete_class, weaviate_delete_id)
+                              weaviate_get_classes, weaviate_get_schema, weaviate_delete_class, weaviate_delete_id,
+                              weaviate_class_counts)
 
 # Load config settings
 configs = Config()
@@ -74,10 +75,12 @@ with weaviate_col2:
             st.json(weaviate_get_schema(show_schema))
 
 st.header("Details")
-wcn = st.selectbox("Select Class", options=[wcn for wcn in weaviate_get_classes()], key="weaviate_detail")
-count: dict = CLIENT.query.aggregate(wcn).with_meta_count().do()
+class_names = list(weaviate_get_classes())
+# One aggregate query counts every class, for both the details and the class list below
+class_counts = weaviate_class_counts(class_names)
+wcn = st.selectbox("Select Class", options=class_names, key="weaviate_detail")
 st.write("Chunk Data:")
-st.write(f"📚 name: {wcn} | 💫 item count: {count['data']['Aggregate'][wcn][0]['meta']['count']}")
+st.write(f"📚 name: {wcn} | 💫 item count: {class_counts.get(wcn)}")
 delete_class = st.checkbox("Activate Delete?", value=False, key="deleteClassActivateCheckbox")
 if st.button("Delete Class", disabled=not st.session_state["deleteClassActivateCheckbox"], key="weaviateDeleteButton"):
     weaviate_delete_class(wcn)
@@ -88,9 +91,8 @@ st.divider()
 st.subheader("Object Retrieval")
 
 input1, input2, input3 = st.columns([1, 1, 1])
-total_properties = len(weaviate_get_schema(wcn)["properties"])
-class_properties = input1.selectbox("Class Property", 
-                                    options=[weaviate_get_schema(wcn)["properties"][prop]["name"] for prop in range(total_properties)], key="weaviateAdminClassProp")
+class_properties = input1.selectbox("Class Property",
+                                    options=[prop["name"] for prop in weaviate_get_schema(wcn)["properties"]], key="weaviateAdminClassProp")
 batch_size = int(input2.text_input("Batch Size", value="20", help="Interger Only"))
 cursor = input3.text_input("Cursor", value=None)
 
@@ -113,7 +115,6 @@ if st.button("Get Batch"):
 # List classes
 st.divider()
 with st.expander("Expand for Weaviate Classes 👇"):
-    for cn in weaviate_get_classes():
+    for cn, count in class_counts.items():
         st.divider()
-        count: dict = CLIENT.query.aggregate(cn).with_meta_count().do()
-        st.write(f"📚 name: {cn} | 💫 item count: {count['data']['Aggregate'][cn][0]['meta']['count']}")
+        st.write(f"📚 name: {cn} | 💫 item count: {count}")
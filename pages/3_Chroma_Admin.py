@@ -1,8 +1,8 @@
 import streamlit as st
 
 from config import Config
-from data.chroma_db import (create_collection, delete_collection,
-                            list_collections)
+from data.chroma_db import (chroma_collection_counts, chroma_collection_names,
+                            create_collection, delete_collection)
 
 # Load config settings
 configs = Config()
@@ -25,7 +25,7 @@ with col1:
             st.experimental_rerun()
 
         st.header("Delete a Chroma Collection")
-        collection_name = st.selectbox("Choose a Collection", options=[coll.name for coll in list_collections()], key="deleteVectorstore")
+        collection_name = st.selectbox("Choose a Collection", options=chroma_collection_names(), key="deleteVectorstore")
         if st.button("Delete"):
             delete_collection(collection_name)
             st.experimental_rerun()
@@ -34,6 +34,7 @@ with col1:
 with col2:
 
     st.header("Current Vectore Store Collections")
-    for coll in list_collections():
+    collection_names = chroma_collection_names()
+    for name, count in chroma_collection_counts(collection_names).items():
         st.divider()
-        st.write(f"📚 name: {coll.name:} | 💫 item count: {coll.count()}")
+        st.write(f"📚 name: {name} | 💫 item count: {count}")
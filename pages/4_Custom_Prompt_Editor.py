@@ -6,7 +6,7 @@ import streamlit as st
 import yaml
 
 from config import Config
-from Home import session_state
+from session import session_state
 
 # import config settings
 configs = Config()
@@ -0,0 +1,49 @@
+import numpy as np
+import streamlit as st
+
+from config import Config
+from data.metrics import metrics
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+st.header("Performance")
+st.caption("Latencies of the requests served by this process since it started. "
+           "The upsert stage includes the embedding of new chunks, and llm is summed over every LLM call of a request.")
+
+kind = st.radio("Requests", options=["query", "ingest"], horizontal=True)
+traces = [trace for trace in metrics.recent_traces() if trace["kind"] == kind]
+
+if not traces:
+    st.info(f"No {kind} requests recorded yet.")
+else:
+    stages = sorted({stage for trace in traces for stage in trace["stages"]})
+    summary = []
+    for stage in stages:
+        values = np.asarray([trace["stages"][stage] for trace in traces if stage in trace["stages"]]) * 1000
+        summary.append({"stage": stage, "count": len(values), "p50 ms": round(float(np.percentile(values, 50)), 1),
+                        "p95 ms": round(float(np.percentile(values, 95)), 1), "max ms": round(float(values.max()), 1)})
+    st.subheader("Per stage")
+    st.dataframe(summary, use_container_width=True)
+
+    if kind == "query":
+        st.write(f"Tokens in the last {len(traces)} queries: {sum(trace['prompt_tokens'] for trace in traces)} prompt, "
+                 f"{sum(trace['completion_tokens'] for trace in traces)} completion")
+
+    st.subheader("Recent requests")
+    rows = [{**{key: value for key, value in trace.items() if key not in ("stages", "id")},
+             **{f"{stage} ms": round(seconds * 1000, 1) for stage, seconds in trace["stages"].items()}}
+            for trace in reversed(traces)]
+    st.dataframe(rows[:100], use_container_width=True)
+
+with st.expander("Prometheus metrics"):
+    exposition = metrics.prometheus()
+    if configs.METRICS_PORT:
+        st.write(f"Served for scraping on port {configs.METRICS_PORT}")
+    st.download_button("Download", data=exposition, file_name="metrics.prom", mime="text/plain")
+    st.code(exposition, language="text")
+
+st.button("Refresh", key="performance_page_refresh")
@@ -0,0 +1,25 @@
+import streamlit as st
+
+from config import Config
+
+# Load config settings
+configs = Config()
+
+# Set Logging
+logger = configs.logger
+
+
+def session_state(key: any, value: any) -> None:
+    """
+    session_state Create and update the Streamlit Session State
+
+    Args:
+        key (any): Required. Dictionary Key
+        value (any): Required. Dictionary Value
+    """
+    if key not in st.session_state:
+        st.session_state[key] = value
+        logger.debug("Session State: %s added.", key)
+    elif key in st.session_state:
+        st.session_state[key] = value
+        logger.debug("Session State: %s updated", key)
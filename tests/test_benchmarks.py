@@ -0,0 +1,28 @@
+from unittest import TestCase, main as unittest_main
+
+from benchmarks.fakes import HashEmbeddings, make_queries
+from benchmarks.run import compare, percentiles
+
+
+class Benchmarks_test(TestCase):
+
+    def test_percentiles_are_in_milliseconds(self):
+        stats = percentiles([0.001 * n for n in range(1, 101)])
+        self.assertEqual(stats["count"], 100)
+        self.assertAlmostEqual(stats["p50_ms"], 50.5)
+        self.assertAlmostEqual(stats["max_ms"], 100.0)
+
+    def test_compare_reports_relative_change(self):
+        lines = compare({"meta": {}, "retrieval": {"NumPy": {"p50_ms": 10.0, "count": 5}}},
+                        {"meta": {}, "retrieval": {"NumPy": {"p50_ms": 5.0, "count": 5}}})
+        self.assertEqual(len(lines), 1)
+        self.assertIn("-50.0%", lines[0])
+
+    def test_fakes_are_deterministic(self):
+        self.assertEqual(make_queries(5, seed=3), make_queries(5, seed=3))
+        embeddings = HashEmbeddings(dim=16)
+        self.assertEqual(embeddings.embed_query("vector store"), embeddings.embed_documents(["vector store"])[0])
+
+
+if __name__ == '__main__':
+    unittest_main()
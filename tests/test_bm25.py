@@ -0,0 +1,40 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase, main as unittest_main
+
+from langchain.docstore.document import Document
+
+from data.bm25 import BM25Index, tokenize
+
+
+class BM25_test(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.index = BM25Index(Path(directory.name).joinpath("bm25.sqlite3").as_posix())
+        docs = [Document(page_content="The request failed with ERR_CONN-42 after a timeout", metadata={"source": "errors.txt"}),
+                Document(page_content="Requests usually succeed, timeouts are rare", metadata={"source": "notes.txt"}),
+                Document(page_content="彼は寿司を食べている", metadata={"source": "tae_kim.txt"})]
+        self.index.add("ChromaDB", "test", docs, ["1", "2", "3"])
+
+    def test_identifiers_are_kept_whole_and_split(self):
+        self.assertEqual(tokenize("git-rebase"), ["git-rebase", "git", "rebase"])
+
+    def test_exact_identifier_ranks_first(self):
+        results = self.index.search("ChromaDB", "test", "ERR_CONN-42")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][0].metadata["source"], "errors.txt")
+
+    def test_japanese_is_matched_by_bigrams(self):
+        results = self.index.search("ChromaDB", "test", "食べている")
+        self.assertEqual(results[0][0].metadata["source"], "tae_kim.txt")
+
+    def test_delete_and_collections_are_separate(self):
+        self.index.delete("ChromaDB", "test", ["1"])
+        self.assertEqual(self.index.search("ChromaDB", "test", "ERR_CONN-42"), [])
+        self.assertEqual(self.index.search("Weaviate", "test", "timeouts"), [])
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,101 @@
+import os
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from unittest import TestCase, main as unittest_main
+from unittest.mock import MagicMock, patch
+
+import tiktoken
+
+from data import registry
+from data.bulk_ingest import bulk_ingest, configs, find_files
+from data.manifest import DocumentManifest
+
+
+class BulkIngest_test(TestCase):
+
+    def setUp(self):
+        try:
+            # Workers are separate processes and count tokens with the real tokenizer
+            tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            self.skipTest(f"tiktoken encoding unavailable: {e}")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name, "docs")
+        self.root.mkdir()
+        for name in ["a.txt", "b.txt", "c.txt"]:
+            self.root.joinpath(name).write_text(f"contents of {name}")
+        registry.reset("manifest")
+        registry.get_or_create("manifest", lambda: DocumentManifest(os.path.join(directory.name, "manifest.sqlite3")))
+        self.addCleanup(registry.reset, "manifest")
+
+    def test_a_failed_write_does_not_end_the_run(self):
+        written = {}
+
+        def write(name, docs, file_path, file_hash):
+            if name == "b.txt":
+                raise OSError("store unreachable")
+            written[name] = file_hash
+            registry.get_manifest().set_file_hash("Fake", "coll", name, file_hash)
+            return {"added": len(docs), "deleted": 0}
+
+        with patch("data.bulk_ingest._get_writer", return_value=write):
+            totals = bulk_ingest(self.root.as_posix(), "Fake", "coll", workers=1, queue_size=1)
+            self.assertEqual((totals["failed"], totals["added"]), (1, 2))
+            self.assertEqual(written["a.txt"], DocumentManifest.file_hash(self.root.joinpath("a.txt").as_posix()))
+            # Files written before are skipped by their hash, the failed one is tried again
+            totals = bulk_ingest(self.root.as_posix(), "Fake", "coll", workers=1, queue_size=1)
+            self.assertEqual((totals["skipped"], totals["failed"]), (2, 1))
+
+
+class BrokenPool(ThreadPoolExecutor):
+    # Runs files in threads, and fails b.txt as a crashed worker process would
+
+    def __init__(self, max_workers=None, mp_context=None):
+        super().__init__(max_workers=max_workers)
+
+    def submit(self, fn, root, name, *args):
+        if name == "b.txt":
+            future = Future()
+            future.set_exception(BrokenProcessPool("A process in the process pool was terminated abruptly"))
+            return future
+        return super().submit(fn, root, name, *args)
+
+
+class BulkIngestWorkers_test(TestCase):
+
+    def test_a_crashed_worker_fails_only_its_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        root = Path(directory.name)
+        for name in ["a.txt", "b.txt", "c.txt"]:
+            root.joinpath(name).write_text(f"contents of {name}")
+        registry.reset("manifest")
+        registry.get_or_create("manifest", lambda: DocumentManifest(os.path.join(directory.name, "manifest.sqlite3")))
+        self.addCleanup(registry.reset, "manifest")
+        write = MagicMock(return_value={"added": 1, "deleted": 0})
+        with patch("data.bulk_ingest.ProcessPoolExecutor", BrokenPool), patch("data.bulk_ingest._get_writer", return_value=write), \
+                patch("data.packing.count_tokens", side_effect=lambda text: len(text.split())):
+            totals = bulk_ingest(root.as_posix(), "Fake", "coll", workers=1, queue_size=1)
+        self.assertEqual((totals["failed"], totals["added"]), (1, 2))
+
+
+class FindFiles_test(TestCase):
+
+    def test_subdirectory_of_the_document_directory_keeps_ui_names(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        doc_directory = Path(directory.name, "document_repo")
+        doc_directory.joinpath("manuals").mkdir(parents=True)
+        doc_directory.joinpath("manuals", "a.txt").write_text("a")
+        Path(directory.name, "elsewhere.txt").write_text("b")
+        with patch.object(configs, "doc_directory", doc_directory):
+            self.assertEqual(find_files(doc_directory.joinpath("manuals").as_posix()), (doc_directory, ["manuals/a.txt"]))
+            self.assertEqual(find_files(f"{doc_directory.as_posix()}/manuals/*.txt"), (doc_directory, ["manuals/a.txt"]))
+            self.assertEqual(find_files(f"{directory.name}/*.txt"), (Path(directory.name), ["elsewhere.txt"]))
+
+
+if __name__ == "__main__":
+    unittest_main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+from unittest import TestCase, main as unittest_main
+from unittest.mock import MagicMock, patch
+
+from data import catalog, registry
+from data.manifest import DocumentManifest
+from data.weaviate_db import weaviate_class_counts, weaviate_get_schema
+
+
+class Catalog_test(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        registry.reset("manifest")
+        registry.get_or_create("manifest", lambda: DocumentManifest(os.path.join(directory.name, "manifest.sqlite3")))
+        self.addCleanup(registry.reset, "manifest")
+        catalog.invalidate()
+        self.addCleanup(catalog.invalidate)
+        self.client = MagicMock()
+        self.client.schema.get.return_value = {"classes": [{"class": "Books", "properties": [{"name": "text", "dataType": ["text"]}]}]}
+        self.client.query.raw.return_value = {"data": {"Aggregate": {"Books": [{"meta": {"count": 3}}], "Notes": [{"meta": {"count": 5}}]}}}
+        patcher = patch("data.weaviate_db.get_weaviate_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failures_are_not_cached(self):
+        factory = MagicMock(side_effect=[OSError("down"), ["a"]])
+        with self.assertRaises(OSError):
+            catalog.cached(("ChromaDB", "collections"), factory)
+        self.assertEqual(catalog.cached(("ChromaDB", "collections"), factory), ["a"])
+        self.assertEqual(catalog.cached(("ChromaDB", "collections"), factory), ["a"])
+        self.assertEqual(factory.call_count, 2)
+
+    def test_schema_is_fetched_once_for_every_class(self):
+        self.assertEqual(weaviate_get_schema("books")["class"], "Books")
+        self.assertEqual(len(weaviate_get_schema()["classes"]), 1)
+        self.assertEqual(self.client.schema.get.call_count, 1)
+        catalog.invalidate("Weaviate")
+        weaviate_get_schema()
+        self.assertEqual(self.client.schema.get.call_count, 2)
+
+    def test_counts_come_from_one_query_until_a_collection_changes(self):
+        self.assertEqual(weaviate_class_counts(["Books", "Notes"]), {"Books": 3, "Notes": 5})
+        weaviate_class_counts(["Books", "Notes"])
+        self.assertEqual(self.client.query.raw.call_count, 1)
+        self.assertIn("Books { meta { count } } Notes { meta { count } }", self.client.query.raw.call_args[0][0])
+        registry.get_manifest().bump_version("Weaviate", "Notes")
+        weaviate_class_counts(["Books", "Notes"])
+        self.assertEqual(self.client.query.raw.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest_main()
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import uuid
+from unittest import TestCase, main as unittest_main
+from unittest.mock import MagicMock, patch
+
+import chromadb
+from langchain.docstore.document import Document
+
+from data import numpy_db, registry
+from data.bm25 import BM25Index
+from data.chroma_db import chroma_delete_source
+from data.manifest import DocumentManifest
+from data.numpy_store import NumpyVectorStore
+from data.weaviate_db import weaviate_delete_source
+from tests.test_numpy_store import FakeEmbeddings
+
+
+class DeleteSource_test(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.collection = f"delete_{uuid.uuid4().hex[:8]}"
+        shared = {"manifest": lambda: DocumentManifest(os.path.join(directory.name, "manifest.sqlite3")),
+                  "bm25_index": lambda: BM25Index(os.path.join(directory.name, "bm25.sqlite3")),
+                  "chroma_client": chromadb.EphemeralClient,
+                  f"numpy_store:{self.collection}": lambda: NumpyVectorStore(directory.name, FakeEmbeddings(), self.collection)}
+        for name, factory in shared.items():
+            registry.reset(name)
+            registry.get_or_create(name, factory)
+            self.addCleanup(registry.reset, name)
+        self.source = numpy_db.handler.doc_directory.joinpath("a.txt").as_posix()
+        self.docs = [Document(page_content=text, metadata={"source": source})
+                     for text, source in [("apple", self.source), ("apples", self.source), ("banana", "b.txt")]]
+
+    def test_numpy_delete_document_removes_chunks_outside_the_manifest(self):
+        db = registry.get_or_create(f"numpy_store:{self.collection}", None)
+        # Loaded by another tool, so only the source metadata knows these chunks belong to a.txt
+        db.add_documents(self.docs, ids=["1", "2", "3"])
+        registry.get_bm25_index().add("NumPy", self.collection, self.docs, ["1", "2", "3"])
+        self.assertEqual(numpy_db.numpy_delete_document("a.txt", self.collection), 2)
+        self.assertEqual([doc.page_content for doc in db.similarity_search("apple", k=3)], ["banana"])
+        self.assertEqual(registry.get_bm25_index().search("NumPy", self.collection, "apple"), [])
+
+    def test_chroma_delete_source_uses_where_filter(self):
+        collection = registry.get_chroma_client().create_collection(self.collection)
+        collection.add(ids=["1", "2", "3"], embeddings=[[1, 0, 0], [0.9, 0.1, 0], [0, 1, 0]],
+                       documents=[doc.page_content for doc in self.docs], metadatas=[doc.metadata for doc in self.docs])
+        manifest = registry.get_manifest()
+        manifest.add_chunks("ChromaDB", self.collection, "a.txt", [("hash1", "1")])
+        manifest.set_file_hash("ChromaDB", self.collection, "a.txt", "filehash")
+        self.assertEqual(chroma_delete_source(self.source, self.collection), 2)
+        self.assertEqual(collection.get()["ids"], ["3"])
+        # The document must be fully re-synced the next time it is loaded
+        self.assertEqual(manifest.get_chunks("ChromaDB", self.collection, "a.txt"), {})
+        self.assertIsNone(manifest.get_file_hash("ChromaDB", self.collection, "a.txt"))
+
+    def test_weaviate_delete_source_repeats_until_under_the_limit(self):
+        client = MagicMock()
+        client.batch.delete_objects.side_effect = [
+            {"results": {"matches": 2, "limit": 2, "successful": 2, "failed": 0, "objects": [{"id": "1", "status": "SUCCESS"}, {"id": "2", "status": "SUCCESS"}]}},
+            {"results": {"matches": 1, "limit": 2, "successful": 1, "failed": 0, "objects": [{"id": "3", "status": "SUCCESS"}]}}]
+        client.schema.get.return_value = {"properties": [{"name": "text"}, {"name": "source", "tokenization": "field"}]}
+        with patch("data.weaviate_db.get_weaviate_client", return_value=client):
+            self.assertEqual(weaviate_delete_source(self.source, "Docs"), 3)
+        self.assertEqual(client.batch.delete_objects.call_args.kwargs["where"], {"path": ["source"], "operator": "Equal", "valueText": self.source})
+
+    def test_weaviate_delete_source_compares_word_tokenized_sources(self):
+        client = MagicMock()
+        client.schema.get.return_value = {"properties": [{"name": "text"}, {"name": "source", "tokenization": "word"}]}
+        # Equal on a word tokenized property also matches paths with the same words
+        query = client.query.get.return_value.with_additional.return_value.with_where.return_value
+        query.with_limit.return_value.with_offset.return_value.do.return_value = {"data": {"Get": {"Docs": [
+            {"source": self.source, "_additional": {"id": "1"}},
+            {"source": self.source.replace("a.txt", "a b.txt"), "_additional": {"id": "2"}}]}}}
+        with patch("data.weaviate_db.get_weaviate_client", return_value=client):
+            self.assertEqual(weaviate_delete_source(self.source, "Docs"), 1)
+        where = client.batch.delete_objects.call_args.kwargs["where"]
+        self.assertEqual(where["operands"], [{"path": ["id"], "operator": "Equal", "valueText": "1"}])
+
+
+if __name__ == "__main__":
+    unittest_main()
@@ -0,0 +1,80 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase, main as unittest_main
+
+from langchain.embeddings.base import Embeddings
+
+from data.embeddings import CachedEmbeddings, EmbeddingCache, EmbeddingStage
+
+
+class CountingEmbeddings(Embeddings):
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[float(len(text)), 1.0, 0.5] for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [float(len(text)), 0.0, 0.5]
+
+
+class EmbeddingCache_test(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name).joinpath("embeddings.sqlite3").as_posix()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_repeated_texts_are_not_reembedded(self):
+        model = CountingEmbeddings()
+        embeddings = CachedEmbeddings(model, "test-model", EmbeddingCache(self.path))
+        first = embeddings.embed_documents(["alpha", "beta", "alpha"])
+        second = embeddings.embed_documents(["beta", "alpha"])
+        self.assertEqual(model.calls, 2)
+        self.assertEqual(first[0], second[1])
+        self.assertEqual(embeddings.cache.stats()["hits"], 2)
+
+    def test_cache_persists_across_instances(self):
+        model = CountingEmbeddings()
+        CachedEmbeddings(model, "test-model", EmbeddingCache(self.path)).embed_query("question")
+        CachedEmbeddings(model, "test-model", EmbeddingCache(self.path)).embed_query("question")
+        self.assertEqual(model.calls, 1)
+
+    def test_model_name_is_part_of_key(self):
+        model = CountingEmbeddings()
+        cache = EmbeddingCache(self.path)
+        CachedEmbeddings(model, "model-a", cache).embed_documents(["text"])
+        CachedEmbeddings(model, "model-b", cache).embed_documents(["text"])
+        self.assertEqual(model.calls, 2)
+
+    def test_eviction_bounds_size(self):
+        cache = EmbeddingCache(self.path, max_bytes=120)
+        cache.put_many({f"key{i}": [0.0] * 10 for i in range(10)})
+        self.assertLessEqual(cache.stats()["bytes"], 120)
+
+    def test_running_total_counts_replaced_vectors_once(self):
+        cache = EmbeddingCache(self.path, max_bytes=120)
+        cache.put_many({"key": [0.0] * 10})
+        cache.put_many({"key": [1.0] * 10, "other": [0.0] * 10})
+        self.assertEqual(cache._total, 80)
+        self.assertEqual(EmbeddingCache(self.path)._total, 80)
+
+
+class EmbeddingStage_test(TestCase):
+
+    def test_length_sorted_batches_keep_input_order(self):
+        stage = EmbeddingStage("test-model", batch_size=2, workers=1)
+        stage._model = CountingEmbeddings()
+        texts = ["ccc", "a", "bbbbb", "dd", "eeee"]
+        vectors = stage.embed_documents(texts)
+        self.assertEqual([vector[0] for vector in vectors], [3.0, 1.0, 5.0, 2.0, 4.0])
+        self.assertEqual(stage.last_report["chunks"], 5)
+
+
+if __name__ == '__main__':
+    unittest_main()
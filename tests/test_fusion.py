@@ -0,0 +1,56 @@
+import asyncio
+import time
+from unittest import TestCase, main as unittest_main
+from unittest.mock import patch
+
+from langchain.docstore.document import Document
+
+from data.ai_api import Query
+from data.fusion import normalized_score_fusion, reciprocal_rank_fusion
+
+
+def doc(text, source="a.pdf"):
+    return Document(page_content=text, metadata={"source": source})
+
+
+class Fusion_test(TestCase):
+
+    def test_rrf_rewards_documents_found_by_several_sources(self):
+        fused = reciprocal_rank_fusion([[doc("x"), doc("y")], [doc("z"), doc("y")]], top_k=3)
+        self.assertEqual(fused[0][0].page_content, "y")
+        self.assertEqual(len(fused), 3)
+
+    def test_rrf_truncates_to_top_k(self):
+        fused = reciprocal_rank_fusion([[doc("x"), doc("y"), doc("z")]], top_k=2)
+        self.assertEqual([d.page_content for d, _ in fused], ["x", "y"])
+
+    def test_same_text_from_different_files_is_not_merged(self):
+        fused = reciprocal_rank_fusion([[doc("x", "a.pdf")], [doc("x", "b.pdf")]], top_k=5)
+        self.assertEqual(len(fused), 2)
+
+    def test_score_fusion_normalizes_each_source(self):
+        fused = normalized_score_fusion([[(doc("x"), 100.0), (doc("y"), 90.0), (doc("w"), 0.0)], [(doc("y"), 0.9), (doc("z"), 0.1)]], top_k=3)
+        self.assertEqual(fused[0][0].page_content, "y")
+
+
+
+class Fanout_test(TestCase):
+
+    def test_a_slow_source_does_not_hold_up_the_answer(self):
+        def retrieve(vectordb_choice, collection_name, text_key, query, search_type, search_kwargs):
+            if collection_name == "slow":
+                time.sleep(2)
+            return [(doc(collection_name), 0.5)]
+
+        query = Query()
+        sources = [("ChromaDB", "fast", None), ("ChromaDB", "slow", None)]
+        with patch.object(query, "retrieve", side_effect=retrieve):
+            start = time.monotonic()
+            # asyncio.run, as in get_fanout_query, must not wait for the timed out search when it closes the loop
+            fused = asyncio.run(query.afanout_retrieve(sources, "q", timeout=0.2))
+            self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual([d.page_content for d, _ in fused], ["fast"])
+
+
+if __name__ == '__main__':
+    unittest_main()
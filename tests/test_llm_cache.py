@@ -0,0 +1,39 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase, main as unittest_main
+
+from data.llm_cache import SemanticAnswerCache
+
+
+class SemanticAnswerCache_test(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = SemanticAnswerCache(Path(self.tmp.name).joinpath("llm.sqlite3").as_posix(), max_distance=0.05,
+                                         max_entries=2, max_age=3600)
+        self.context = SemanticAnswerCache.context_key("gpt-3.5-turbo", 0, "LG_PROMPT", "stuff", ["b", "a"])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_near_question_over_same_chunks_hits(self):
+        self.cache.update(self.context, "What is git?", [1.0, 0.0, 0.0], "A VCS.")
+        self.assertEqual(self.cache.lookup(self.context, [0.99, 0.05, 0.0]), "A VCS.")
+        self.assertIsNone(self.cache.lookup(self.context, [0.0, 1.0, 0.0]))
+
+    def test_different_chunks_miss(self):
+        self.cache.update(self.context, "What is git?", [1.0, 0.0, 0.0], "A VCS.")
+        other = SemanticAnswerCache.context_key("gpt-3.5-turbo", 0, "LG_PROMPT", "stuff", ["a", "c"])
+        self.assertIsNone(self.cache.lookup(other, [1.0, 0.0, 0.0]))
+
+    def test_chunk_order_does_not_matter(self):
+        self.assertEqual(self.context, SemanticAnswerCache.context_key("gpt-3.5-turbo", 0, "LG_PROMPT", "stuff", ["a", "b"]))
+
+    def test_entries_are_bounded(self):
+        for i in range(4):
+            self.cache.update(self.context, f"q{i}", [1.0, float(i), 0.0], f"a{i}")
+        self.assertEqual(self.cache.stats()["entries"], 2)
+
+
+if __name__ == '__main__':
+    unittest_main()
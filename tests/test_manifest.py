@@ -0,0 +1,66 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase, main as unittest_main
+
+from langchain.docstore.document import Document
+
+from data.manifest import DocumentManifest, sync_document
+
+
+class FakeStore:
+
+    def __init__(self):
+        self.objects = {}
+
+    def add(self, docs, ids):
+        self.objects.update(zip(ids, docs))
+
+    def delete(self, ids):
+        for _id in ids:
+            del self.objects[_id]
+
+
+class Manifest_test(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.manifest = DocumentManifest(self.root.joinpath("manifest.sqlite3").as_posix())
+        self.file = self.root.joinpath("doc.txt")
+        self.store = FakeStore()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def sync(self, chunks):
+        self.file.write_text("\n".join(chunks))
+        return sync_document(self.manifest, "Fake", "coll", "doc.txt", self.file.as_posix(),
+                             load_chunks=lambda: [Document(page_content=c, metadata={"source": "doc.txt"}) for c in chunks],
+                             add_chunks=self.store.add, delete_ids=self.store.delete, batch_size=2)
+
+    def test_only_changed_chunks_are_written(self):
+        self.assertEqual(self.sync(["a", "b", "c"])["added"], 3)
+        result = self.sync(["a", "c", "d"])
+        self.assertEqual((result["added"], result["deleted"], result["kept"]), (1, 1, 2))
+        self.assertEqual(sorted(doc.page_content for doc in self.store.objects.values()), ["a", "c", "d"])
+
+    def test_page_numbers_do_not_change_chunk_hashes(self):
+        chunk = Document(page_content="a", metadata={"source": "doc.txt", "page": 3, "total_pages": 9, "tokens": 1})
+        moved = Document(page_content="a", metadata={"source": "doc.txt", "page": 4, "total_pages": 10, "tokens": 1})
+        other = Document(page_content="a", metadata={"source": "other.txt", "page": 3})
+        self.assertEqual(DocumentManifest.chunk_hash(chunk), DocumentManifest.chunk_hash(moved))
+        self.assertNotEqual(DocumentManifest.chunk_hash(chunk), DocumentManifest.chunk_hash(other))
+
+    def test_unchanged_file_is_skipped(self):
+        self.sync(["a", "b"])
+        self.assertTrue(self.sync(["a", "b"])["unchanged"])
+
+    def test_remove_document_returns_store_ids(self):
+        self.sync(["a", "b"])
+        ids = self.manifest.remove_document("Fake", "coll", "doc.txt")
+        self.assertEqual(sorted(ids), sorted(self.store.objects))
+        self.assertEqual(self.manifest.documents("Fake", "coll"), [])
+
+
+if __name__ == '__main__':
+    unittest_main()
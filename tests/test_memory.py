@@ -0,0 +1,65 @@
+import threading
+from unittest import TestCase, main as unittest_main
+from unittest.mock import patch
+
+from data.memory import SessionMemory
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+class Memory_test(TestCase):
+
+    def setUp(self):
+        patcher = patch("data.memory.count_tokens", side_effect=count_words)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_oldest_turns_are_dropped_over_budget(self):
+        memory = SessionMemory(max_tokens=10)
+        for number in range(3):
+            memory.save_context({"question": f"q{number} x"}, {"output_text": f"a{number} y"})
+        self.assertLessEqual(memory.tokens(), 10)
+        history = memory.load_memory_variables({})["history"]
+        self.assertNotIn("q0", history)
+        self.assertIn("Human: q2 x\nAI: a2 y", history)
+
+    def test_evicted_turns_are_summarized_in_the_background(self):
+        calls = []
+
+        def summarizer(summary, new_lines):
+            calls.append(new_lines)
+            return "talked"
+
+        memory = SessionMemory(max_tokens=10, summarizer=summarizer)
+        for number in range(3):
+            memory.save_context({"question": f"q{number} x"}, {"output_text": f"a{number} y"})
+        memory.wait(5)
+        self.assertIn("q0", calls[0])
+        history = memory.load_memory_variables({})["history"]
+        self.assertTrue(history.startswith("System: Summary of the earlier conversation: talked"))
+        self.assertIn("q2", history)
+
+    def test_clear_discards_a_summary_in_flight(self):
+        started, release = threading.Event(), threading.Event()
+
+        def summarizer(summary, new_lines):
+            started.set()
+            release.wait(5)
+            return "stale"
+
+        memory = SessionMemory(max_tokens=5, summarizer=summarizer)
+        for number in range(2):
+            memory.save_context({"question": f"q{number} x"}, {"output_text": f"a{number} y"})
+        self.assertTrue(started.wait(5))
+        future = memory._future
+        memory.clear()
+        release.set()
+        future.result(5)
+        self.assertEqual(memory.load_memory_variables({})["history"], "")
+        self.assertEqual(memory.tokens(), 0)
+
+
+if __name__ == "__main__":
+    unittest_main()
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import os
+import tempfile
+import uuid
+from unittest import TestCase, main as unittest_main
+from unittest.mock import patch
+
+from langchain.schema import ChatGeneration, LLMResult
+from langchain.schema.messages import AIMessage
+
+from data.metrics import MetricsCallbackHandler, metrics, timed, timed_iter, trace_request
+
+
+class Metrics_test(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.jsonl_path = os.path.join(self.tmp.name, "metrics.jsonl")
+        patcher = patch.object(metrics, "jsonl_path", self.jsonl_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_stages_from_tasks_and_threads_are_added_to_the_trace(self):
+        async def request():
+            with trace_request("query", store="NumPy") as trace:
+                async def stage():
+                    with timed("retrieve"):
+                        await asyncio.sleep(0.01)
+                await asyncio.gather(stage(), asyncio.to_thread(lambda: list(timed_iter(range(3), "load"))))
+            return trace
+
+        trace = asyncio.run(request())
+        self.assertGreaterEqual(trace.stages["retrieve"], 0.01)
+        self.assertIn("load", trace.stages)
+        self.assertGreaterEqual(trace.stages["total"], trace.stages["retrieve"])
+        self.assertEqual(metrics.recent_traces()[-1]["id"], trace.id)
+        with open(self.jsonl_path) as f:
+            self.assertEqual(json.loads(f.readlines()[-1])["store"], "NumPy")
+
+    def test_error_is_recorded_and_raised(self):
+        with self.assertRaises(ValueError):
+            with trace_request("ingest"):
+                raise ValueError("bad file")
+        self.assertEqual(metrics.recent_traces()[-1]["error"], "ValueError")
+
+    def test_prometheus_histogram_is_cumulative(self):
+        metrics.observe("stage_seconds", 0.003, stage="embed")
+        metrics.observe("stage_seconds", 0.7, stage="embed")
+        metrics.inc("tokens_total", 12, type="prompt", model='a"b')
+        text = metrics.prometheus()
+        self.assertIn("# TYPE langchain_lab_stage_seconds histogram", text)
+        self.assertIn('langchain_lab_stage_seconds_bucket{stage="embed",le="0.005"} 1', text)
+        self.assertIn('langchain_lab_stage_seconds_bucket{stage="embed",le="1"} 2', text)
+        self.assertIn('langchain_lab_stage_seconds_bucket{stage="embed",le="+Inf"} 2', text)
+        self.assertIn('langchain_lab_stage_seconds_count{stage="embed"} 2', text)
+        self.assertIn('langchain_lab_tokens_total{model="a\\"b",type="prompt"} 12', text)
+
+    def test_callback_handler_records_llm_time_and_tokens(self):
+        handler = MetricsCallbackHandler()
+        run_id = uuid.uuid4()
+        with patch("data.packing.count_tokens", side_effect=lambda text: len(text.split())):
+            with trace_request("query") as trace:
+                handler.on_llm_start({}, ["one two three"], run_id=run_id, invocation_params={"model_name": "gpt-4"})
+                handler.on_llm_new_token("An", run_id=run_id)
+                handler.on_llm_new_token(" answer", run_id=run_id)
+                handler.on_llm_end(LLMResult(generations=[[ChatGeneration(message=AIMessage(content="An answer"))]]), run_id=run_id)
+        self.assertIn("first_token", trace.stages)
+        self.assertIn("llm", trace.stages)
+        self.assertEqual((trace.prompt_tokens, trace.completion_tokens), (3, 2))
+        self.assertIn('langchain_lab_tokens_total{model="gpt-4",type="completion"} 2', metrics.prometheus())
+
+
+if __name__ == "__main__":
+    unittest_main()
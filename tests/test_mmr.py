@@ -0,0 +1,38 @@
+import time
+from unittest import TestCase, main as unittest_main
+
+import numpy as np
+from langchain.vectorstores.utils import maximal_marginal_relevance
+
+from data.mmr import mmr_select
+
+
+class MMR_test(TestCase):
+
+    def test_matches_the_reference_selection(self):
+        rng = np.random.default_rng(7)
+        candidates = rng.normal(size=(60, 32))
+        query = rng.normal(size=32)
+        for lambda_mult in (0.0, 0.3, 0.5, 1.0):
+            expected = maximal_marginal_relevance(query, candidates.tolist(), lambda_mult=lambda_mult, k=8)
+            self.assertEqual(mmr_select(query, candidates, k=8, lambda_mult=lambda_mult), expected)
+
+    def test_duplicates_are_skipped_for_diversity(self):
+        candidates = [[1, 0], [1, 0.01], [0.7, 0.7]]
+        self.assertEqual(mmr_select([1, 0], candidates, k=2, lambda_mult=0.3), [0, 2])
+
+    def test_large_fetch_k_is_fast(self):
+        rng = np.random.default_rng(0)
+        candidates = rng.normal(size=(500, 384)).astype(np.float32)
+        start = time.perf_counter()
+        selected = mmr_select(rng.normal(size=384), candidates, k=7)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(len(set(selected)), 7)
+
+    def test_k_larger_than_candidates(self):
+        self.assertEqual(sorted(mmr_select([1, 0], [[1, 0], [0, 1]], k=5)), [0, 1])
+        self.assertEqual(mmr_select([1, 0], [], k=5), [])
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,56 @@
+import tempfile
+from unittest import TestCase, main as unittest_main
+
+import numpy as np
+
+from data.numpy_store import NumpyVectorStore
+
+
+class FakeEmbeddings:
+    # Axis-aligned vectors so the nearest neighbours are known exactly
+    vectors = {"apple": [1, 0, 0], "apples": [0.9, 0.1, 0], "banana": [0, 1, 0], "cherry": [0, 0, 1]}
+
+    def embed_documents(self, texts):
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+
+class NumpyVectorStore_test(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = NumpyVectorStore(directory.name, FakeEmbeddings(), "test")
+        self.store.add_texts(["apple", "apples", "banana", "cherry"],
+                             [{"source": "a"}, {"source": "a"}, {"source": "b"}, {"source": "c"}],
+                             ids=["1", "2", "3", "4"])
+
+    def test_similarity_is_exact_top_k(self):
+        results = self.store.similarity_search_with_score("apple", k=2)
+        self.assertEqual([doc.page_content for doc, _ in results], ["apple", "apples"])
+        self.assertAlmostEqual(results[0][1], 0.0, places=5)
+
+    def test_filter_and_score_threshold(self):
+        self.assertEqual([doc.page_content for doc in self.store.similarity_search("apple", k=2, filter={"source": "b"})], ["banana"])
+        relevant = self.store.similarity_search_with_relevance_scores("apple", k=4, score_threshold=0.5)
+        self.assertEqual(len(relevant), 2)
+
+    def test_mmr_prefers_diverse_results(self):
+        docs = self.store.max_marginal_relevance_search("apple", k=2, fetch_k=4, lambda_mult=0.3)
+        self.assertEqual(docs[0].page_content, "apple")
+        self.assertNotEqual(docs[1].page_content, "apples")
+
+    def test_delete_upsert_and_compact(self):
+        self.store.add_texts(["banana"], [{"source": "b2"}], ids=["1"])  # replaces id 1
+        self.store.delete(["2", "4"])  # more than half the rows are now deleted, so the store compacts
+        self.assertEqual(self.store.count(), 2)
+        self.assertEqual(self.store._load()[1].shape[0], 2)
+        results = self.store.similarity_search("banana", k=2)
+        self.assertEqual({doc.metadata["source"] for doc in results}, {"b", "b2"})
+        np.testing.assert_allclose(np.linalg.norm(self.store._load()[1], axis=1), 1.0, rtol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,59 @@
+from unittest import TestCase, main as unittest_main
+from unittest.mock import patch
+
+from langchain.docstore.document import Document
+
+from data import packing
+
+
+def doc(text, tokens):
+    return Document(page_content=text, metadata={"tokens": tokens})
+
+
+class Packing_test(TestCase):
+
+    def setUp(self):
+        # Use the stored counts without loading a tiktoken encoding
+        patcher = patch.object(packing, "encoding_name", return_value=packing.INGEST_ENCODING)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_near_duplicates_keep_the_higher_ranked_chunk(self):
+        docs = [doc("the quick brown fox jumps over the lazy dog", 9),
+                doc("The quick brown fox jumps over the lazy dog.", 9),
+                doc("an entirely different chunk of text here", 7)]
+        kept = packing.drop_near_duplicates(docs, threshold=0.9)
+        self.assertEqual(kept, [docs[0], docs[2]])
+
+    def test_lowest_ranked_chunks_are_trimmed_first(self):
+        docs = [doc("alpha one two", 50), doc("beta three four", 30), doc("gamma five six", 10)]
+        packed = packing.pack_documents(docs, "gpt-3.5-turbo", budget=85)
+        self.assertEqual(packed, docs[:2])
+
+    def test_smaller_lower_ranked_chunk_does_not_replace_a_dropped_one(self):
+        docs = [doc("alpha one two", 50), doc("beta three four", 40), doc("gamma five six", 10)]
+        packed = packing.pack_documents(docs, "gpt-3.5-turbo", budget=70)
+        self.assertEqual(packed, docs[:1])
+
+    def test_top_chunk_is_truncated_instead_of_dropped(self):
+        docs = [doc("one two three four five six", 6), doc("seven eight", 2)]
+        with patch.object(packing, "MIN_TOP_CHUNK_TOKENS", 2), patch.object(packing, "_encoding", return_value=WordEncoding()):
+            packed = packing.pack_documents(docs, "gpt-3.5-turbo", budget=4)
+            self.assertEqual([d.page_content for d in packed], ["one two three four"])
+            self.assertEqual(docs[0].page_content, "one two three four five six")
+            # History alone over the budget still leaves the top chunk
+            packed = packing.pack_documents(docs, "gpt-3.5-turbo", budget=-10)
+            self.assertEqual(packed[0].page_content, "one two")
+
+
+class WordEncoding:
+
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+from unittest import TestCase, main as unittest_main
+
+from langchain.docstore.document import Document
+
+from data.parallel_map import RateLimiter, amap_documents
+
+
+class FakeChain:
+    output_key = "text"
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+
+    async def acall(self, inputs, return_only_outputs=True):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        # Later documents finish first
+        await asyncio.sleep(0.01 * (10 - len(inputs["context"])))
+        self.running -= 1
+        return {"text": inputs["context"].upper() + inputs["question"]}
+
+
+class ParallelMap_test(TestCase):
+
+    def test_outputs_keep_document_order_and_concurrency_is_bounded(self):
+        chain = FakeChain()
+        docs = [Document(page_content="a" * n) for n in range(1, 7)]
+        partials = []
+        outputs = asyncio.run(amap_documents(chain, docs, "context", {"question": "?"}, concurrency=2,
+                                             rate_limiter=RateLimiter(0), on_result=lambda i, out: partials.append(i)))
+        self.assertEqual(outputs, ["A" * n + "?" for n in range(1, 7)])
+        self.assertEqual(chain.peak, 2)
+        self.assertEqual(sorted(partials), list(range(6)))
+
+    def test_rate_limiter_spaces_requests(self):
+        async def run():
+            limiter = RateLimiter(requests_per_minute=60 * 20)  # one start every 50 ms
+            start = time.monotonic()
+            await asyncio.gather(*(limiter.wait() for _ in range(3)))
+            return time.monotonic() - start
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.09)
+
+    def test_rate_limiter_is_shared_across_event_loops(self):
+        # Each Streamlit session runs its queries in its own thread and event loop
+        limiter = RateLimiter(requests_per_minute=60 * 20)
+        starts = []
+
+        def session():
+            async def run():
+                for _ in range(2):
+                    await limiter.wait()
+                    starts.append(time.monotonic())
+            asyncio.run(run())
+
+        threads = [threading.Thread(target=session) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        starts.sort()
+        self.assertGreaterEqual(starts[-1] - starts[0], 0.14)
+
+
+if __name__ == '__main__':
+    unittest_main()
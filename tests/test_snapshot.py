@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+import uuid
+from unittest import TestCase, main as unittest_main
+
+import chromadb
+import numpy as np
+
+from langchain.docstore.document import Document
+
+from data import numpy_db, registry
+from data.bm25 import BM25Index
+from data.manifest import DocumentManifest
+from data.numpy_store import NumpyVectorStore
+from data.snapshot import (export_collection, import_snapshot, prefetched,
+                           read_manifest, read_snapshot)
+from tests.test_numpy_store import FakeEmbeddings
+
+
+class Snapshot_test(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.collection = f"snapshot_{uuid.uuid4().hex[:8]}"
+        shared = {"manifest": lambda: DocumentManifest(os.path.join(self.directory, "manifest.sqlite3")),
+                  "bm25_index": lambda: BM25Index(os.path.join(self.directory, "bm25.sqlite3")),
+                  "chroma_client": chromadb.EphemeralClient,
+                  f"numpy_store:{self.collection}": lambda: NumpyVectorStore(self.directory, FakeEmbeddings(), self.collection)}
+        for name, factory in shared.items():
+            registry.reset(name)
+            registry.get_or_create(name, factory)
+            self.addCleanup(registry.reset, name)
+        self.source = registry.get_or_create(f"numpy_store:{self.collection}", None)
+        self.source.add_texts(["apple", "banana", "cherry"], [{"source": "a.txt"}, {"source": "b.txt", "scanned": True}, {"tags": ["x"]}],
+                              ids=["1", "2", "3"])
+        self.path = os.path.join(self.directory, "snapshot")
+
+    def test_export_writes_columns_row_aligned(self):
+        result = export_collection("NumPy", self.collection, self.path, batch_size=2)
+        self.assertEqual((result["count"], result["dim"]), (3, 3))
+        self.assertEqual(read_manifest(self.path)["count"], 3)
+        batches = list(read_snapshot(self.path, batch_size=2))
+        self.assertEqual([len(ids) for ids, _, _ in batches], [2, 1])
+        ids, docs, vectors = batches[0]
+        self.assertEqual(ids, ["1", "2"])
+        self.assertEqual(docs[1].page_content, "banana")
+        np.testing.assert_allclose(vectors[1], [0, 1, 0])
+
+    def test_import_into_chroma_keeps_vectors_and_updates_indexes(self):
+        export_collection("NumPy", self.collection, self.path)
+        result = import_snapshot(self.path, "ChromaDB", self.collection, batch_size=2)
+        self.assertEqual(result["count"], 3)
+        collection = registry.get_chroma_client().get_collection(self.collection)
+        stored = collection.get(ids=["3"], include=["embeddings", "metadatas"])
+        np.testing.assert_allclose(stored["embeddings"][0], [0, 0, 1])
+        self.assertEqual(json.loads(stored["metadatas"][0]["tags"]), ["x"])
+        # Chroma rejects booleans
+        flagged = collection.get(where={"source": "b.txt"}, include=["metadatas"])["metadatas"][0]
+        self.assertEqual(json.loads(flagged["scanned"]), True)
+        self.assertEqual(registry.get_bm25_index().search("ChromaDB", self.collection, "banana")[0][0].metadata["source"], "b.txt")
+        chunk_hash = DocumentManifest.chunk_hash(Document(page_content="apple", metadata={"source": "a.txt"}))
+        self.assertEqual(registry.get_manifest().get_chunks("ChromaDB", self.collection, "a.txt"),
+                         {chunk_hash: DocumentManifest.chunk_id("ChromaDB", self.collection, "a.txt", chunk_hash)})
+
+    def test_reloading_a_file_after_import_writes_nothing(self):
+        stores = {}
+        for name in ("reload_source", "reload_target"):
+            registry.reset(f"numpy_store:{name}")
+            stores[name] = registry.get_or_create(f"numpy_store:{name}", lambda name=name: NumpyVectorStore(self.directory, FakeEmbeddings(), name))
+            self.addCleanup(registry.reset, f"numpy_store:{name}")
+        file_path = os.path.join(self.directory, "a.txt")
+        with open(file_path, "w") as f:
+            f.write("apple banana")
+        # Loaded chunks carry their full path as source, the manifest keys them by the name below the document directory
+        source = numpy_db.handler.doc_directory.joinpath("a.txt").as_posix()
+
+        def load_chunks():
+            return [Document(page_content=text, metadata={"source": source}) for text in ["apple", "banana"]]
+
+        numpy_db.numpy_add_documents("a.txt", "reload_source", load_chunks, file_path)
+        export_collection("NumPy", "reload_source", self.path)
+        import_snapshot(self.path, "NumPy", "reload_target")
+        result = numpy_db.numpy_add_documents("a.txt", "reload_target", load_chunks, file_path)
+        self.assertEqual((result["added"], result["kept"]), (0, 2))
+        self.assertEqual(sum(len(ids) for ids, _, _ in stores["reload_target"].iter_vectors()), 2)
+
+    def test_prefetch_reraises_fetch_errors(self):
+        fetched = []
+
+        def pages():
+            for number in range(3):
+                fetched.append(number)
+                yield number
+            raise OSError("connection lost")
+
+        iterator = prefetched(pages())
+        self.assertEqual(next(iterator), 0)
+        self.assertEqual(next(iterator), 1)
+        with self.assertRaises(OSError):
+            list(iterator)
+        self.assertEqual(fetched, [0, 1, 2])
+
+
+if __name__ == "__main__":
+    unittest_main()
@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from unittest import TestCase, main as unittest_main
+
+# Seconds allowed for a cold import of the query module, override with STARTUP_BUDGET_SECONDS
+STARTUP_BUDGET_SECONDS = float(os.environ.get("STARTUP_BUDGET_SECONDS", 5.0))
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import data.ai_api
+from data import registry
+print(json.dumps({"seconds": time.perf_counter() - start, "loaded": registry.loaded()}))
+"""
+
+
+class Startup_test(TestCase):
+
+    ROOT = Path(__file__).resolve().parents[1]
+
+    def cold_import(self):
+        output = subprocess.run([sys.executable, "-c", PROBE], cwd=self.ROOT, capture_output=True, text=True, check=True)
+        return json.loads(output.stdout.strip().splitlines()[-1])
+
+    def test_import_does_not_load_models_or_clients(self):
+        self.assertEqual(self.cold_import()["loaded"], [])
+
+    def test_cold_start_budget(self):
+        result = self.cold_import()
+        print(f"\n\nCold import of data.ai_api: {result['seconds']:.2f}s (budget {STARTUP_BUDGET_SECONDS:.2f}s)")
+        self.assertLess(result["seconds"], STARTUP_BUDGET_SECONDS)
+
+
+if __name__ == '__main__':
+    unittest_main()
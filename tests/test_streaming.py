@@ -0,0 +1,43 @@
+import asyncio
+import uuid
+from unittest import TestCase, main as unittest_main
+from unittest.mock import patch
+
+from langchain.chains import LLMChain
+from langchain.chat_models.fake import FakeListChatModel
+from langchain.prompts import PromptTemplate
+from langchain.schema import ChatGeneration, LLMResult
+from langchain.schema.messages import AIMessage
+
+from data.streaming import TokenCallbackHandler
+
+
+def result(text):
+    return LLMResult(generations=[[ChatGeneration(message=AIMessage(content=text))]])
+
+
+class Streaming_test(TestCase):
+
+    def test_tokens_are_forwarded_and_skipped_calls_ignored(self):
+        tokens = []
+        handler = TokenCallbackHandler(tokens.append, skip_calls=1)
+        draft, final = uuid.uuid4(), uuid.uuid4()
+        handler.on_chat_model_start({}, [[]], run_id=draft)
+        handler.on_llm_new_token("draft", run_id=draft)
+        handler.on_llm_end(result("draft"), run_id=draft)
+        handler.on_chat_model_start({}, [[]], run_id=final)
+        for token in ["The", " answer"]:
+            handler.on_llm_new_token(token, run_id=final)
+        handler.on_llm_end(result("The answer"), run_id=final)
+        self.assertEqual(tokens, ["The", " answer"])
+
+    def test_call_without_tokens_sends_whole_text(self):
+        tokens = []
+        chain = LLMChain(llm=FakeListChatModel(responses=["Cached answer"]), prompt=PromptTemplate.from_template("{question}"))
+        with patch("langchain.llm_cache", None):
+            asyncio.run(chain.acall({"question": "Why?"}, callbacks=[TokenCallbackHandler(tokens.append)]))
+        self.assertEqual(tokens, ["Cached answer"])
+
+
+if __name__ == "__main__":
+    unittest_main()
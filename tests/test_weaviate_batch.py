@@ -0,0 +1,118 @@
+import os
+import tempfile
+import threading
+import uuid
+from unittest import TestCase, main as unittest_main
+from unittest.mock import MagicMock, patch
+
+from langchain.docstore.document import Document
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from data.manifest import DocumentManifest, sync_document
+from data.weaviate_batch import AdaptiveBatchSize, weaviate_batch_write
+from data.weaviate_db import WRITE_BATCH_SIZE, _add_objects
+
+
+class FakeConnection:
+    """
+     FakeConnection answers /batch/objects posts, rejecting objects listed in reject the given number of times.
+    """
+
+    def __init__(self, reject: dict = None, fail_requests: int = 0):
+        self.reject = dict(reject or {})
+        self.fail_requests = fail_requests
+        self.batches = []
+        self.stored = {}
+        self._lock = threading.Lock()
+
+    def post(self, path, weaviate_object, params=None):
+        with self._lock:
+            objects = weaviate_object["objects"]
+            self.batches.append(len(objects))
+            if self.fail_requests:
+                self.fail_requests -= 1
+                raise RequestsConnectionError("connection reset")
+            results = []
+            for obj in objects:
+                if self.reject.get(obj["id"], 0):
+                    self.reject[obj["id"]] -= 1
+                    results.append({"id": obj["id"], "result": {"errors": {"error": [{"message": "shard busy"}]}}})
+                else:
+                    self.stored[obj["id"]] = obj
+                    results.append({"id": obj["id"], "result": {}})
+        response = MagicMock(status_code=200)
+        response.json.return_value = results
+        return response
+
+
+class WeaviateBatch_test(TestCase):
+
+    def setUp(self):
+        patcher = patch("data.weaviate_batch.RETRY_BACKOFF", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.ids = [str(uuid.uuid4()) for _ in range(50)]
+        self.objects = [(id_, {"text": f"chunk {n}"}, [float(n), 0.0]) for n, id_ in enumerate(self.ids)]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.manifest = DocumentManifest(os.path.join(directory.name, "manifest.sqlite3"))
+        self.file_path = os.path.join(directory.name, "a.txt")
+        with open(self.file_path, "w") as f:
+            f.write("chunks")
+
+    def write(self, connection, retries=3):
+        client = MagicMock(_connection=connection)
+        sizer = AdaptiveBatchSize(initial=8, minimum=2, maximum=64, target_seconds=1.0)
+        return weaviate_batch_write("Docs", self.objects, client=client, workers=3, retries=retries, sizer=sizer)
+
+    def test_writes_every_object_with_its_vector(self):
+        connection = FakeConnection()
+        result = self.write(connection)
+        self.assertEqual((result["successful"], result["failed"]), (50, 0))
+        self.assertEqual(connection.stored[self.ids[7]]["vector"], [7.0, 0.0])
+        self.assertGreater(result["objects_per_sec"], 0)
+
+    def test_rejected_objects_are_retried_alone(self):
+        connection = FakeConnection(reject={self.ids[0]: 2, self.ids[1]: 1})
+        result = self.write(connection)
+        self.assertEqual((result["successful"], result["failed"], result["retried"]), (50, 0, 3))
+
+    def test_objects_failing_every_retry_are_reported(self):
+        connection = FakeConnection(reject={self.ids[3]: 10}, fail_requests=1)
+        result = self.write(connection, retries=2)
+        self.assertEqual((result["successful"], result["failed"]), (49, 1))
+        self.assertEqual(result["errors"], [{"id": self.ids[3], "message": "shard busy"}])
+
+    def test_batch_size_follows_throughput(self):
+        sizer = AdaptiveBatchSize(initial=10, minimum=2, maximum=1000, target_seconds=1.0)
+        sizer.observe(10, 0.1)
+        self.assertEqual(sizer.get(), 20)  # At most doubles
+        for _ in range(20):
+            sizer.observe(sizer.get(), sizer.get() / 300)
+        self.assertAlmostEqual(sizer.get(), 300, delta=30)
+        sizer.backoff()
+        self.assertAlmostEqual(sizer.get(), 150, delta=15)
+
+    def test_a_file_is_written_in_one_call(self):
+        connection = FakeConnection()
+        client = MagicMock(_connection=connection)
+        embeddings = MagicMock()
+        embeddings.embed_documents.side_effect = lambda texts: [[float(len(text)), 0.0] for text in texts]
+        docs = [Document(page_content=f"chunk {n}", metadata={"source": "a.txt", "text": "title"}) for n in range(600)]
+        with patch("data.weaviate_db.get_embedding_function", return_value=embeddings), \
+                patch("data.weaviate_batch.get_weaviate_client", return_value=client), \
+                patch("data.weaviate_db.get_bm25_index"), \
+                patch("data.weaviate_db.weaviate_batch_write", wraps=weaviate_batch_write) as write:
+            sync_document(self.manifest, "Weaviate", "Docs", "a.txt", self.file_path, load_chunks=lambda: docs,
+                          add_chunks=lambda chunks, chunk_ids: _add_objects("Docs", "text", chunks, chunk_ids),
+                          delete_ids=lambda ids: None, batch_size=WRITE_BATCH_SIZE)
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(len(connection.stored), 600)
+        # A metadata key named like the text property does not replace the chunk text
+        self.assertEqual(sorted(obj["properties"]["text"] for obj in connection.stored.values())[:2], ["chunk 0", "chunk 1"])
+        # Embedded in slices, so writing starts before the last chunk is embedded
+        self.assertGreater(embeddings.embed_documents.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest_main()